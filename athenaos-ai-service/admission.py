@@ -0,0 +1,176 @@
+# admission.py
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from telemetry import admission_active, admission_queue_depth, admission_wait_seconds, admission_shed, admission_over_limit
+
+logger = logging.getLogger(__name__)
+
+CRISIS, ROUTINE = "crisis", "routine"
+# Bounds for the Retry-After estimate, seconds
+MIN_RETRY_AFTER, MAX_RETRY_AFTER = 1, 30
+
+
+class Overloaded(Exception):
+    """A chat turned away by admission control; `retry_after` is in whole seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admission refused ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A slot granted by an AdmissionController; pass it back to `leave`."""
+    __slots__ = ("tenant", "started")
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.started = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Bounds how many chats run their upstream stages at once.
+
+    A routine chat takes one of `limit` slots, or waits in a queue of at most
+    `queue_size` chats; a freed slot goes straight to the longest waiter. It
+    is shed with Overloaded when the queue is full, when it has waited
+    `queue_timeout` seconds, or when its tenant already has `tenant_limit`
+    chats admitted or queued. Crisis chats are admitted at once and never
+    shed: they take a free slot, or run over the limit while all are busy,
+    and routine chats wait until the excess has been given back.
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float, tenant_limit: int = 0, enabled: bool = True):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.tenant_limit = tenant_limit
+        self.enabled = enabled
+        self.active = 0
+        self._waiters = deque()
+        self._tenants = {}
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = None
+        self.admitted = 0
+        self.shed = 0
+        self.over_limit = 0
+
+    async def enter(self, crisis: bool = False, tenant: str = None):
+        """
+        Waits for a slot and returns the ticket to pass to `leave`, or None
+        when admission control is disabled. Raises Overloaded if the chat is shed.
+        """
+        if not self.enabled:
+            return None
+        if crisis:
+            if self.active >= self.limit:
+                self.over_limit += 1
+                admission_over_limit.inc()
+            self._admit(CRISIS, 0.0)
+            return AdmissionTicket(None)
+
+        tenant = tenant if self.tenant_limit else None
+        if tenant:
+            if self._tenants.get(tenant, 0) >= self.tenant_limit:
+                self._refuse("tenant")
+            self._tenants[tenant] = self._tenants.get(tenant, 0) + 1
+        try:
+            await self._acquire()
+        except BaseException:
+            self._forget_tenant(tenant)
+            raise
+        return AdmissionTicket(tenant)
+
+    def leave(self, ticket):
+        """Gives back the slot held by `ticket` (None is ignored)."""
+        if ticket is None:
+            return
+        held = time.monotonic() - ticket.started
+        self._hold_seconds = held if self._hold_seconds is None else 0.9 * self._hold_seconds + 0.1 * held
+        self._forget_tenant(ticket.tenant)
+        self._release()
+
+    def _forget_tenant(self, tenant):
+        if tenant:
+            remaining = self._tenants[tenant] - 1
+            if remaining:
+                self._tenants[tenant] = remaining
+            else:
+                del self._tenants[tenant]
+
+    async def _acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self._admit(ROUTINE, 0.0)
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._refuse("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        admission_queue_depth.inc()
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except BaseException as e:
+            if future.done():
+                # Handed a slot just as the wait ended
+                if not isinstance(e, asyncio.TimeoutError):
+                    self._release()
+                    raise
+            else:
+                future.cancel()
+                self._waiters.remove(future)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._refuse("queue_timeout")
+                raise
+        finally:
+            admission_queue_depth.dec()
+        # The slot was handed over by _release, still counted as active
+        self.admitted += 1
+        admission_wait_seconds.labels(ROUTINE).observe(time.monotonic() - queued_at)
+
+    def _admit(self, priority: str, waited: float):
+        self.active += 1
+        admission_active.inc()
+        self.admitted += 1
+        admission_wait_seconds.labels(priority).observe(waited)
+
+    def _release(self):
+        # Over the limit (crisis chats), the slot is retired instead of handed on
+        if self.active <= self.limit:
+            while self._waiters:
+                future = self._waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.active -= 1
+        admission_active.dec()
+
+    def _refuse(self, reason: str):
+        self.shed += 1
+        admission_shed.labels(reason).inc()
+        raise Overloaded(reason, self.retry_after())
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new chat has likely drained."""
+        if self._hold_seconds is None:
+            return MIN_RETRY_AFTER
+        estimate = math.ceil(self._hold_seconds * (len(self._waiters) + 1) / max(self.limit, 1))
+        return min(max(estimate, MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "tenants": len(self._tenants),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "over_limit": self.over_limit,
+            "hold_seconds": round(self._hold_seconds, 4) if self._hold_seconds is not None else None,
+        }
@@ -0,0 +1,70 @@
+# bench/bench_batch.py
+"""
+Throughput of /analyze/batch versus one analysis call per message.
+
+The baseline scores messages one at a time with combined_sentiment_analysis,
+like a backfill script calling the service per message. The batch run posts
+all messages to /analyze/batch and reads the NDJSON stream. Both report
+messages per minute; every text must come back exactly once.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_batch --messages 2000 --baseline-messages 100
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+    from processing import combined_sentiment_analysis
+
+    texts = [f"Backfill message {index}: I always feel like I ruin everything" for index in range(args.messages)]
+
+    async with service.lifespan(service.app):
+        started = time.perf_counter()
+        for text in texts[:args.baseline_messages]:
+            await combined_sentiment_analysis(f"baseline {text}")
+        baseline = args.baseline_messages / (time.perf_counter() - started) * 60
+
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=600) as http:
+            started = time.perf_counter()
+            response = await http.post("/analyze/batch", json={
+                "texts": texts, "batch_size": args.batch_size, "concurrency": args.concurrency,
+            })
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            batched = len(lines) / (time.perf_counter() - started) * 60
+
+    print(f"per message : {baseline:>10,.0f} messages/min")
+    print(f"batch       : {batched:>10,.0f} messages/min "
+          f"(batch_size={args.batch_size}, concurrency={args.concurrency}, {batched / baseline:.0f}x)")
+    if sorted(line["index"] for line in lines) != list(range(len(texts))):
+        print("FAIL: batch results do not cover every input exactly once")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--baseline-messages", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--hf-latency", type=float, default=0.3)
+    parser.add_argument("--hf-port", type=int, default=8701)
+    parser.add_argument("--groq-port", type=int, default=8702)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(args.hf_latency), args.hf_port) as hf, \
+            StubServer(create_groq_stub(), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
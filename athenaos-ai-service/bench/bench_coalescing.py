@@ -0,0 +1,97 @@
+# bench/bench_coalescing.py
+"""
+Checks request coalescing and per-session serialization against the stubs.
+
+  double-post  each session posts the same message twice at once; both
+               callers must get the identical response (same timestamp) and
+               the session must hold exactly one turn
+  retry        the same message resent after the answer, inside the dedup
+               window (a client that timed out and resubmits)
+  same text    many sessions send one identical text at once; the classifier
+               calls are shared, so upstream requests stay near one per model
+  serialized   several different messages for one session at once; every
+               turn must land in the history, none lost or interleaved
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_coalescing --sessions 50
+"""
+import argparse
+import asyncio
+import sys
+
+from bench.bench_concurrency import configure_environment
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+    from models import get_http_client
+
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=120) as http:
+            async def chat(session_id, text):
+                response = await http.post("/chat", json={"user_input": text, "session_id": session_id})
+                response.raise_for_status()
+                return response.json()
+
+            async def stored(session_id):
+                session = await service.session_store.load_or_create(session_id)
+                return session.history()
+
+            # double-post
+            pairs = await asyncio.gather(*(
+                asyncio.gather(chat(f"double-{i}", f"I feel stuck, {i}"), chat(f"double-{i}", f"I feel stuck, {i}"))
+                for i in range(args.sessions)
+            ))
+            check(all(first == second for first, second in pairs), f"double-post: {args.sessions} pairs got one shared response")
+            lengths = [len(await stored(f"double-{i}")) for i in range(args.sessions)]
+            check(all(length == 2 for length in lengths), "double-post: one turn stored per session")
+
+            # retry inside the window
+            first = await chat("retry", "Nothing I do is ever enough")
+            second = await chat("retry", "Nothing I do is ever enough")
+            check(first == second and len(await stored("retry")) == 2, "retry: resubmission answered from the first run")
+
+            # identical text across sessions
+            before = get_http_client().requests
+            await asyncio.gather(*(chat(f"same-{i}", "Everything is falling apart today") for i in range(args.sessions)))
+            upstream = get_http_client().requests - before
+            check(upstream <= 3, f"same text: {args.sessions} chats made {upstream} classifier requests")
+
+            # different messages for one session
+            texts = [f"Message number {i} about my week" for i in range(args.turns)]
+            await asyncio.gather(*(chat("serial", text) for text in texts))
+            history = await stored("serial")
+            users = [entry["content"] for entry in history if entry["role"] == "user"]
+            roles = [entry["role"] for entry in history]
+            check(sorted(users) == sorted(texts) and roles == ["user", "assistant"] * args.turns,
+                  f"serialized: {args.turns} concurrent turns stored whole and in order")
+
+        print(f"stats: {(await service.read_stats())['coalescing']}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--hf-port", type=int, default=8711)
+    parser.add_argument("--groq-port", type=int, default=8712)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(create_groq_stub(), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
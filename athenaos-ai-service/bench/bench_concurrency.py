@@ -0,0 +1,78 @@
+# bench/bench_concurrency.py
+"""
+Concurrency benchmark for /chat against local HF and Groq stubs.
+
+Drives N concurrent multi-turn sessions through the AI service in-process and
+reports throughput. With a non-blocking I/O path, throughput should grow
+roughly linearly with the number of concurrent sessions until the stubs or
+the CPU saturate.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_concurrency --sessions 1 8 32 128 --turns 3
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+def configure_environment(hf_url: str, groq_url: str):
+    """Points the service at the stubs. Must run before importing `main`."""
+    os.environ["HUGGINGFACE_API_KEY"] = "stub-key"
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["HF_API_BASE_URL"] = f"{hf_url}/models/"
+    os.environ["GROQ_BASE_URL"] = groq_url
+
+
+async def run_session(http, session_id: str, turns: int):
+    for turn in range(turns):
+        response = await http.post("/chat", json={
+            "user_input": f"I always feel like everything is ruined, {session_id} turn {turn}",
+            "session_id": session_id,
+        })
+        response.raise_for_status()
+
+
+async def run_level(app, sessions: int, turns: int) -> float:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=120) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(http, f"bench-{sessions}-{i}", turns) for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+    return sessions * turns / elapsed
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.INFO)
+
+    import main as service
+
+    async with service.lifespan(service.app):
+        print(f"{'sessions':>8} {'chats/s':>10} {'speedup':>8}")
+        baseline = None
+        for sessions in args.sessions:
+            throughput = await run_level(service.app, sessions, args.turns)
+            baseline = baseline or throughput
+            print(f"{sessions:>8} {throughput:>10.1f} {throughput / baseline:>7.1f}x")
+        print(f"pool: {service.pool_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--hf-latency", type=float, default=0.05)
+    parser.add_argument("--groq-latency", type=float, default=0.2)
+    parser.add_argument("--hf-port", type=int, default=8701)
+    parser.add_argument("--groq-port", type=int, default=8702)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(args.hf_latency), args.hf_port) as hf, \
+            StubServer(create_groq_stub(args.groq_latency), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
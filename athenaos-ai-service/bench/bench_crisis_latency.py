@@ -0,0 +1,74 @@
+# bench/bench_crisis_latency.py
+"""
+Crisis fast-path latency against a deliberately slow Inference API stub.
+
+The HF stub answers after --hf-latency seconds (a degraded upstream). Crisis
+messages must still get their reply in milliseconds, or within
+CRISIS_ANALYSIS_WAIT_SECONDS when that is set, while routine messages wait
+for the analysis deadline. The run fails if the crisis p99 exceeds
+--max-crisis-ms.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_crisis_latency --hf-latency 8 --requests 20
+    CRISIS_ANALYSIS_WAIT_SECONDS=0.5 python -m bench.bench_crisis_latency --max-crisis-ms 700
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.common import percentile
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+CRISIS_MESSAGE = "I can't go on like this anymore"
+ROUTINE_MESSAGE = "Work has been stressful this week"
+
+
+async def timed_post(http, text, session_id):
+    started = time.perf_counter()
+    response = await http.post("/chat", json={"user_input": f"{text} {session_id}", "session_id": session_id})
+    response.raise_for_status()
+    return time.perf_counter() - started, response.json()
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=120) as http:
+            crisis = await asyncio.gather(*(timed_post(http, CRISIS_MESSAGE, f"c{i}") for i in range(args.requests)))
+            routine = await asyncio.gather(*(timed_post(http, ROUTINE_MESSAGE, f"r{i}") for i in range(args.requests)))
+        # Let the background analyses finish before shutdown
+        await asyncio.gather(*list(service.background_tasks))
+
+    crisis_ms = [elapsed * 1000 for elapsed, _ in crisis]
+    routine_ms = [elapsed * 1000 for elapsed, _ in routine]
+    assert all(body["analysis"]["urgency_level"] == "crisis" for _, body in crisis)
+    print(f"upstream latency {args.hf_latency:.1f}s")
+    print(f"crisis   p50 {statistics.median(crisis_ms):8.1f} ms  p99 {percentile(crisis_ms, 0.99):8.1f} ms")
+    print(f"routine  p50 {statistics.median(routine_ms):8.1f} ms  p99 {percentile(routine_ms, 0.99):8.1f} ms")
+    if percentile(crisis_ms, 0.99) > args.max_crisis_ms:
+        print(f"FAIL: crisis p99 above {args.max_crisis_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--hf-latency", type=float, default=8.0)
+    parser.add_argument("--max-crisis-ms", type=float, default=200.0)
+    parser.add_argument("--hf-port", type=int, default=8701)
+    parser.add_argument("--groq-port", type=int, default=8702)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(args.hf_latency), args.hf_port) as hf, \
+            StubServer(create_groq_stub(0.2), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
@@ -0,0 +1,81 @@
+# bench/bench_emotion_timeline.py
+"""
+Cost of serving a conversation's emotion history from the session's
+EmotionTimeline vs rebuilding it from every stored message.
+
+The scan column is what the Node backend's fallback does per dashboard view
+once the rows are loaded: decode each user message's JSON emotionData, keep
+the non-empty ones and build one point per message (database I/O not
+included). The timeline columns are the per-turn cost of keeping the
+aggregates up to date, the cost of one read (summary plus a series of at
+most --points points) and the timeline's share of the encoded session.
+Turns are spaced --spacing seconds apart, so longer conversations also
+exercise the bucket merging.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_emotion_timeline --turns 30 300 3000
+"""
+import argparse
+import json
+import random
+import time
+
+LABELS = ("sadness", "joy", "love", "anger", "fear", "surprise")
+
+
+def make_emotions(rng):
+    scores = [rng.random() ** 3 for _ in LABELS]
+    total = sum(scores)
+    emotions = [{"label": label, "score": score / total} for label, score in zip(LABELS, scores)]
+    return sorted((emotion for emotion in emotions if emotion["score"] > 0.1), key=lambda e: e["score"], reverse=True)
+
+
+def time_per_call(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations
+
+
+def main(args):
+    from emotions import EmotionTimeline
+
+    rng = random.Random(3)
+    print(f"{'turns':>7} {'scan us':>9} {'record us':>10} {'read us':>9} {'points':>7} {'bucket s':>9} {'encoded B':>10}")
+    for turns in args.turns:
+        turn_emotions = [make_emotions(rng) for _ in range(turns)]
+        rows = [(1_700_000_000 + index * args.spacing, json.dumps(emotions))
+                for index, emotions in enumerate(turn_emotions)]
+
+        def scan():
+            history = []
+            for created_at, encoded in rows:
+                emotions = json.loads(encoded)
+                if emotions:
+                    history.append({"timestamp": created_at, "emotions": emotions})
+            return history
+
+        timeline = EmotionTimeline()
+        started = time.perf_counter()
+        for (created_at, _), emotions in zip(rows, turn_emotions):
+            timeline.record(emotions, at=created_at)
+        record_seconds = (time.perf_counter() - started) / turns
+
+        def read():
+            return timeline.summary(), timeline.series(args.points)
+
+        iterations = max(args.iterations // max(turns // 100, 1), 10)
+        scan_seconds = time_per_call(scan, iterations)
+        read_seconds = time_per_call(read, args.iterations)
+        encoded = len(json.dumps(timeline.to_list(), separators=(',', ':')))
+        print(f"{turns:>7} {scan_seconds * 1e6:>9.1f} {record_seconds * 1e6:>10.1f} {read_seconds * 1e6:>9.1f} "
+              f"{len(read()[1]):>7} {timeline.width:>9.0f} {encoded:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[30, 300, 3000])
+    parser.add_argument("--spacing", type=float, default=90.0, help="seconds between turns")
+    parser.add_argument("--points", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,142 @@
+# bench/bench_history_protocol.py
+"""
+Request cost of sending the full history vs only the messages since the
+history cursor.
+
+Part one times, per history length, what the service does with a /chat body
+before any analysis: JSON decoding, ChatRequest validation, and applying the
+history to a session that already holds it (merge_history for the full body,
+the cursor check and extend for the delta body). It also reports body sizes.
+
+Part two drives conversations through the app and the stubs the way the Node
+backend does: full history on the first turn, then the cursor. Halfway
+through, the session store is emptied to stand in for a restart, so every
+conversation gets a 409 and resyncs. The stored histories must match what
+full-history requests produce.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_history_protocol --lengths 10 30 100 300
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+USER_TEXT = "I keep replaying the argument with my sister and I can't stop thinking I ruined everything."
+REPLY_TEXT = ("That sounds really painful, and it makes sense that it keeps coming back to you. "
+              "When you notice the thought that you ruined everything, what evidence do you have for "
+              "and against it? What would you say to a friend who told you the same thing?")
+
+
+def make_history(length):
+    return [{"role": "user" if index % 2 == 0 else "assistant",
+             "content": f"{USER_TEXT} ({index})" if index % 2 == 0 else REPLY_TEXT}
+            for index in range(length)]
+
+
+def time_per_call(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations
+
+
+def measure_parsing(lengths, iterations):
+    from main import ChatRequest
+    from sessions import SessionState
+
+    print(f"{'history':>8} {'full B':>8} {'delta B':>8} {'full us':>9} {'delta us':>9} {'saved':>7}")
+    for length in lengths:
+        history = make_history(length)
+        session = SessionState()
+        session.merge_history((item["role"], item["content"]) for item in history)
+        cursor = session.cursor()
+        full_body = json.dumps({"user_input": "And today it happened again.", "session_id": "s", "history": history})
+        delta_body = json.dumps({"user_input": "And today it happened again.", "session_id": "s",
+                                 "history": [], "history_cursor": cursor})
+
+        def full():
+            request = ChatRequest.model_validate(json.loads(full_body))
+            session.merge_history((item.role, item.content) for item in request.history)
+
+        def delta():
+            request = ChatRequest.model_validate(json.loads(delta_body))
+            assert session.cursor() == request.history_cursor
+            session.extend((item.role, item.content) for item in request.history)
+
+        full_seconds = time_per_call(full, iterations)
+        delta_seconds = time_per_call(delta, iterations)
+        print(f"{length:>8} {len(full_body):>8} {len(delta_body):>8} {full_seconds * 1e6:>9.1f} "
+              f"{delta_seconds * 1e6:>9.1f} {1 - delta_seconds / full_seconds:>7.1%}")
+
+
+async def check_protocol(conversations, turns):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=60) as http:
+            async def converse(index, use_cursor, restart):
+                session_id = f"{'delta' if use_cursor else 'full'}-{index}"
+                stored, cursor, statuses = [], None, []
+                for turn in range(turns):
+                    if turn == turns // 2:
+                        await restart.wait()
+                    text = f"Conversation {index} turn {turn}: I keep worrying about everything"
+                    body = {"user_input": text, "session_id": session_id, "history": stored[-30:]}
+                    if use_cursor and cursor:
+                        body = {"user_input": text, "session_id": session_id, "history": [], "history_cursor": cursor}
+                    response = await http.post("/chat", json=body)
+                    if response.status_code == 409:
+                        statuses.append(409)
+                        body = {"user_input": text, "session_id": session_id, "history": stored[-30:]}
+                        response = await http.post("/chat", json=body)
+                    response.raise_for_status()
+                    data = response.json()
+                    cursor = data["history_cursor"]
+                    stored += [{"role": "user", "content": text}, {"role": "assistant", "content": data["response"]}]
+                return statuses
+
+            restart = asyncio.Event()
+            tasks = [asyncio.create_task(converse(index, use_cursor, restart))
+                     for index in range(conversations) for use_cursor in (False, True)]
+            # Every conversation is at the halfway turn once the store holds that many messages
+            while not all(len(state.messages) >= 2 * (turns // 2) for state in service.session_store._sessions.values()) \
+                    or len(service.session_store) < 2 * conversations:
+                await asyncio.sleep(0.01)
+            service.session_store._sessions.clear()
+            restart.set()
+            statuses = await asyncio.gather(*tasks)
+
+        mismatches = 0
+        for index in range(conversations):
+            full_state = await service.session_store.load(f"full-{index}")
+            delta_state = await service.session_store.load(f"delta-{index}")
+            mismatches += full_state.history() != delta_state.history()
+
+    resyncs = sum(len(status) for status in statuses)
+    print(f"protocol: {conversations} conversations x {turns} turns per mode, restart at turn {turns // 2}: "
+          f"{resyncs} resyncs, {mismatches} history mismatches")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 30, 100, 300])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--hf-port", type=int, default=8751)
+    parser.add_argument("--groq-port", type=int, default=8752)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(create_groq_stub(), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        measure_parsing(args.lengths, args.iterations)
+        asyncio.run(check_protocol(args.conversations, args.turns))
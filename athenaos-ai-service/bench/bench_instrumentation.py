@@ -0,0 +1,72 @@
+# bench/bench_instrumentation.py
+"""
+Cost of the stage instrumentation, and what it reports.
+
+Times a bare span (histogram observe plus the Server-Timing bookkeeping) in a
+tight loop, sends one /chat through the stubs to show its Server-Timing
+header and span count, and prints the resulting /metrics series. The
+per-chat overhead is span count x span cost.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_instrumentation
+"""
+import argparse
+import asyncio
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+def time_span(iterations: int) -> float:
+    from telemetry import span, track_request
+
+    with track_request("bench"):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with span("bench"):
+                pass
+        return (time.perf_counter() - started) / iterations
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+
+    per_span = time_span(args.iterations)
+    print(f"span cost: {per_span * 1e6:.2f} us")
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=60) as http:
+            response = await http.post("/chat", json={
+                "user_input": "I always ruin everything and I feel so anxious", "session_id": "timing",
+            })
+            response.raise_for_status()
+            server_timing = response.headers["server-timing"]
+            metrics = (await http.get("/metrics")).text
+
+    entries = dict(entry.split(";dur=") for entry in server_timing.split(", "))
+    print(f"Server-Timing: {server_timing}")
+    spans = len(entries) - 1  # minus total
+    total_ms = float(entries["total"])
+    print(f"overhead: {spans} spans x {per_span * 1e6:.2f} us = {spans * per_span * 1e6:.1f} us "
+          f"of a {total_ms:.1f} ms chat ({spans * per_span * 1e3 / total_ms:.4%})")
+    for line in metrics.splitlines():
+        if line.startswith(("athena_stage_seconds_count", "athena_request_seconds_count", "athena_upstream")):
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--hf-port", type=int, default=8731)
+    parser.add_argument("--groq-port", type=int, default=8732)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(create_groq_stub(), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
@@ -0,0 +1,151 @@
+# bench/bench_local_classifier.py
+"""
+Throughput of the local sentiment/emotion scorer, and how well it agrees
+with the Inference API models.
+
+Throughput times sentiment plus emotion for each message (one lexicon scan,
+shared by both). Messages come from --messages (one per line) or a built-in
+set of sample sentences.
+
+Agreement needs recorded Inference API outputs, which are not shipped:
+record them once from a message file with a real HUGGINGFACE_API_KEY, then
+compare. The report covers top sentiment label, top emotion label, and the
+"strong negative emotion" flag (sadness, anger or fear above 0.7) that
+switches the prompt to its validation-first instruction.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_local_classifier
+    python -m bench.bench_local_classifier --messages messages.txt --record recordings.jsonl
+    python -m bench.bench_local_classifier --agreement recordings.jsonl
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import SAMPLE_MESSAGES
+
+STRONG_NEGATIVE = ("sadness", "anger", "fear")
+
+
+def read_messages(path):
+    if not path:
+        return SAMPLE_MESSAGES
+    with open(path, encoding="utf-8") as source:
+        return [line.strip() for line in source if line.strip()]
+
+
+def measure_throughput(messages, rounds):
+    from local_classifier import classify_emotion, classify_sentiment, score_text
+
+    texts = [f"{message} ({index})" for index in range(rounds) for message in messages]
+    score_text.cache_clear()
+    started = time.perf_counter()
+    for text in texts:
+        classify_sentiment(text)
+        classify_emotion(text)
+    elapsed = time.perf_counter() - started
+    chars = sum(map(len, texts)) / len(texts)
+    print(f"local scorer: {len(texts)} messages (avg {chars:.0f} chars), "
+          f"{elapsed / len(texts) * 1e6:.1f} us per message, {len(texts) / elapsed:,.0f} messages/s")
+
+
+async def record(messages, path, batch_size):
+    import models
+    from config import EMOTION_API_URL, HUGGINGFACE_API_KEY, SENTIMENT_API_URL
+
+    if not HUGGINGFACE_API_KEY:
+        raise SystemExit("Recording calls the Inference API and needs HUGGINGFACE_API_KEY")
+    written = skipped = 0
+    with open(path, "w", encoding="utf-8") as out:
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            sentiment, emotion = await asyncio.gather(
+                models.query_huggingface_api_batch(SENTIMENT_API_URL, chunk),
+                models.query_huggingface_api_batch(EMOTION_API_URL, chunk),
+            )
+            for text, sentiment_output, emotion_output in zip(chunk, sentiment, emotion):
+                if sentiment_output is None or emotion_output is None:
+                    skipped += 1
+                    continue
+                out.write(json.dumps({"text": text, "sentiment": sentiment_output, "emotion": emotion_output}) + "\n")
+                written += 1
+    await models.close_http_client()
+    print(f"recorded {written} messages to {path} ({skipped} failed and were left out)")
+
+
+def top_label(output):
+    labels = output[0] if output else []
+    return max(labels, key=lambda item: item["score"])["label"].lower() if labels else None
+
+
+def strong_negative(output):
+    return any(item["label"].lower() in STRONG_NEGATIVE and item["score"] > 0.7 for item in (output[0] if output else []))
+
+
+def report_agreement(path):
+    from local_classifier import classify_emotion, classify_sentiment
+
+    with open(path, encoding="utf-8") as source:
+        records = [json.loads(line) for line in source if line.strip()]
+    if not records:
+        raise SystemExit(f"{path} has no records")
+
+    sentiment_labels = ("negative", "neutral", "positive")
+    confusion = {(recorded, local): 0 for recorded in sentiment_labels for local in sentiment_labels}
+    sentiment_agree = emotion_agree = emotion_total = no_local_emotion = 0
+    flags = {"both": 0, "recorded_only": 0, "local_only": 0}
+    for item in records:
+        recorded_sentiment = top_label(item["sentiment"])
+        local_sentiment = top_label(classify_sentiment(item["text"]))
+        sentiment_agree += recorded_sentiment == local_sentiment
+        if (recorded_sentiment, local_sentiment) in confusion:
+            confusion[(recorded_sentiment, local_sentiment)] += 1
+
+        recorded_emotion = top_label(item["emotion"])
+        local_output = classify_emotion(item["text"])
+        if recorded_emotion is not None:
+            emotion_total += 1
+            local_emotion = top_label(local_output)
+            emotion_agree += recorded_emotion == local_emotion
+            no_local_emotion += local_emotion is None
+
+        recorded_flag, local_flag = strong_negative(item["emotion"]), strong_negative(local_output)
+        if recorded_flag and local_flag:
+            flags["both"] += 1
+        elif recorded_flag:
+            flags["recorded_only"] += 1
+        elif local_flag:
+            flags["local_only"] += 1
+
+    total = len(records)
+    print(f"{total} recorded messages from {path}")
+    print(f"sentiment top label agrees: {sentiment_agree / total:.1%}")
+    print(f"{'recorded/local':>18} " + " ".join(f"{label:>9}" for label in sentiment_labels))
+    for recorded in sentiment_labels:
+        print(f"{recorded:>18} " + " ".join(f"{confusion[(recorded, local)]:>9}" for local in sentiment_labels))
+    if emotion_total:
+        print(f"emotion top label agrees: {emotion_agree / emotion_total:.1%} "
+              f"({no_local_emotion} messages had no emotion words locally)")
+    flagged_recorded = flags["both"] + flags["recorded_only"]
+    flagged_local = flags["both"] + flags["local_only"]
+    print(f"strong negative emotion: recorded {flagged_recorded}, local {flagged_local}, both {flags['both']}; "
+          f"recall {flags['both'] / flagged_recorded if flagged_recorded else 0:.1%}, "
+          f"precision {flags['both'] / flagged_local if flagged_local else 0:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", help="text file with one message per line")
+    parser.add_argument("--rounds", type=int, default=2000, help="copies of the message set to time")
+    parser.add_argument("--record", metavar="OUT", help="record Inference API outputs for --messages as JSONL")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--agreement", metavar="RECORDINGS", help="compare the local scorer with recorded outputs")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record(read_messages(args.messages), args.record, args.batch_size))
+    elif args.agreement:
+        report_agreement(args.agreement)
+    else:
+        measure_throughput(read_messages(args.messages), args.rounds)
@@ -0,0 +1,159 @@
+# bench/bench_matcher.py
+"""
+Equivalence check and micro-benchmark for the single-pass rule matcher.
+
+1. Equivalence: the per-pattern `re.search` loops the matcher replaced are
+   kept here as reference implementations, and every function built on the
+   matcher must agree with them on a generated corpus. Any mismatch fails
+   the run.
+2. Speed: times old vs new on the shipped rule set, then grows the rule set
+   with synthetic patterns to show how each approach scales.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_matcher --corpus 5000 --rules 0 100 400
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from config import ANTI_REPETITION_STARTERS, CBT_PATTERNS, CONCERN_PATTERNS, CRISIS_PATTERNS
+from matcher import RuleMatcher, build_rules
+from processing import analyze_conversation_patterns, detect_cbt_patterns, enhanced_crisis_detection
+
+
+# --- Reference implementations (the per-pattern loops the matcher replaced) ---
+def reference_crisis_detection(text):
+    if not text:
+        return None
+    text_lower = text.lower()
+    for pattern in CRISIS_PATTERNS:
+        if re.search(pattern, text_lower):
+            return "crisis"
+    for pattern in CONCERN_PATTERNS:
+        if re.search(pattern, text_lower):
+            return "concern"
+    return None
+
+
+def reference_cbt_patterns(text):
+    if not text:
+        return []
+    text_lower = text.lower()
+    return [name for name, regex in CBT_PATTERNS.items() if re.search(regex, text_lower)]
+
+
+def reference_conversation_patterns(history):
+    if not history:
+        return []
+    assistant_responses = [msg['content'] for msg in history if msg['role'] == 'assistant']
+    repetitive_phrases = []
+    for phrase in ANTI_REPETITION_STARTERS:
+        count = sum(1 for response in assistant_responses if phrase.lower() in response.lower())
+        if count > 1 and count > len(assistant_responses) * 0.3:
+            repetitive_phrases.append(phrase)
+    return repetitive_phrases
+
+
+def reference_scan(rules, text):
+    text_lower = text.lower()
+    matches = {}
+    for group, name, pattern in rules:
+        if re.search(pattern, text_lower):
+            matches.setdefault(group, []).append(name)
+    return matches
+
+
+# --- Corpus ---
+FRAGMENTS = [
+    "I want to die", "i'm going to kill myself", "I can't go on like this anymore", "I can't live anymore",
+    "I'm seriously thinking of suicide", "planning to end my life", "I have a plan to kill myself",
+    "I've been feeling really depressed", "I often think about self-harm", "no reason to live",
+    "don't want to be here anymore", "I feel so hopeless", "I feel numb", "everything is ruined",
+    "it's all my fault", "nobody ever listens", "I'm a total failure", "every time I try", "because of me",
+    "Of course I'm here to help", "I'm here for you", "I UNDERSTAND HOW DIFFICULT this is",
+    "That sounds really tough", "Thank you for sharing", "It's completely normal to feel",
+    "allowed", "nevertheless", "alwaysy", "thisfeeling", "my faulty logic", "hopelessness",
+]
+FILLER = ("today work was fine but my friend and I talked about sleep and the weather "
+          "and I went for a walk then came home to rest").split()
+
+
+def random_text(rng):
+    words = [rng.choice(FILLER) for _ in range(rng.randint(3, 80))]
+    for _ in range(rng.randint(0, 3)):
+        words.insert(rng.randint(0, len(words)), rng.choice(FRAGMENTS))
+    return " ".join(words)
+
+
+def synthetic_rules(count, rng):
+    vocab = ["lonely", "tired", "scared", "lost", "stuck", "broken", "angry", "ashamed", "guilty", "afraid",
+             "overwhelmed", "restless", "drained", "invisible", "unloved", "rejected", "judged", "ignored"]
+    rules = []
+    for index in range(count):
+        a, b = rng.sample(vocab, 2)
+        rules.append(("synthetic", f"s{index}", rf"\b(i feel|i am|i'm) (so |really )?({a}|{b}) (at|by|with) (work|home|school{index})\b"))
+    return rules
+
+
+def check_equivalence(corpus, rng):
+    mismatches = 0
+    for text in corpus:
+        if enhanced_crisis_detection(text) != reference_crisis_detection(text):
+            mismatches += 1
+            print(f"crisis mismatch: {text!r}")
+        if detect_cbt_patterns(text) != reference_cbt_patterns(text):
+            mismatches += 1
+            print(f"cbt mismatch: {text!r}")
+    for _ in range(len(corpus) // 10):
+        history = [{"role": rng.choice(["user", "assistant"]), "content": rng.choice(corpus)} for _ in range(rng.randint(0, 30))]
+        if analyze_conversation_patterns(history) != reference_conversation_patterns(history):
+            mismatches += 1
+            print(f"repetition mismatch: {history!r}")
+    return mismatches
+
+
+def time_per_text(function, corpus):
+    started = time.perf_counter()
+    for text in corpus:
+        function(text)
+    return (time.perf_counter() - started) / len(corpus) * 1e6
+
+
+def main(args):
+    import logging
+    logging.disable(logging.WARNING)
+    rng = random.Random(7)
+    corpus = [random_text(rng) for _ in range(args.corpus)]
+
+    mismatches = check_equivalence(corpus, rng)
+    print(f"equivalence: {args.corpus} texts, {mismatches} mismatches")
+
+    print(f"{'rules':>6} {'loop us/text':>13} {'matcher us/text':>16} {'speedup':>8}")
+    for extra in args.rules:
+        rules = build_rules() + synthetic_rules(extra, rng)
+        matcher = RuleMatcher(rules)
+        for text in corpus[:500]:
+            if matcher.scan(text) != reference_scan(rules, text):
+                mismatches += 1
+                print(f"scan mismatch with {len(rules)} rules: {text!r}")
+        compiled = [(group, name, re.compile(pattern)) for group, name, pattern in rules]
+
+        def loop_scan(text):
+            text_lower = text.lower()
+            return [regex.search(text_lower) for _, _, regex in compiled]
+
+        loop = time_per_text(loop_scan, corpus)
+        single = time_per_text(matcher.scan, corpus)
+        print(f"{len(rules):>6} {loop:>13.1f} {single:>16.1f} {loop / single:>7.1f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, default=5000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[0, 100, 400])
+    main(parser.parse_args())
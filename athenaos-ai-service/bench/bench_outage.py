@@ -0,0 +1,119 @@
+# bench/bench_outage.py
+"""
+/chat latency while the HF stub injects faults (see create_hf_stub).
+
+Concurrent clients keep chatting through three phases: healthy, a fault on
+every classifier endpoint, and recovery. Per phase it reports /chat latency
+percentiles, then the breaker counters from /stats. Chats that start in one
+phase and end in the next are reported on their own "a>b" row; those already
+waiting when the fault begins are bounded by ANALYSIS_DEADLINE_SECONDS. With
+breakers enabled, chats started during the outage should take no longer than
+HF_SLOW_CALL_SECONDS while the breakers trip, and add only milliseconds once
+they are open. Run with --no-breaker to see every chat wait for the deadline.
+
+Scenarios:
+  hang     endpoints accept requests and never answer in time
+  error    endpoints answer 500
+  loading  endpoints answer 503 "model is currently loading"
+  tail     5% of calls are 1 s slower (pair with --hedging)
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_outage --scenario hang
+    python -m bench.bench_outage --scenario hang --no-breaker
+    python -m bench.bench_outage --scenario tail --hedging
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.common import percentile
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+SCENARIOS = {
+    "hang": {"mode": "hang", "delay": 30.0},
+    "error": {"mode": "error"},
+    "loading": {"mode": "loading", "delay": 3.0},
+    "tail": {"mode": "tail", "delay": 1.0, "rate": 0.05},
+}
+
+
+async def main(args, hf_url):
+    import logging
+    logging.disable(logging.ERROR)
+
+    import httpx
+    import main as service
+
+    phases = [("healthy", {"mode": "ok"}, args.healthy), (args.scenario, SCENARIOS[args.scenario], args.fault),
+              ("recovery", {"mode": "ok"}, args.recovery)]
+    if args.scenario == "tail":
+        phases = phases[:2]
+    latencies = {}
+    current = {"phase": phases[0][0]}
+    stop = asyncio.Event()
+
+    async with service.lifespan(service.app), httpx.AsyncClient(base_url=hf_url) as control:
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=120) as http:
+            async def client(worker):
+                turn = 0
+                while not stop.is_set():
+                    phase = current["phase"]
+                    started = time.perf_counter()
+                    await http.post("/chat", json={
+                        "user_input": f"Client {worker} turn {turn}: I keep worrying about everything",
+                        "session_id": f"outage-{worker}",
+                    })
+                    if current["phase"] != phase:
+                        phase = f"{phase}>{current['phase']}"
+                    latencies.setdefault(phase, []).append(time.perf_counter() - started)
+                    turn += 1
+
+            workers = [asyncio.create_task(client(worker)) for worker in range(args.clients)]
+            for name, faults, duration in phases:
+                await control.post("/_faults", json={"models": "", **faults})
+                current["phase"] = name
+                await asyncio.sleep(duration)
+            stop.set()
+            await control.post("/_faults", json={"mode": "ok"})
+            await asyncio.gather(*workers)
+
+        stats = await service.read_stats()
+
+    print(f"breaker={'off' if args.no_breaker else 'on'} hedging={'on' if args.hedging else 'off'}")
+    print(f"{'phase':>16} {'chats':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, values in latencies.items():
+        if values:
+            print(f"{name:>16} {len(values):>6} {percentile(values, 0.5) * 1000:>8.0f} {percentile(values, 0.95) * 1000:>8.0f} "
+                  f"{percentile(values, 0.99) * 1000:>8.0f} {max(values) * 1000:>8.0f}")
+    for name, breaker in stats["breakers"].items():
+        print(f"{name[:40]:>40}: state={breaker['state']} trips={breaker['trips']} "
+              f"rejected={breaker['rejected']} slow={breaker['slow_calls']} p95={breaker['p95_seconds']}")
+    pool = stats["http_pool"]
+    print(f"hedges sent={pool['hedges']} won={pool['hedge_wins']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="hang")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--healthy", type=float, default=3.0, help="seconds")
+    parser.add_argument("--fault", type=float, default=8.0, help="seconds")
+    parser.add_argument("--recovery", type=float, default=5.0, help="seconds")
+    parser.add_argument("--no-breaker", action="store_true")
+    parser.add_argument("--hedging", action="store_true")
+    parser.add_argument("--hf-port", type=int, default=8721)
+    parser.add_argument("--groq-port", type=int, default=8722)
+    args = parser.parse_args()
+
+    os.environ["BREAKER_ENABLED"] = "false" if args.no_breaker else "true"
+    os.environ["HF_HEDGING_ENABLED"] = "true" if args.hedging else "false"
+    os.environ.setdefault("BREAKER_OPEN_SECONDS", "1")
+    os.environ.setdefault("HF_SLOW_CALL_SECONDS", "1")
+    os.environ.setdefault("CLASSIFIER_CACHE_ENABLED", "false")
+
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(create_groq_stub(), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args, hf.url))
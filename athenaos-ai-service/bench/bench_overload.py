@@ -0,0 +1,145 @@
+# bench/bench_overload.py
+"""
+/chat under more traffic than the generative upstream can serve.
+
+The Groq stub generates at most --groq-capacity replies at once, each
+taking --groq-latency seconds, so the service can finish about
+capacity / latency chats per second. Routine messages arrive at --rate per
+second (Poisson, open loop, each in a new session) and crisis messages at
+--crisis-rate, for --duration seconds. Clients give up after
+--client-timeout seconds, like the Node backend's axios timeout.
+
+It reports, per kind of message: completed chats with latency percentiles,
+chats shed by admission control (503/429, with how fast the rejection came
+and the Retry-After given), other errors and client timeouts, plus the
+peak admission queue depth. With admission control on, routine latency
+stays bounded by the queue timeout and the excess is rejected within
+milliseconds; crisis chats are admitted ahead of it. Run with
+--no-admission to see every routine chat queue at the upstream instead.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_overload
+    python -m bench.bench_overload --no-admission
+    python -m bench.bench_overload --rate 80 --limit 16 --groq-capacity 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.common import percentile
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+ROUTINE_MESSAGES = [
+    "Work has been overwhelming and my manager keeps adding deadlines",
+    "I keep replaying the argument with my sister",
+    "My sleep has been terrible lately",
+    "I tried the breathing exercise and it helped a little",
+]
+CRISIS_MESSAGES = [
+    "I can't go on like this anymore",
+    "I have a plan to kill myself",
+    "I'm going to end my life",
+]
+
+
+async def main(args):
+    import logging
+    logging.disable(logging.ERROR)
+
+    import httpx
+    import main as service
+
+    rng = random.Random(args.seed)
+    outcomes = {"routine": [], "crisis": []}
+    peak_queue = 0
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=args.client_timeout) as http:
+            async def chat(kind, number):
+                messages = CRISIS_MESSAGES if kind == "crisis" else ROUTINE_MESSAGES
+                started = time.perf_counter()
+                try:
+                    response = await http.post("/chat", json={
+                        "user_input": f"{rng.choice(messages)} ({number})",
+                        "session_id": f"overload-{kind}-{number}",
+                    })
+                    status, retry_after = response.status_code, response.headers.get("retry-after")
+                except httpx.TimeoutException:
+                    status, retry_after = "timeout", None
+                outcomes[kind].append((status, time.perf_counter() - started, retry_after))
+
+            async def arrivals(kind, rate):
+                tasks, number = [], 0
+                stop_at = time.monotonic() + args.duration
+                while rate > 0 and time.monotonic() < stop_at:
+                    tasks.append(asyncio.create_task(chat(kind, number)))
+                    number += 1
+                    await asyncio.sleep(rng.expovariate(rate))
+                await asyncio.gather(*tasks)
+
+            async def watch_queue():
+                nonlocal peak_queue
+                while True:
+                    peak_queue = max(peak_queue, service.admission.stats()["queued"])
+                    await asyncio.sleep(0.05)
+
+            watcher = asyncio.create_task(watch_queue())
+            started = time.perf_counter()
+            await asyncio.gather(arrivals("routine", args.rate), arrivals("crisis", args.crisis_rate))
+            elapsed = time.perf_counter() - started
+            watcher.cancel()
+
+        stats = await service.read_stats()
+
+    print(f"admission={'off' if args.no_admission else 'on'} limit={args.limit} queue={args.queue} "
+          f"queue_timeout={args.queue_timeout}s; upstream {args.groq_capacity} x {args.groq_latency}s "
+          f"(~{args.groq_capacity / args.groq_latency:.0f} chats/s); offered {args.rate}/s routine + "
+          f"{args.crisis_rate}/s crisis; {elapsed:.1f}s until the last answer")
+    print(f"{'kind':>8} {'outcome':>8} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  retry-after")
+    for kind, results in outcomes.items():
+        by_outcome = {}
+        for status, latency, retry_after in results:
+            outcome = "ok" if status == 200 else "shed" if status in (429, 503) and retry_after else str(status)
+            by_outcome.setdefault(outcome, []).append((latency, retry_after))
+        for outcome, values in sorted(by_outcome.items()):
+            latencies = [latency for latency, _ in values]
+            hints = sorted({int(hint) for _, hint in values if hint})
+            print(f"{kind:>8} {outcome:>8} {len(values):>6} {percentile(latencies, 0.5) * 1000:>8.0f} "
+                  f"{percentile(latencies, 0.95) * 1000:>8.0f} {percentile(latencies, 0.99) * 1000:>8.0f} "
+                  f"{max(latencies) * 1000:>8.0f}  {', '.join(map(str, hints)) + ' s' if hints else ''}")
+    admission = stats["admission"]
+    print(f"admission: admitted={admission['admitted']} shed={admission['shed']} "
+          f"crisis_over_limit={admission['over_limit']} peak_queue={peak_queue} hold_seconds={admission['hold_seconds']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=40.0, help="routine chats per second")
+    parser.add_argument("--crisis-rate", type=float, default=2.0, help="crisis chats per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of arrivals")
+    parser.add_argument("--limit", type=int, default=8, help="ADMISSION_MAX_CONCURRENT")
+    parser.add_argument("--queue", type=int, default=16, help="ADMISSION_QUEUE_SIZE")
+    parser.add_argument("--queue-timeout", type=float, default=1.0, help="ADMISSION_QUEUE_TIMEOUT_SECONDS")
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--groq-capacity", type=int, default=8, help="replies the Groq stub generates at once")
+    parser.add_argument("--groq-latency", type=float, default=0.5)
+    parser.add_argument("--client-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--hf-port", type=int, default=8741)
+    parser.add_argument("--groq-port", type=int, default=8742)
+    args = parser.parse_args()
+
+    os.environ["ADMISSION_ENABLED"] = "false" if args.no_admission else "true"
+    os.environ["ADMISSION_MAX_CONCURRENT"] = str(args.limit)
+    os.environ["ADMISSION_QUEUE_SIZE"] = str(args.queue)
+    os.environ["ADMISSION_QUEUE_TIMEOUT_SECONDS"] = str(args.queue_timeout)
+    os.environ.setdefault("CLASSIFIER_CACHE_ENABLED", "false")
+
+    groq_stub = create_groq_stub(args.groq_latency, max_concurrent=args.groq_capacity)
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(groq_stub, args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        asyncio.run(main(args))
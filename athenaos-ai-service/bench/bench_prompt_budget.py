@@ -0,0 +1,104 @@
+# bench/bench_prompt_budget.py
+"""
+Prompt size and /chat latency: fixed 6-message window vs token budget.
+
+Long sessions with message lengths between a few words and the 1000
+character sanitize limit are replayed against the stubs, once with
+PROMPT_TOKEN_BUDGET=0 (the old fixed window) and once per budget given. The
+Groq stub charges prefill time per prompt token, so prompt size shows up in
+latency. Reports prompt tokens (as counted by the stub) and latency
+percentiles, plus how many summary refreshes ran and how many sessions ended
+with a summary.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_prompt_budget --budgets 0 1024 800 --sessions 20 --turns 15
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.common import SAMPLE_MESSAGES, percentile
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+def make_message(rng: random.Random) -> str:
+    target = rng.choice([60, 150, 300, 600, 1000])
+    parts = []
+    while sum(len(part) + 1 for part in parts) < target:
+        parts.append(rng.choice(SAMPLE_MESSAGES))
+    return " ".join(parts)[:1000]
+
+
+async def run(args, budget: int, results):
+    import logging
+    logging.disable(logging.WARNING)
+
+    import httpx
+    import main as service
+
+    rng = random.Random(args.seed)
+    scripts = [[make_message(rng) for _ in range(args.turns)] for _ in range(args.sessions)]
+    latencies, tokens = [], []
+
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://athena", timeout=120) as http:
+            async def session(index, script):
+                for text in script:
+                    started = time.perf_counter()
+                    response = await http.post("/chat", json={"user_input": text, "session_id": f"budget-{index}"})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                    tokens.append(response.json()["prompt_tokens"])
+
+            await asyncio.gather(*(session(index, script) for index, script in enumerate(scripts)))
+            while service.summary_refreshes:
+                await asyncio.sleep(0.05)
+            metrics = (await http.get("/metrics")).text
+
+        summaries = 0
+        for index in range(args.sessions):
+            state = await service.session_store.load(f"budget-{index}")
+            summaries += bool(state is not None and state.summary)
+
+    refreshes = next((float(line.split()[-1]) for line in metrics.splitlines()
+                      if line.startswith('athena_stage_seconds_count{stage="summary"}')), 0.0)
+    results.put((budget, latencies, tokens, int(refreshes), summaries))
+
+
+def child(args, budget, hf_url, groq_url, results):
+    os.environ["PROMPT_TOKEN_BUDGET"] = str(budget)
+    os.environ["CHAT_DEDUP_WINDOW_SECONDS"] = "0"
+    configure_environment(hf_url, groq_url)
+    asyncio.run(run(args, budget, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 1024])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=15)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--hf-port", type=int, default=8741)
+    parser.add_argument("--groq-port", type=int, default=8742)
+    args = parser.parse_args()
+
+    groq_stub = create_groq_stub(per_prompt_token=args.prefill_ms_per_token / 1000)
+    with StubServer(create_hf_stub(), args.hf_port) as hf, StubServer(groq_stub, args.groq_port) as groq:
+        print(f"{'budget':>8} {'tok p50':>8} {'tok p95':>8} {'tok max':>8} {'lat p50':>8} {'lat p95':>8} "
+              f"{'refreshes':>9} {'summaries':>9}")
+        for budget in args.budgets:
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(target=child, args=(args, budget, hf.url, groq.url, results))
+            process.start()
+            budget, latencies, tokens, refreshes, summaries = results.get()
+            process.join()
+            label = "fixed-6" if budget <= 0 else str(budget)
+            print(f"{label:>8} {percentile(tokens, 0.5):>8} {percentile(tokens, 0.95):>8} {max(tokens):>8} "
+                  f"{percentile(latencies, 0.5) * 1000:>6.0f}ms {percentile(latencies, 0.95) * 1000:>6.0f}ms "
+                  f"{refreshes:>9} {summaries:>6}/{args.sessions}")
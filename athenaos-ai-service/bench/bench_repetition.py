@@ -0,0 +1,85 @@
+# bench/bench_repetition.py
+"""
+Incremental repetition tracking versus a full history rescan.
+
+Builds long sessions (1k+ turns) and, at checkpoints, compares
+`SessionState.repetitive_patterns()` (running counters) with
+`analyze_conversation_patterns(history)` (the rescan). Results must agree
+at every checkpoint, and the run fails otherwise. Per-call cost is reported
+for both.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_repetition --turns 1000 2000 5000
+"""
+import argparse
+import random
+import sys
+import time
+
+from config import ANTI_REPETITION_STARTERS
+from processing import analyze_conversation_patterns
+from sessions import SessionState
+
+FILLER = "Let's slow down for a moment and look at what happened at work today together".split()
+
+
+def synthetic_reply(rng):
+    words = rng.sample(FILLER, rng.randint(5, len(FILLER)))
+    if rng.random() < 0.6:
+        words.insert(0, rng.choice(ANTI_REPETITION_STARTERS) + ".")
+    return " ".join(words)
+
+
+def per_call_us(function, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def main(args):
+    rng = random.Random(3)
+    mismatches = 0
+    print(f"{'turns':>7} {'rescan us':>10} {'counters us':>12} {'speedup':>8}")
+    for turns in args.turns:
+        # A ring large enough to keep the whole session shows the unbounded case
+        state = SessionState(max_messages=2 * turns)
+        for turn in range(1, turns + 1):
+            state.append_turn(f"user message {turn}", synthetic_reply(rng))
+            if turn % args.check_every == 0 and state.repetitive_patterns() != analyze_conversation_patterns(state.history()):
+                mismatches += 1
+                print(f"mismatch at turn {turn}")
+
+        rescan = per_call_us(lambda: analyze_conversation_patterns(state.history()), args.repeats)
+        counters = per_call_us(state.repetitive_patterns, args.repeats * 100)
+        print(f"{turns:>7} {rescan:>10.1f} {counters:>12.2f} {rescan / counters:>7.0f}x")
+
+    # Replies leaving a small ring buffer must leave the counters too
+    ring = SessionState(max_messages=20)
+    for turn in range(200):
+        ring.append_turn("user", synthetic_reply(rng))
+        if ring.repetitive_patterns() != analyze_conversation_patterns(ring.history()):
+            mismatches += 1
+            print(f"ring mismatch at turn {turn}")
+
+    # Windowed tracking must match a rescan of the last N replies
+    window = SessionState(max_messages=400, window=args.window)
+    for turn in range(200):
+        window.append_turn("user", synthetic_reply(rng))
+        replies = [message for message in window.history() if message["role"] == "assistant"][-args.window:]
+        if window.repetitive_patterns() != analyze_conversation_patterns(replies):
+            mismatches += 1
+            print(f"window mismatch at turn {turn}")
+
+    print(f"mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--check-every", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--window", type=int, default=10)
+    main(parser.parse_args())
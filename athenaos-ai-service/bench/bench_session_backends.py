@@ -0,0 +1,109 @@
+# bench/bench_session_backends.py
+"""
+Cross-worker consistency check and throughput benchmark for the session
+backends.
+
+Two store instances stand in for two uvicorn workers and serve alternating
+turns of the same conversations. Every backend must end up with exactly the
+history a single in-memory store produces. Then both workers take a turn of
+the same conversation at once: the shared backends must refuse the second
+save with SessionConflict instead of losing the first turn. Redis runs
+against the local RESP stand-in in bench/resp_stub.py.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_session_backends --sessions 2000 --turns 6
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bench.resp_stub import RespStub
+from sessions import InMemorySessionStore, RedisSessionStore, SQLiteSessionStore, SessionConflict
+
+
+async def drive(workers, sessions, turns, sync_between_turns):
+    """Runs every conversation turn by turn, alternating workers."""
+    started = time.perf_counter()
+    for turn in range(turns):
+        worker = workers[turn % len(workers)]
+
+        async def one_turn(session_id):
+            state = await worker.load_or_create(session_id)
+            client_history = []
+            for earlier in range(turn):
+                client_history += [("user", f"{session_id} message {earlier}"), ("assistant", f"reply {earlier}")]
+            state.merge_history(client_history[-30:])
+            state.append_turn(f"{session_id} message {turn}", f"reply {turn}")
+            await worker.save(session_id, state)
+
+        await asyncio.gather(*(one_turn(f"s{index}") for index in range(sessions)))
+        if sync_between_turns:
+            for store in workers:
+                if hasattr(store, "flush"):
+                    await store.flush()
+    return sessions * turns / (time.perf_counter() - started)
+
+
+async def lost_updates(workers, sessions):
+    """Both workers load each conversation, then both save a turn; returns (kept, refused, lost)."""
+    kept = refused = lost = 0
+    for index in range(sessions):
+        session_id = f"s{index}"
+        states = [await store.load(session_id) for store in workers]
+        outcomes = []
+        for number, (store, state) in enumerate(zip(workers, states)):
+            state.append_turn(f"{session_id} race {number}", f"race reply {number}")
+            try:
+                await store.save(session_id, state)
+                outcomes.append(True)
+            except SessionConflict:
+                outcomes.append(False)
+        stored = (await workers[0].load(session_id)).history()
+        kept += sum(outcomes)
+        refused += outcomes.count(False)
+        lost += sum(1 for number, saved in enumerate(outcomes)
+                    if saved and {'role': 'user', 'content': f"{session_id} race {number}"} not in stored)
+    return kept, refused, lost
+
+
+async def snapshot(store, sessions):
+    return {f"s{index}": list((await store.load(f"s{index}")).messages) for index in range(sessions)}
+
+
+async def main(args):
+    reference = InMemorySessionStore(max_sessions=args.sessions)
+    rate = await drive([reference], args.sessions, args.turns, False)
+    expected = await snapshot(reference, args.sessions)
+    print(f"{'memory':>8}: {rate:>9,.0f} turns/s (reference)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.sqlite")
+        workers = [SQLiteSessionStore(path, max_sessions=args.sessions) for _ in range(2)]
+        rate = await drive(workers, args.sessions, args.turns, True)
+        consistent = await snapshot(workers[0], args.sessions) == expected
+        print(f"{'sqlite':>8}: {rate:>9,.0f} turns/s, consistent across workers: {consistent}, {workers[0].stats()}")
+        kept, refused, lost = await lost_updates(workers, args.race_sessions)
+        print(f"{'':>8}  racing saves: kept={kept} refused={refused} lost={lost}")
+        for store in workers:
+            await store.close()
+
+    async with RespStub(port=args.redis_port) as stub:
+        workers = [RedisSessionStore(stub.url) for _ in range(2)]
+        rate = await drive(workers, args.sessions, args.turns, False)
+        consistent = await snapshot(workers[1], args.sessions) == expected
+        print(f"{'redis':>8}: {rate:>9,.0f} turns/s, consistent across workers: {consistent}, {workers[0].stats()}")
+        kept, refused, lost = await lost_updates(workers, args.race_sessions)
+        print(f"{'':>8}  racing saves: kept={kept} refused={refused} lost={lost}")
+        for store in workers:
+            await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--race-sessions", type=int, default=100, help="conversations in the lost-update check")
+    parser.add_argument("--redis-port", type=int, default=6390)
+    asyncio.run(main(parser.parse_args()))
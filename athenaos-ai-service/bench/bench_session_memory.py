@@ -0,0 +1,64 @@
+# bench/bench_session_memory.py
+"""
+Memory benchmark for the session store.
+
+Simulates the Node backend: every turn resends the last 30 messages of the
+conversation as `history` and the service appends the new turn. After the
+store reaches its session cap, RSS should stay flat no matter how many more
+sessions arrive.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_session_memory --sessions 100000 --turns 5
+"""
+import argparse
+import random
+import resource
+import time
+
+from sessions import InMemorySessionStore
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_message(rng: random.Random) -> str:
+    words = ["I", "feel", "tired", "always", "work", "sleep", "anxious", "today", "friends", "better", "never"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(8, 60)))
+
+
+def main(args):
+    rng = random.Random(42)
+    store = InMemorySessionStore(max_sessions=args.max_sessions)
+    print(f"{'sessions':>9} {'live':>7} {'rss_mb':>8} {'msgs/session':>13}")
+    started = time.perf_counter()
+    for index in range(1, args.sessions + 1):
+        session_id = f"session-{index}"
+        client_history = []
+        for _ in range(args.turns):
+            state = store.get_or_create(session_id)
+            state.merge_history(client_history[-30:])
+            user_text, reply = synthetic_message(rng), synthetic_message(rng)
+            state.append_turn(user_text, reply)
+            client_history += [("user", user_text), ("assistant", reply)]
+        if index % args.report_every == 0:
+            print(f"{index:>9} {len(store):>7} {rss_mb():>8.1f} {len(state.messages):>13}")
+    elapsed = time.perf_counter() - started
+    print(f"{args.sessions * args.turns / elapsed:,.0f} turns/s; {store.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--max-sessions", type=int, default=10_000)
+    parser.add_argument("--report-every", type=int, default=10_000)
+    main(parser.parse_args())
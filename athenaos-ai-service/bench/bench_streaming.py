@@ -0,0 +1,77 @@
+# bench/bench_streaming.py
+"""
+Time-to-first-token benchmark: /chat versus /chat/stream.
+
+For /chat the user sees nothing until the whole reply is generated. For
+/chat/stream we record when the `analysis` event and the first `token`
+event arrive, and when the stream finishes.
+
+Usage (from athenaos-ai-service/):
+    python -m bench.bench_streaming --requests 20 --groq-latency 2.0
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from bench.bench_concurrency import configure_environment
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+async def measure_chat(http, session_id):
+    started = time.perf_counter()
+    response = await http.post("/chat", json={"user_input": f"I feel stuck at work lately {session_id}", "session_id": session_id})
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def measure_stream(http, session_id):
+    marks = {}
+    started = time.perf_counter()
+    payload = {"user_input": f"I feel stuck at work lately {session_id}", "session_id": session_id}
+    async with http.stream("POST", "/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                marks.setdefault(line[7:], time.perf_counter() - started)
+    return marks
+
+
+async def main(args, service_url):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=service_url, timeout=120) as http:
+        totals = [await measure_chat(http, f"chat-{i}") for i in range(args.requests)]
+        streams = [await measure_stream(http, f"stream-{i}") for i in range(args.requests)]
+
+    def ms(values):
+        return f"p50 {statistics.median(values) * 1000:7.0f} ms"
+
+    print(f"/chat         full reply:   {ms(totals)}")
+    print(f"/chat/stream  analysis:     {ms([m['analysis'] for m in streams])}")
+    print(f"/chat/stream  first token:  {ms([m['token'] for m in streams])}")
+    print(f"/chat/stream  done:         {ms([m['done'] for m in streams])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--hf-latency", type=float, default=0.1)
+    parser.add_argument("--groq-latency", type=float, default=2.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--hf-port", type=int, default=8701)
+    parser.add_argument("--groq-port", type=int, default=8702)
+    parser.add_argument("--service-port", type=int, default=8703)
+    args = parser.parse_args()
+
+    with StubServer(create_hf_stub(args.hf_latency), args.hf_port) as hf, \
+            StubServer(create_groq_stub(args.groq_latency, args.first_token_latency), args.groq_port) as groq:
+        configure_environment(hf.url, groq.url)
+        import logging
+        logging.disable(logging.INFO)
+        import main as service
+
+        # The service runs behind a real HTTP server: the in-process ASGI
+        # transport would buffer the whole stream and hide the first token.
+        with StubServer(service.app, args.service_port) as athena:
+            asyncio.run(main(args, athena.url))
@@ -0,0 +1,29 @@
+# bench/common.py
+"""
+Helpers shared by the benchmarks in this package: latency percentiles and
+the sample chat messages the benches compose their traffic from.
+"""
+
+SAMPLE_MESSAGES = [
+    "I keep replaying the argument with my sister and I can't stop thinking I ruined everything.",
+    "Work has been overwhelming and my manager keeps adding deadlines.",
+    "I tried the breathing exercise yesterday and it helped a little.",
+    "Sometimes I feel like nobody would notice if I just disappeared for a while.",
+    "My sleep has been terrible, I wake up at 4am with my heart racing.",
+    "I should be able to handle this on my own, everyone else seems to manage.",
+    "We talked about writing down my thoughts, but I keep forgetting to do it.",
+    "My friend invited me out this weekend and I am not sure I have the energy.",
+    "I'm honestly so proud of myself, I finally finished the project!",
+    "I'm not angry anymore, just tired of feeling like this.",
+    "I finally told my partner how I have been feeling and it went better than I expected.",
+    "Every time I open my laptop I feel a wave of dread about all the emails.",
+    "I'm proud that I went for a walk today even though I didn't want to.",
+    "Nobody at the new job talks to me and I feel invisible.",
+    "I don't know why I feel so empty when nothing is actually wrong.",
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile (`fraction` in 0..1) of `values`; NaN when there are none."""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
@@ -0,0 +1,315 @@
+# bench/loadgen.py
+"""
+Load generator for the AI service: multi-turn sessions at fixed concurrency.
+
+Each virtual user runs one conversation after another. A conversation has
+between --turns MIN MAX messages, sent the way the Node backend sends them
+(full history first, then only the history cursor, resyncing on 409), with
+an exponential think time of mean --think seconds between turns. Every
+concurrency level runs for --duration seconds. Per level it reports
+completed chats, errors by status, throughput, p50/p95/p99/max latency
+(time to first token too with --stream) and the service's resident memory.
+
+The service runs in its own process so its RSS is measured alone; RSS peak
+is the process high-water mark, so it carries over between levels. The
+classifier cache is off unless --classifier-cache is given, because real
+users rarely send the same text twice.
+
+Upstreams:
+  (default)        synthetic stubs; latency distributions and error rates
+                   per --hf-latency/--groq-latency and --*-error-rate
+                   (see stubs.Latency for the spec syntax)
+  --record FILE    the real HF and Groq APIs through recording proxies,
+                   appending every exchange to FILE (spends real quota;
+                   needs HUGGINGFACE_API_KEY and GROQ_API_KEY)
+  --replay FILE    stubs answering with the recorded responses and
+                   latencies; user messages are drawn from the recording
+  --target URL     an already running service with whatever upstreams it
+                   has; RSS is only reported with --pid
+
+Usage (from athenaos-ai-service/):
+    python -m bench.loadgen --concurrency 1 16 64 --duration 20
+    python -m bench.loadgen --hf-latency lognormal:0.08,0.6 --hf-error-rate 0.02 --stream
+    python -m bench.loadgen --record fixtures.jsonl --concurrency 2 --duration 60
+    python -m bench.loadgen --replay fixtures.jsonl --concurrency 8 32 --json baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+
+from bench.bench_concurrency import configure_environment
+from bench.common import SAMPLE_MESSAGES, percentile
+from bench.recorder import GROQ_UPSTREAM, HF_UPSTREAM, create_recording_proxy, load_fixtures, recorded_texts
+from bench.stubs import StubServer, create_groq_stub, create_hf_stub
+
+
+def compose_corpus(rng: random.Random, size: int) -> list:
+    """Messages of one to four sentences, so most texts differ like real ones do."""
+    return [" ".join(rng.sample(SAMPLE_MESSAGES, rng.randint(1, 4))) for _ in range(size)]
+
+
+def read_memory(pid):
+    """VmRSS and VmHWM (peak) of a process, in MiB."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    fields[name] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return fields
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.first_tokens = []
+        self.errors = Counter()
+        self.resyncs = 0
+        self.sessions = 0
+
+
+async def send_turn(http, body, stream: bool):
+    """Posts one message. Returns (status, reply, cursor, seconds to first token)."""
+    started = time.perf_counter()
+    if not stream:
+        response = await http.post("/chat", json=body)
+        if response.status_code != 200:
+            return response.status_code, None, None, None
+        data = response.json()
+        return 200, data["response"], data.get("history_cursor"), None
+
+    async with http.stream("POST", "/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, None, None, None
+        event, parts, cursor, first_token = None, [], None, None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if event == "token":
+                    first_token = first_token or time.perf_counter() - started
+                    parts.append(data["text"])
+                elif event == "done":
+                    cursor = data.get("history_cursor")
+                elif event == "error":
+                    return "stream_error", None, None, first_token
+        return 200, "".join(parts), cursor, first_token
+
+
+async def virtual_user(http, rng, corpus, args, results, stop_at):
+    while time.monotonic() < stop_at:
+        session_id = f"load-{uuid.uuid4().hex[:12]}"
+        history, cursor = [], None
+        results.sessions += 1
+        turns = rng.randint(*args.turns)
+        texts = rng.sample(corpus, turns) if len(corpus) >= turns else [rng.choice(corpus) for _ in range(turns)]
+        for text in texts:
+            if time.monotonic() >= stop_at:
+                return
+            full = {"user_input": text, "session_id": session_id, "history": history[-30:]}
+            body = {"user_input": text, "session_id": session_id, "history": [], "history_cursor": cursor} \
+                if cursor else full
+            started = time.perf_counter()
+            try:
+                status, reply, new_cursor, first_token = await send_turn(http, body, args.stream)
+                if status == 409:
+                    results.resyncs += 1
+                    status, reply, new_cursor, first_token = await send_turn(http, full, args.stream)
+            except Exception as e:
+                results.errors[type(e).__name__] += 1
+                break
+            if status != 200:
+                results.errors[str(status)] += 1
+                break
+            results.latencies.append(time.perf_counter() - started)
+            if first_token is not None:
+                results.first_tokens.append(first_token)
+            history += [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+            cursor = new_cursor
+            if args.think > 0:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+
+
+async def run_level(service_url, concurrency, args, corpus, pid):
+    import httpx
+
+    rng = random.Random(args.seed + concurrency)
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=service_url, timeout=120, limits=limits) as http:
+        started = time.perf_counter()
+        stop_at = time.monotonic() + args.duration
+        await asyncio.gather(*(virtual_user(http, rng, corpus, args, results, stop_at) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    memory = read_memory(pid) if pid else {}
+    row = {
+        "concurrency": concurrency,
+        "chats": len(results.latencies),
+        "sessions": results.sessions,
+        "errors": dict(results.errors),
+        "resyncs": results.resyncs,
+        "chats_per_second": round(len(results.latencies) / elapsed, 2),
+        "latency_ms": {name: round(percentile(results.latencies, fraction) * 1000, 1)
+                       for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "rss_mib": round(memory.get("VmRSS", float("nan")), 1),
+        "rss_peak_mib": round(memory.get("VmHWM", float("nan")), 1),
+    }
+    if results.first_tokens:
+        row["first_token_ms"] = {name: round(percentile(results.first_tokens, fraction) * 1000, 1)
+                                 for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+    return row
+
+
+def print_row(row):
+    latency = row["latency_ms"]
+    errors = sum(row["errors"].values())
+    line = (f"{row['concurrency']:>6} {row['chats']:>7} {errors:>6} {row['chats_per_second']:>8.1f} "
+            f"{latency['p50']:>8.0f} {latency['p95']:>8.0f} {latency['p99']:>8.0f} {latency['max']:>8.0f} "
+            f"{row['rss_mib']:>7.1f} {row['rss_peak_mib']:>7.1f}")
+    if "first_token_ms" in row:
+        line += f" {row['first_token_ms']['p50']:>8.0f} {row['first_token_ms']['p95']:>8.0f}"
+    print(line, flush=True)
+    if row["errors"]:
+        print(f"{'':>6} errors: {row['errors']}", flush=True)
+
+
+async def drive(service_url, args, corpus, pid):
+    header = (f"{'conc':>6} {'chats':>7} {'errors':>6} {'chats/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'rss MiB':>7} {'peak':>7}")
+    if args.stream:
+        header += f" {'ttft p50':>8} {'ttft p95':>8}"
+    print(header, flush=True)
+    rows = []
+    for concurrency in args.concurrency:
+        row = await run_level(service_url, concurrency, args, corpus, pid)
+        print_row(row)
+        rows.append(row)
+    return rows
+
+
+async def read_stub_stats(urls):
+    import httpx
+
+    stats = {}
+    async with httpx.AsyncClient(timeout=5) as http:
+        for name, url in urls.items():
+            try:
+                stats[name] = (await http.get(f"{url}/_stats")).json()
+            except httpx.HTTPError:
+                pass
+    return stats
+
+
+def start_upstreams(args, stack):
+    """Starts the stubs or recording proxies and points the service environment at them."""
+    if args.record:
+        # Not via config: importing it now would fix the upstream URLs before they are set below
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not (os.getenv("HUGGINGFACE_API_KEY") and os.getenv("GROQ_API_KEY")):
+            raise SystemExit("--record calls the real APIs and needs HUGGINGFACE_API_KEY and GROQ_API_KEY")
+        hf = stack.enter(StubServer(create_recording_proxy(HF_UPSTREAM, args.record), args.hf_port))
+        groq = stack.enter(StubServer(create_recording_proxy(GROQ_UPSTREAM, args.record), args.groq_port))
+        os.environ["HF_API_BASE_URL"] = f"{hf.url}/models/"
+        os.environ["GROQ_BASE_URL"] = groq.url
+        return {}
+
+    fixtures = load_fixtures(args.replay) if args.replay else None
+    hf = stack.enter(StubServer(create_hf_stub(
+        args.hf_latency, error_rate=args.hf_error_rate, fixtures=fixtures), args.hf_port))
+    groq = stack.enter(StubServer(create_groq_stub(
+        args.groq_latency, args.first_token_latency, error_rate=args.groq_error_rate, fixtures=fixtures),
+        args.groq_port))
+    configure_environment(hf.url, groq.url)
+    return {"hf": hf.url, "groq": groq.url}
+
+
+class Servers:
+    """Stops the child servers in reverse order of starting them."""
+
+    def __init__(self):
+        self.servers = []
+
+    def enter(self, server):
+        self.servers.append(server.__enter__())
+        return server
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for server in reversed(self.servers):
+            server.__exit__(*exc)
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    if args.replay:
+        corpus = recorded_texts(load_fixtures(args.replay))
+        if not corpus:
+            raise SystemExit(f"{args.replay} has no recorded messages")
+    elif args.messages:
+        with open(args.messages, encoding="utf-8") as source:
+            corpus = [line.strip() for line in source if line.strip()]
+    else:
+        corpus = compose_corpus(rng, args.corpus_size)
+
+    if args.target:
+        rows = asyncio.run(drive(args.target.rstrip("/"), args, corpus, args.pid))
+        stub_stats = {}
+    else:
+        with Servers() as stack:
+            stub_urls = start_upstreams(args, stack)
+            os.environ["CLASSIFIER_CACHE_ENABLED"] = "true" if args.classifier_cache else "false"
+            import logging
+            logging.disable(logging.ERROR)
+            import main as service
+            server = stack.enter(StubServer(service.app, args.service_port))
+            rows = asyncio.run(drive(server.url, args, corpus, server.process.pid))
+            stub_stats = asyncio.run(read_stub_stats(stub_urls))
+        for name, stats in stub_stats.items():
+            print(f"{name} stub: {stats}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump({"arguments": vars(args), "levels": rows, "stubs": stub_stats}, out, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency level")
+    parser.add_argument("--turns", type=int, nargs=2, default=[3, 8], metavar=("MIN", "MAX"))
+    parser.add_argument("--think", type=float, default=0.0, help="mean think time between turns, seconds")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and report time to first token")
+    parser.add_argument("--messages", help="text file with one user message per line")
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--classifier-cache", action="store_true")
+    parser.add_argument("--hf-latency", default="lognormal:0.08,0.4")
+    parser.add_argument("--hf-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-latency", default="lognormal:0.4,0.3")
+    parser.add_argument("--first-token-latency", default="lognormal:0.08,0.3")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", metavar="FILE", help="run against the real APIs, appending exchanges to FILE")
+    source.add_argument("--replay", metavar="FILE", help="stubs answer from the recording in FILE")
+    source.add_argument("--target", metavar="URL", help="drive an already running service")
+    parser.add_argument("--pid", type=int, help="process id of --target, for RSS")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--hf-port", type=int, default=8781)
+    parser.add_argument("--groq-port", type=int, default=8782)
+    parser.add_argument("--service-port", type=int, default=8783)
+    main(parser.parse_args())
@@ -0,0 +1,153 @@
+# bench/recorder.py
+"""
+Records real HF Inference API and Groq exchanges as fixtures for the stubs.
+
+A recording proxy forwards every POST to the real upstream with the same
+path and headers, relays the answer (streamed answers chunk by chunk) and
+appends one JSON line per exchange to the fixture file:
+
+  {"api": "hf", "model", "inputs", "status", "body", "elapsed"}
+  {"api": "groq", "model", "user", "status", "content", "usage", "body",
+   "elapsed", "first_token"}
+
+`user` is the last user message of the prompt, which replay matches on;
+`first_token` is set for streamed replies. Point HF_API_BASE_URL at
+<proxy>/models/ and GROQ_BASE_URL at the other proxy, then run traffic
+through the service (see bench/loadgen.py --record).
+"""
+import json
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+HF_UPSTREAM = "https://api-inference.huggingface.co"
+GROQ_UPSTREAM = "https://api.groq.com"
+
+# Request headers the proxy passes on; the rest are about the hop to the proxy
+FORWARDED_HEADERS = ("authorization", "content-type", "accept", "user-agent")
+
+
+def create_recording_proxy(upstream: str, path: str, timeout: float = 60.0) -> FastAPI:
+    """Builds a proxy to `upstream` that appends every exchange to the JSONL file `path`."""
+    app = FastAPI()
+    state = {}
+
+    def client():
+        # Created in the serving process, on its event loop
+        if "client" not in state:
+            state["client"] = httpx.AsyncClient(base_url=upstream, timeout=timeout)
+        return state["client"]
+
+    def write(entry):
+        with open(path, "a", encoding="utf-8") as out:
+            out.write(json.dumps(entry) + "\n")
+
+    def describe(url_path, body):
+        if "/models/" in url_path:
+            return {"api": "hf", "model": url_path.split("/models/", 1)[1], "inputs": body.get("inputs")}
+        user = next((message.get("content") for message in reversed(body.get("messages", []))
+                     if message.get("role") == "user"), None)
+        return {"api": "groq", "model": body.get("model"), "user": user}
+
+    @app.post("/{url_path:path}")
+    async def forward(url_path: str, request: Request):
+        raw = await request.body()
+        body = json.loads(raw or b"{}")
+        headers = {name: value for name, value in request.headers.items() if name in FORWARDED_HEADERS}
+        entry = describe("/" + url_path, body)
+        started = time.perf_counter()
+
+        if not body.get("stream"):
+            response = await client().post("/" + url_path, content=raw, headers=headers)
+            entry.update(status=response.status_code, elapsed=round(time.perf_counter() - started, 4))
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = response.text
+            if entry["api"] == "groq":
+                if response.status_code == 200:
+                    entry.update(content=payload["choices"][0]["message"]["content"], usage=payload.get("usage"))
+                else:
+                    entry["body"] = payload
+            else:
+                entry["body"] = payload
+            write(entry)
+            return Response(response.content, status_code=response.status_code,
+                            media_type=response.headers.get("content-type"))
+
+        upstream_request = client().build_request("POST", "/" + url_path, content=raw, headers=headers)
+        response = await client().send(upstream_request, stream=True)
+
+        async def relay():
+            parts, first_token = [], None
+            try:
+                async for line in response.aiter_lines():
+                    if line.startswith("data: ") and line != "data: [DONE]":
+                        chunk = json.loads(line[6:])
+                        text = chunk["choices"][0]["delta"].get("content") if chunk.get("choices") else None
+                        if text:
+                            if first_token is None:
+                                first_token = round(time.perf_counter() - started, 4)
+                            parts.append(text)
+                    yield line + "\n"
+            finally:
+                await response.aclose()
+                entry.update(status=response.status_code, content="".join(parts), usage=None,
+                             elapsed=round(time.perf_counter() - started, 4), first_token=first_token)
+                write(entry)
+
+        return StreamingResponse(relay(), status_code=response.status_code, media_type="text/event-stream")
+
+    return app
+
+
+def load_fixtures(path: str) -> dict:
+    """
+    Reads a fixture file into the lookups the stubs replay from:
+
+      hf            {(model, text): {"status", "body", "elapsed"}}; batched
+                    inputs are split into one entry per text
+      groq          {last user message: {"status", "content", "usage", "body", "elapsed", "first_token"}}
+      hf_latency    {model: [elapsed, ...]} of successful calls
+      groq_latency  [elapsed, ...] of successful calls
+
+    A successful exchange wins over a failed one for the same key.
+    """
+    fixtures = {"hf": {}, "groq": {}, "hf_latency": {}, "groq_latency": []}
+
+    def keep(table, key, entry):
+        current = table.get(key)
+        if current is None or current["status"] != 200:
+            table[key] = entry
+
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            status, elapsed = record["status"], record["elapsed"]
+            if record["api"] == "hf":
+                model, inputs = record["model"], record["inputs"]
+                if isinstance(inputs, list):
+                    outputs = record["body"] if status == 200 and isinstance(record["body"], list) else None
+                    for index, text in enumerate(inputs):
+                        body = [outputs[index]] if outputs is not None else record["body"]
+                        keep(fixtures["hf"], (model, text), {"status": status, "body": body, "elapsed": elapsed})
+                else:
+                    keep(fixtures["hf"], (model, inputs), {"status": status, "body": record["body"], "elapsed": elapsed})
+                    if status == 200:
+                        fixtures["hf_latency"].setdefault(model, []).append(elapsed)
+            else:
+                keep(fixtures["groq"], record["user"], record)
+                if status == 200:
+                    fixtures["groq_latency"].append(elapsed)
+    return fixtures
+
+
+def recorded_texts(fixtures: dict) -> list:
+    """The distinct user messages in a recording, in a stable order."""
+    return sorted({text for (_, text) in fixtures["hf"] if isinstance(text, str)} | {
+        user for user in fixtures["groq"] if isinstance(user, str)
+    })
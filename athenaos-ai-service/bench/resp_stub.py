@@ -0,0 +1,154 @@
+# bench/resp_stub.py
+"""
+Minimal Redis-protocol (RESP2) stand-in for exercising RedisSessionStore
+without a real Redis server.
+
+Supports the handful of commands the session store and redis-py's handshake
+use: HELLO (protocol 2 only), PING, GET, SET (with EX/PX), DEL, EXISTS,
+EXPIRE, TTL, DBSIZE, FLUSHDB, CLIENT and SELECT, plus WATCH, UNWATCH, MULTI,
+EXEC and DISCARD for optimistic transactions. Expiry is checked lazily on access.
+"""
+import asyncio
+import time
+
+
+class RespStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 6390):
+        self.host, self.port = host, port
+        self.url = f"redis://{host}:{port}/0"
+        self.data = {}  # key -> (value, expires_at or None)
+        self.revisions = {}  # key -> number of changes, for WATCH
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            self._touch(key)
+            return None
+        return entry
+
+    def _touch(self, key):
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _serve(self, reader, writer):
+        connection = {"watched": {}, "queued": None}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                writer.write(self._transact(connection, args[0].upper(), args[1:]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _transact(self, connection, command, args):
+        """Handles the per-connection transaction commands; everything else goes to _execute."""
+        watched = connection["watched"]
+        if command == b"WATCH":
+            for key in args:
+                self._live(key)
+                watched[key] = self.revisions.get(key, 0)
+            return b"+OK\r\n"
+        if command == b"UNWATCH":
+            watched.clear()
+            return b"+OK\r\n"
+        if command == b"MULTI":
+            connection["queued"] = []
+            return b"+OK\r\n"
+        if command == b"DISCARD":
+            connection["queued"] = None
+            watched.clear()
+            return b"+OK\r\n"
+        if command == b"EXEC":
+            queued, connection["queued"] = connection["queued"], None
+            if queued is None:
+                return b"-ERR EXEC without MULTI\r\n"
+            for key in watched:
+                self._live(key)
+            changed = any(self.revisions.get(key, 0) != revision for key, revision in watched.items())
+            watched.clear()
+            if changed:
+                return b"*-1\r\n"
+            replies = [self._execute(queued_command, queued_args) for queued_command, queued_args in queued]
+            return b"*%d\r\n%s" % (len(replies), b"".join(replies))
+        if connection["queued"] is not None:
+            connection["queued"].append((command, args))
+            return b"+QUEUED\r\n"
+        return self._execute(command, args)
+
+    def _execute(self, command, args):
+        if command == b"HELLO":
+            if args and args[0] not in (b"2",):
+                return b"-NOPROTO this stand-in only speaks RESP2\r\n"
+            fields = [b"server", b"redis", b"version", b"7.0.0", b"proto", 2, b"id", 1,
+                      b"mode", b"standalone", b"role", b"master"]
+            encoded = b"".join(b":%d\r\n" % f if isinstance(f, int) else b"$%d\r\n%s\r\n" % (len(f), f) for f in fields)
+            return b"*%d\r\n%s*0\r\n" % (len(fields) + 2, encoded + b"$7\r\nmodules\r\n")
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            entry = self._live(args[0])
+            return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+        if command == b"SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[2:]]
+            if b"EX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            self.data[args[0]] = (args[1], expires_at)
+            self._touch(args[0])
+            return b"+OK\r\n"
+        if command == b"DEL":
+            removed = sum(1 for key in args if self._live(key) is not None and self.data.pop(key, None))
+            for key in args:
+                self._touch(key)
+            return b":%d\r\n" % removed
+        if command == b"EXISTS":
+            return b":%d\r\n" % sum(1 for key in args if self._live(key) is not None)
+        if command == b"EXPIRE":
+            entry = self._live(args[0])
+            if entry is None:
+                return b":0\r\n"
+            self.data[args[0]] = (entry[0], time.monotonic() + int(args[1]))
+            self._touch(args[0])
+            return b":1\r\n"
+        if command == b"TTL":
+            entry = self._live(args[0])
+            if entry is None:
+                return b":-2\r\n"
+            return b":-1\r\n" if entry[1] is None else b":%d\r\n" % int(entry[1] - time.monotonic())
+        if command == b"DBSIZE":
+            return b":%d\r\n" % sum(1 for key in list(self.data) if self._live(key) is not None)
+        if command == b"FLUSHDB":
+            for key in self.data:
+                self._touch(key)
+            self.data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % command
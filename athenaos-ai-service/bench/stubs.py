@@ -0,0 +1,318 @@
+# bench/stubs.py
+"""
+Local stand-ins for the Hugging Face Inference API and the Groq
+chat-completions API, used by the benchmarks in this package.
+
+Each stub is a small FastAPI app that answers with the same JSON shape as the
+real upstream after a delay drawn from a latency distribution (see Latency),
+so the AI service can be driven at high concurrency without spending real
+quota. Both can fail a fraction of calls at random, and both can replay
+responses recorded from the real APIs (see bench/recorder.py) instead of
+the canned ones. GET /_stats reports requests, injected errors and replay
+hits and misses.
+"""
+import json
+import math
+import random
+import asyncio
+import contextlib
+import multiprocessing
+import socket
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Canned classifier outputs, keyed by a substring of the model path
+HF_STUB_OUTPUTS = {
+    "hate-speech": [[{"label": "nothate", "score": 0.98}, {"label": "hate", "score": 0.02}]],
+    "sentiment": [[
+        {"label": "negative", "score": 0.71},
+        {"label": "neutral", "score": 0.22},
+        {"label": "positive", "score": 0.07},
+    ]],
+    "emotion": [[
+        {"label": "sadness", "score": 0.74},
+        {"label": "fear", "score": 0.12},
+        {"label": "anger", "score": 0.06},
+        {"label": "joy", "score": 0.04},
+        {"label": "love", "score": 0.02},
+        {"label": "surprise", "score": 0.02},
+    ]],
+}
+
+STUB_REPLY = (
+    "That is a lot to carry at once. What feels like the heaviest part of it "
+    "for you right now, and what has helped even a little in the past?"
+)
+
+
+class Latency:
+    """
+    A latency distribution in seconds. `Latency.parse` accepts a number or a
+    spec string:
+      0.05, fixed:0.05         always the same
+      uniform:LOW,HIGH
+      exp:MEAN                 mostly short, with a long tail
+      lognormal:MEDIAN,SIGMA   skewed like real model serving; SIGMA 0.5
+                               puts p99 near 3.2x the median
+    `Latency.samples` draws from recorded values instead.
+    """
+
+    def __init__(self, draw, label: str):
+        self.draw = draw
+        self.label = label
+
+    def __call__(self) -> float:
+        return max(self.draw(), 0.0)
+
+    def __repr__(self):
+        return f"Latency({self.label})"
+
+    @classmethod
+    def parse(cls, spec):
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls(lambda: spec, f"fixed:{spec}")
+        kind, _, args = str(spec).partition(":")
+        if not args:
+            kind, args = "fixed", kind
+        values = [float(value) for value in args.split(",")]
+        if kind == "fixed":
+            return cls(lambda: values[0], spec)
+        if kind == "uniform":
+            return cls(lambda: random.uniform(values[0], values[1]), spec)
+        if kind == "exp":
+            return cls(lambda: random.expovariate(1 / values[0]), spec)
+        if kind == "lognormal":
+            mu = math.log(values[0])
+            return cls(lambda: random.lognormvariate(mu, values[1]), spec)
+        raise ValueError(f"Unknown latency distribution '{spec}'")
+
+    @classmethod
+    def samples(cls, values, default: float = 0.05):
+        values = list(values)
+        if not values:
+            return cls.parse(default)
+        return cls(lambda: random.choice(values), f"recorded:{len(values)}")
+
+
+def create_hf_stub(latency=0.05, per_input_latency: float = 0.002, error_rate: float = 0.0,
+                   fixtures=None) -> FastAPI:
+    """
+    Builds a stub of the HF Inference API that answers after a delay drawn
+    from `latency` (a Latency or anything Latency.parse accepts). List
+    inputs are answered with one result per input and cost an extra
+    `per_input_latency` each, like a batched forward pass. A fraction
+    `error_rate` of calls answers 500.
+
+    With `fixtures` (recorder.load_fixtures), recorded texts get their
+    recorded status, body and latency; other texts get the canned output
+    and a latency drawn from the model's recorded ones.
+
+    Faults are injected at runtime with POST /_faults {"mode", "models",
+    "delay", "rate"}, for the models whose path contains `models` ("" for all):
+      ok       normal answers
+      hang     answers only after `delay` seconds
+      error    500
+      loading  503 "model is currently loading" with estimated_time `delay`
+      tail     a fraction `rate` of calls takes `delay` seconds longer
+    """
+    app = FastAPI()
+    faults = {"mode": "ok", "models": "", "delay": 30.0, "rate": 0.0}
+    stats = {"requests": 0, "errors_injected": 0, "replay_hits": 0, "replay_misses": 0}
+    latency = Latency.parse(latency)
+    recorded = fixtures["hf"] if fixtures else None
+    recorded_latency = {
+        model: Latency.samples(values) for model, values in (fixtures or {}).get("hf_latency", {}).items()
+    }
+
+    @app.post("/_faults")
+    async def set_faults(request: Request):
+        faults.update(await request.json())
+        return faults
+
+    @app.get("/_stats")
+    async def read_stats():
+        return stats
+
+    def replay(model_path, text):
+        entry = recorded.get((model_path, text))
+        stats["replay_hits" if entry is not None else "replay_misses"] += 1
+        return entry
+
+    @app.post("/models/{model_path:path}")
+    async def infer(model_path: str, request: Request):
+        inputs = (await request.json()).get("inputs")
+        stats["requests"] += 1
+        output = next((value for key, value in HF_STUB_OUTPUTS.items() if key in model_path), [[]])
+        delay = recorded_latency.get(model_path, latency) if recorded is not None else latency
+        if error_rate and random.random() < error_rate:
+            stats["errors_injected"] += 1
+            await asyncio.sleep(delay())
+            return JSONResponse({"error": "Internal Server Error"}, status_code=500)
+        mode = faults["mode"] if faults["models"] in model_path else "ok"
+        if mode == "error":
+            return JSONResponse({"error": "Internal Server Error"}, status_code=500)
+        if mode == "loading":
+            return JSONResponse(
+                {"error": f"Model {model_path} is currently loading", "estimated_time": faults["delay"]},
+                status_code=503,
+            )
+        if mode == "hang" or (mode == "tail" and random.random() < faults["rate"]):
+            await asyncio.sleep(faults["delay"])
+        if isinstance(inputs, list):
+            outputs = []
+            for text in inputs:
+                entry = replay(model_path, text) if recorded is not None else None
+                outputs.append(entry["body"][0] if entry is not None and entry["status"] == 200 else output[0])
+            await asyncio.sleep(delay() + per_input_latency * len(inputs))
+            return outputs
+        entry = replay(model_path, inputs) if recorded is not None else None
+        if entry is not None:
+            await asyncio.sleep(entry["elapsed"])
+            return JSONResponse(entry["body"], status_code=entry["status"])
+        await asyncio.sleep(delay())
+        return output
+
+    return app
+
+
+def create_groq_stub(latency=0.2, first_token_latency=0.05, per_prompt_token: float = 0.0,
+                     error_rate: float = 0.0, fixtures=None, max_concurrent: int = None) -> FastAPI:
+    """
+    Builds a stub of Groq's OpenAI-compatible chat-completions endpoint.
+
+    Non-streaming calls answer after a delay drawn from `latency`. Streaming
+    calls send the first token after a delay drawn from `first_token_latency`
+    and spread the rest of a `latency` draw evenly over the other tokens.
+    Every prompt token (about 4 characters) adds `per_prompt_token` seconds
+    of prefill before the answer or the first token, and is reported in
+    `usage`. A fraction `error_rate` of calls answers 500, which the Groq
+    client retries like a real one. With `max_concurrent`, at most that many
+    calls are generated at once and the rest wait their turn, like a
+    saturated provider.
+
+    With `fixtures` (recorder.load_fixtures), a request whose last user
+    message was recorded gets the recorded reply and timings; other requests
+    get the canned reply with a latency drawn from the recorded ones.
+    """
+    app = FastAPI()
+    stats = {"requests": 0, "errors_injected": 0, "replay_hits": 0, "replay_misses": 0}
+    latency = Latency.parse(latency)
+    first_token_latency = Latency.parse(first_token_latency)
+    recorded = fixtures["groq"] if fixtures else None
+    if recorded is not None:
+        latency = Latency.samples(fixtures["groq_latency"], default=0.2)
+    capacity = asyncio.Semaphore(max_concurrent) if max_concurrent else contextlib.nullcontext()
+
+    @app.get("/_stats")
+    async def read_stats():
+        return stats
+
+    def count_prompt_tokens(body):
+        return sum(len(message.get("content") or "") for message in body.get("messages", [])) // 4
+
+    def last_user_message(body):
+        return next((message.get("content") for message in reversed(body.get("messages", []))
+                     if message.get("role") == "user"), None)
+
+    async def stream_chunks(model: str, reply: str, first_delay: float, total: float):
+        words = reply.split(" ")
+        per_token = max(total - first_delay, 0.0) / max(len(words) - 1, 1)
+        async with capacity:
+            await asyncio.sleep(first_delay)
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(per_token)
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word if index == 0 else " " + word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        tokens = count_prompt_tokens(body)
+        prefill = tokens * per_prompt_token
+        reply, usage = STUB_REPLY, {"prompt_tokens": tokens, "completion_tokens": 0, "total_tokens": tokens}
+        total, first_delay = latency(), first_token_latency()
+
+        entry = None
+        if recorded is not None:
+            entry = recorded.get(last_user_message(body))
+            stats["replay_hits" if entry is not None else "replay_misses"] += 1
+        if error_rate and random.random() < error_rate:
+            stats["errors_injected"] += 1
+            entry = {"status": 500, "body": {"error": {"message": "Injected stub error", "type": "internal_server_error"}},
+                     "elapsed": total}
+        if entry is not None:
+            if entry["status"] != 200:
+                await asyncio.sleep(entry["elapsed"])
+                return JSONResponse(entry.get("body") or {"error": {"message": "Recorded upstream error"}},
+                                    status_code=entry["status"])
+            reply, usage = entry["content"], entry.get("usage") or usage
+            total, prefill = entry["elapsed"], 0.0
+            first_delay = entry.get("first_token") or min(first_delay, total)
+
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(body.get("model", "stub"), reply, first_delay + prefill, total + prefill),
+                media_type="text/event-stream",
+            )
+        async with capacity:
+            await asyncio.sleep(total + prefill)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    return app
+
+
+class StubServer:
+    """
+    Runs an ASGI app with uvicorn in a child process, so a stub's CPU time
+    does not compete with the service under test for the GIL. Also used to
+    serve the service itself when a benchmark needs a real HTTP server.
+    """
+
+    def __init__(self, app: FastAPI, port: int, host: str = "127.0.0.1"):
+        self.host, self.port = host, port
+        self.url = f"http://{host}:{port}"
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+        self.process = multiprocessing.get_context("fork").Process(
+            target=uvicorn.Server(config).run, daemon=True
+        )
+
+    def __enter__(self):
+        self.process.start()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((self.host, self.port), timeout=0.1).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.process.terminate()
+        raise RuntimeError(f"Stub server on {self.url} did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join(timeout=5)
@@ -0,0 +1,184 @@
+# breaker.py
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class LatencyWindow:
+    """Latencies (seconds) of the most recent successful calls, for percentiles."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._sorted = None
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, fraction: float):
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(int(fraction * len(self._sorted)), len(self._sorted) - 1)]
+
+
+class BreakerCall:
+    """One call admitted by a CircuitBreaker; pass it back to `end`."""
+    __slots__ = ("started", "timer", "judged", "probe", "sampled", "tripped")
+
+    def __init__(self, probe: bool, sampled: bool, tripped):
+        self.started = time.monotonic()
+        self.timer = None
+        self.judged = False
+        self.probe = probe
+        self.sampled = sampled
+        # Resolved when the breaker opens while this call is still running
+        self.tripped = tripped
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    Closed: calls go through. After `failure_threshold` consecutive failures
+    the breaker opens and rejects calls for `open_seconds`, so callers fall
+    back at once instead of waiting for a timeout. A call still running after
+    `slow_call_seconds` is counted as failed right then, which lets a hanging
+    endpoint trip the breaker before any request actually times out. Once the
+    open period ends, a single probe call is let through (half-open): success
+    closes the breaker, failure opens it again. Opening also resolves
+    `tripped` on every call still in flight, so their callers can stop
+    waiting for an endpoint that is known to be down.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float,
+                 slow_call_seconds: float = None, max_open_seconds: float = None, enabled: bool = True):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.max_open_seconds = max_open_seconds or open_seconds
+        self.enabled = enabled
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.consecutive_failures = 0
+        self.latency = LatencyWindow()
+        self._probing = False
+        self._in_flight = set()
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def begin(self, timed: bool = True):
+        """
+        Admits a call, or returns None when the breaker rejects it.
+
+        Untimed calls (e.g. batched requests) are not subject to the slow-call
+        limit and do not feed the latency window.
+        """
+        probe = False
+        if self.enabled:
+            if self.state == OPEN:
+                if time.monotonic() < self.open_until:
+                    self.rejected += 1
+                    return None
+                self.state = HALF_OPEN
+                logger.info(f"Circuit for {self.name} half-open, probing")
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return None
+                self._probing = probe = True
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        call = BreakerCall(probe, sampled=timed, tripped=loop.create_future())
+        if self.enabled:
+            self._in_flight.add(call)
+            if timed and self.slow_call_seconds:
+                call.timer = loop.call_later(self.slow_call_seconds, self._slow, call)
+        return call
+
+    def end(self, call: BreakerCall, succeeded):
+        """
+        Reports how an admitted call finished: True, False, or None when it
+        was abandoned (cancelled) without a verdict. Repeated calls are ignored.
+        """
+        if call.timer is not None:
+            call.timer.cancel()
+            call.timer = None
+        if call.probe:
+            self._probing = False
+            call.probe = False
+        self._in_flight.discard(call)
+        if call.judged:
+            return
+        call.judged = True
+        if succeeded is None:
+            return
+        if succeeded:
+            if call.sampled:
+                self.latency.add(time.monotonic() - call.started)
+            self._success()
+        else:
+            self._failure()
+
+    def trip(self, seconds: float = None):
+        """Opens the breaker now, e.g. while the endpoint reports that its model is loading."""
+        self._open(min(max(seconds or 0.0, self.open_seconds), self.max_open_seconds))
+
+    def _slow(self, call: BreakerCall):
+        call.timer = None
+        if not call.judged:
+            call.judged = True
+            self.slow_calls += 1
+            self._failure()
+
+    def _success(self):
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            logger.info(f"Circuit for {self.name} closed")
+
+    def _failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.enabled and (self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold):
+            self._open(self.open_seconds)
+
+    def _open(self, seconds: float):
+        if not self.enabled:
+            return
+        if self.state != OPEN:
+            self.trips += 1
+            logger.warning(f"Circuit for {self.name} opened for {seconds:.1f}s "
+                           f"after {self.consecutive_failures} consecutive failures")
+        self.state = OPEN
+        self.open_until = max(self.open_until, time.monotonic() + seconds)
+        for call in self._in_flight:
+            if not call.tripped.done():
+                call.tripped.set_result(None)
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "state": self.state if self.enabled else "disabled",
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+            "open_for_seconds": round(max(self.open_until - time.monotonic(), 0.0), 2) if self.state == OPEN else 0.0,
+            "p95_seconds": round(p95, 4) if p95 is not None else None,
+        }
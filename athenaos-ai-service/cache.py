@@ -0,0 +1,230 @@
+# cache.py
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+from collections import OrderedDict
+from config import (
+    CLASSIFIER_CACHE_ENABLED, CLASSIFIER_CACHE_MAX_ENTRIES, CLASSIFIER_CACHE_MAX_BYTES,
+    CLASSIFIER_CACHE_TTL_SECONDS, CLASSIFIER_CACHE_DB, CLASSIFIER_CACHE_DB_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Disk writes waiting for the writer thread; past this many, new ones are dropped
+DISK_WRITE_QUEUE_LIMIT = 1024
+# Expired and over-capacity rows are deleted after every this many write batches
+DISK_PURGE_EVERY_BATCHES = 32
+
+
+def cache_key(api_url: str, text: str) -> str:
+    """Content address for one classifier call: model URL plus a hash of the text."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{api_url}#{digest}"
+
+
+class SQLiteCacheTier:
+    """
+    Optional on-disk tier shared by every worker on the host.
+
+    WAL mode lets several uvicorn processes read while one writes. Lookups
+    are single indexed reads on a local file and run inline, on a connection
+    with no busy timeout, so a locked database counts as a miss instead of
+    stalling the event loop. Writes are queued and committed in batches from
+    a worker thread; a write that finds the queue full is dropped. The same
+    thread periodically deletes expired rows and, above `max_entries`, the
+    rows closest to expiry.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int = CLASSIFIER_CACHE_DB_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifier_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS classifier_cache_expires_at ON classifier_cache (expires_at)")
+        self.reader = sqlite3.connect(path, timeout=0, check_same_thread=False, isolation_level=None)
+        self._pending = []
+        self._writer = None
+        self._batches = 0
+        self.busy_misses = 0
+        self.dropped_writes = 0
+        self.purged = 0
+
+    def get(self, key: str):
+        """Returns (encoded value, expires_at as wall-clock time), or None."""
+        try:
+            row = self.reader.execute(
+                "SELECT value, expires_at FROM classifier_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            self.busy_misses += 1
+            return None
+        return row
+
+    def set(self, key: str, encoded: str):
+        if len(self._pending) >= DISK_WRITE_QUEUE_LIMIT:
+            self.dropped_writes += 1
+            return
+        self._pending.append((key, encoded, time.time() + self.ttl))
+        if self._writer is not None and not self._writer.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop (scripts) there is nothing to block
+            batch, self._pending = self._pending, []
+            self._write(batch)
+            return
+        self._writer = loop.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+                self._batches += 1
+                if self._batches % DISK_PURGE_EVERY_BATCHES == 0:
+                    await asyncio.to_thread(self.purge_expired)
+            except sqlite3.Error as e:
+                logger.error(f"Classifier cache disk write of {len(batch)} entries failed: {e}")
+
+    def _write(self, batch):
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO classifier_cache (key, value, expires_at) VALUES (?, ?, ?)", batch
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def purge_expired(self):
+        """Deletes expired rows, then the rows closest to expiry beyond `max_entries`."""
+        purged = self.conn.execute("DELETE FROM classifier_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        purged += self.conn.execute(
+            "DELETE FROM classifier_cache WHERE key IN "
+            "(SELECT key FROM classifier_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.purged += purged
+
+    def stats(self) -> dict:
+        return {"pending_writes": len(self._pending), "busy_misses": self.busy_misses,
+                "dropped_writes": self.dropped_writes, "purged": self.purged}
+
+
+class ClassifierCache:
+    """
+    Bounded LRU + TTL cache for Inference API responses.
+
+    Entries are evicted least-recently-used first when either the entry count
+    or the approximate byte size (length of the JSON encoding) exceeds its cap.
+    Cached responses are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries=CLASSIFIER_CACHE_MAX_ENTRIES, max_bytes=CLASSIFIER_CACHE_MAX_BYTES,
+                 ttl=CLASSIFIER_CACHE_TTL_SECONDS, db_path=CLASSIFIER_CACHE_DB):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_hits = 0
+        self.disk = None
+        if db_path:
+            try:
+                self.disk = SQLiteCacheTier(db_path, ttl)
+                self.disk.purge_expired()
+            except sqlite3.Error as e:
+                logger.error(f"Classifier cache disk tier disabled ({db_path}): {e}")
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, size, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+            self.expirations += 1
+
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Classifier cache disk read failed: {e}")
+                row = None
+            if row is not None:
+                encoded, expires_at = row
+                value = json.loads(encoded)
+                # Only for the time the shared row has left, not a fresh TTL
+                self._insert(key, value, len(encoded), expires_at - time.time())
+                self.disk_hits += 1
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value):
+        # Failed, empty or error-shaped ({"error": ...}) responses are never cached
+        if not value or not isinstance(value, list):
+            return
+        encoded = json.dumps(value, separators=(",", ":"))
+        self._insert(key, value, len(encoded), self.ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, encoded)
+            except sqlite3.Error as e:
+                logger.error(f"Classifier cache disk write failed: {e}")
+
+    def _insert(self, key, value, size, ttl):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "disk_tier": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+classifier_cache = ClassifierCache() if CLASSIFIER_CACHE_ENABLED else None
+
+def cache_stats() -> dict:
+    return classifier_cache.stats() if classifier_cache is not None else {}
@@ -0,0 +1,119 @@
+# coalesce.py
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers with the same
+    key await the same task instead of starting their own.
+
+    The shared task is shielded, so a caller that gives up (a deadline, a
+    disconnect) does not cancel it for the others. With `linger` > 0 a task
+    that returned a result `keep` accepts is kept that many seconds, so a
+    caller arriving just after completion still gets the same result.
+    Failures, and results `keep` rejects, are dropped as soon as the call
+    finishes so that a retry runs again.
+    """
+
+    def __init__(self, linger: float = 0.0, keep=None):
+        self.linger = linger
+        self.keep = keep
+        self._tasks = {}  # key -> (task, finished_at or None)
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, factory):
+        """Returns the result of `factory()`, shared with concurrent callers of `key`."""
+        self.calls += 1
+        entry = self._tasks.get(key)
+        if entry is not None:
+            task, finished_at = entry
+            if finished_at is None or time.monotonic() - finished_at < self.linger:
+                self.shared += 1
+                return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(factory())
+        self._tasks[key] = (task, None)
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        entry = self._tasks.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        if task.cancelled():
+            succeeded = False
+        elif task.exception() is not None:
+            # Every caller may have given up already; this also marks it retrieved
+            logger.debug(f"Single-flight call failed: {task.exception()!r}")
+            succeeded = False
+        else:
+            succeeded = self.keep is None or self.keep(task.result())
+        if self.linger > 0 and succeeded:
+            self._tasks[key] = (task, time.monotonic())
+            asyncio.get_running_loop().call_later(self.linger, self._expire, key, task)
+        else:
+            del self._tasks[key]
+
+    def _expire(self, key, task):
+        entry = self._tasks.get(key)
+        if entry is not None and entry[0] is task:
+            del self._tasks[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": sum(1 for _, finished_at in self._tasks.values() if finished_at is None),
+                "calls": self.calls, "shared": self.shared}
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, created on first use and dropped once no
+    request holds or waits for it.
+
+    Locks are per process: requests for one session are serialized within a
+    worker. Across workers, the shared session backends refuse a save that
+    lost a race (SessionConflict) instead.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, users]
+        self.waits = 0
+
+    def hold(self, key):
+        return _KeyedLockContext(self, key)
+
+    def stats(self) -> dict:
+        return {"held": len(self._locks), "waits": self.waits}
+
+
+class _KeyedLockContext:
+    __slots__ = ("owner", "key")
+
+    def __init__(self, owner, key):
+        self.owner = owner
+        self.key = key
+
+    async def __aenter__(self):
+        entry = self.owner._locks.setdefault(self.key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        if entry[0].locked():
+            self.owner.waits += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._leave(entry)
+            raise
+
+    async def __aexit__(self, *exc_info):
+        entry = self.owner._locks[self.key]
+        entry[0].release()
+        self._leave(entry)
+
+    def _leave(self, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.owner._locks[self.key]
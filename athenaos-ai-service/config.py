@@ -21,11 +21,156 @@ GENERATIVE_MODEL_ID = "llama-3.1-8b-instant"
 # ==============================================================================
 # API URLs for the models, replacing the local model IDs
 # We use these endpoints to call the models via API instead of loading them locally
-API_BASE_URL = "https://api-inference.huggingface.co/models/"
+# HF_API_BASE_URL can point the service at a local stub for benchmarking
+API_BASE_URL = os.getenv("HF_API_BASE_URL", "https://api-inference.huggingface.co/models/")
 MODERATION_API_URL = API_BASE_URL + "facebook/roberta-hate-speech-dynabench-r4-target"
 SENTIMENT_API_URL = API_BASE_URL + "cardiffnlp/twitter-roberta-base-sentiment-latest"
 EMOTION_API_URL = API_BASE_URL + "bhadresh-savani/distilbert-base-uncased-emotion"
 
+# Per-request timeout (seconds) for each Inference API call
+HF_REQUEST_TIMEOUT = float(os.getenv("HF_REQUEST_TIMEOUT", "10"))
+
+# Shared connection pool for the Inference API (created on app startup)
+HF_POOL_MAX_CONNECTIONS = int(os.getenv("HF_POOL_MAX_CONNECTIONS", "100"))
+HF_POOL_MAX_KEEPALIVE = int(os.getenv("HF_POOL_MAX_KEEPALIVE", "100"))
+HF_KEEPALIVE_EXPIRY = float(os.getenv("HF_KEEPALIVE_EXPIRY", "30"))
+# Inference API requests in flight at once, across all connections; with HTTP/2
+# several of them share one connection, so this is not a connection count
+HF_MAX_CONCURRENT_REQUESTS = int(os.getenv("HF_MAX_CONCURRENT_REQUESTS", str(HF_POOL_MAX_CONNECTIONS)))
+# HTTP/2 is only used when the optional 'h2' package is installed
+HF_HTTP2 = os.getenv("HF_HTTP2", "true").lower() == "true"
+
+# Circuit breaker per upstream endpoint: opens after BREAKER_FAILURE_THRESHOLD
+# consecutive failures, rejects calls for BREAKER_OPEN_SECONDS, then lets one
+# probe through. An Inference API call still running after HF_SLOW_CALL_SECONDS
+# counts as failed. A 503 "model loading" opens it for the model's estimated
+# load time, capped at BREAKER_MAX_OPEN_SECONDS.
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "60"))
+HF_SLOW_CALL_SECONDS = float(os.getenv("HF_SLOW_CALL_SECONDS", "3"))
+
+# Hedging: a classifier call not answered by the endpoint's observed p95 latency
+# gets a second identical request, and the first good answer wins. The p95 is
+# used once HF_HEDGE_MIN_SAMPLES calls have been measured.
+HF_HEDGING_ENABLED = os.getenv("HF_HEDGING_ENABLED", "false").lower() == "true"
+HF_HEDGE_MIN_SAMPLES = int(os.getenv("HF_HEDGE_MIN_SAMPLES", "20"))
+HF_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HF_HEDGE_MIN_DELAY_SECONDS", "0.05"))
+
+# In-process cache of classifier results, keyed by model URL + text hash.
+# CLASSIFIER_CACHE_DB optionally names a SQLite file shared by all workers.
+CLASSIFIER_CACHE_ENABLED = os.getenv("CLASSIFIER_CACHE_ENABLED", "true").lower() == "true"
+CLASSIFIER_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFIER_CACHE_MAX_ENTRIES", "10000"))
+CLASSIFIER_CACHE_MAX_BYTES = int(os.getenv("CLASSIFIER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CLASSIFIER_CACHE_TTL_SECONDS = float(os.getenv("CLASSIFIER_CACHE_TTL_SECONDS", "3600"))
+CLASSIFIER_CACHE_DB = os.getenv("CLASSIFIER_CACHE_DB", "")
+# Row cap for the shared file; the rows closest to expiry are deleted first
+CLASSIFIER_CACHE_DB_MAX_ENTRIES = int(os.getenv("CLASSIFIER_CACHE_DB_MAX_ENTRIES", "100000"))
+
+# Batch analysis (/analyze/batch): texts per Inference API request, batched
+# requests in flight per model, and the timeout for one batched request
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "32"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_TEXTS = int(os.getenv("BATCH_MAX_TEXTS", "10000"))
+HF_BATCH_TIMEOUT = float(os.getenv("HF_BATCH_TIMEOUT", "30"))
+
+# Overall budget (seconds) for the parallel moderation/sentiment/emotion calls.
+# Results still missing when it expires fall back to neutral defaults.
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "4"))
+
+# Crisis messages are answered without waiting on the network. This is how long
+# (seconds) the crisis reply may wait for ML analysis to include it; 0 returns
+# the regex-only analysis immediately. The rest finishes in the background.
+CRISIS_ANALYSIS_WAIT_SECONDS = float(os.getenv("CRISIS_ANALYSIS_WAIT_SECONDS", "0"))
+
+
+# ==============================================================================
+# SESSION STORE
+# ==============================================================================
+# Messages kept per session; generation and repetition analysis only look at these
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+# Sessions idle for longer than this are dropped
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+# Hard cap on live sessions; the least recently used ones are evicted first
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Repetition tracking looks at the last N assistant replies; 0 means every reply
+# still held in the session's ring buffer (the behaviour of a full rescan)
+REPETITION_WINDOW = int(os.getenv("REPETITION_WINDOW", "0"))
+# Where sessions live: "memory" (single worker), "sqlite" (workers on one host)
+# or "redis" (workers across hosts; needs the optional 'redis' package)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite")
+# SQLite saves that queue up while a transaction is being written share the next one, up to this many
+SESSION_SQLITE_BATCH_SIZE = int(os.getenv("SESSION_SQLITE_BATCH_SIZE", "64"))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_MAX_CONNECTIONS = int(os.getenv("SESSION_REDIS_MAX_CONNECTIONS", "50"))
+# A /chat request repeating the session's in-progress (or just successfully answered) input
+# within this many seconds shares that response instead of running again
+CHAT_DEDUP_WINDOW_SECONDS = float(os.getenv("CHAT_DEDUP_WINDOW_SECONDS", "10"))
+
+
+# ==============================================================================
+# EMOTION TIMELINE
+# ==============================================================================
+# Each session keeps running emotion aggregates for /sessions/{id}/emotions
+# (emotions.py). Turns are summed into EMOTION_TIMELINE_BUCKETS time buckets,
+# EMOTION_BUCKET_SECONDS wide at first; when a conversation outgrows them,
+# neighbouring buckets merge and the width doubles.
+EMOTION_TIMELINE_BUCKETS = int(os.getenv("EMOTION_TIMELINE_BUCKETS", "32"))
+EMOTION_BUCKET_SECONDS = float(os.getenv("EMOTION_BUCKET_SECONDS", "60"))
+# Moving average per emotion label over about this many recent turns
+EMOTION_ROLLING_TURNS = int(os.getenv("EMOTION_ROLLING_TURNS", "10"))
+# Mood score: a turn's weight halves every this many seconds
+EMOTION_MOOD_HALF_LIFE_SECONDS = float(os.getenv("EMOTION_MOOD_HALF_LIFE_SECONDS", "1800"))
+
+
+# ==============================================================================
+# PROMPT ASSEMBLY
+# ==============================================================================
+# Token budget for the whole generation prompt: system prompt, summary, recent
+# turns and the new message. Recent turns fill what is left, newest first, and
+# older turns are folded into a rolling summary in the background.
+# 0 keeps the old fixed window of the last 6 messages and no summary.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1024"))
+# Length cap (tokens) for the rolling summary, and the model that writes it
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+SUMMARY_MODEL_ID = os.getenv("SUMMARY_MODEL_ID", GENERATIVE_MODEL_ID)
+
+
+# ==============================================================================
+# LOCAL CLASSIFIER
+# ==============================================================================
+# In-process lexicon scorer for sentiment and emotion (local_classifier.py). It
+# answers in microseconds without network access, with lower accuracy than
+# the Inference API models. Moderation always uses the Inference API.
+#   off       Inference API only; failed calls leave 'unknown' and no emotions
+#   fallback  Inference API first; the scorer fills in calls that failed,
+#             were skipped by an open circuit or missed the analysis deadline
+#   race      the Inference API gets LOCAL_CLASSIFIER_RACE_SECONDS, then the
+#             scorer answers; the API call finishes in the background and
+#             fills the classifier cache for later messages
+#   primary   scorer only; no Inference API calls for sentiment and emotion
+LOCAL_CLASSIFIER_MODE = os.getenv("LOCAL_CLASSIFIER_MODE", "fallback").lower()
+LOCAL_CLASSIFIER_RACE_SECONDS = float(os.getenv("LOCAL_CLASSIFIER_RACE_SECONDS", "0.3"))
+
+
+# ==============================================================================
+# ADMISSION CONTROL
+# ==============================================================================
+# At most ADMISSION_MAX_CONCURRENT chats are in their analysis/generation stages
+# at once; up to ADMISSION_QUEUE_SIZE more wait for a slot, for at most
+# ADMISSION_QUEUE_TIMEOUT_SECONDS. Past either bound a chat gets 503 with
+# Retry-After right away instead of after the caller's timeout. Crisis messages
+# never wait and are never shed: they run over the limit while it is full.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "128"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Admitted plus queued routine chats per tenant (the X-Tenant-ID header, one per
+# user from the Node backend); more get 429 with Retry-After. 0 disables it.
+ADMISSION_TENANT_LIMIT = int(os.getenv("ADMISSION_TENANT_LIMIT", "4"))
+
 
 # ==============================================================================
 # ENHANCED CRISIS & CONCERN PATTERNS
@@ -79,6 +224,49 @@ CBT_INTERVENTIONS = {
     ]
 }
 
+# ==============================================================================
+# LOCAL SENTIMENT & EMOTION LEXICON
+# ==============================================================================
+# Word lists for the local classifier, by the emotion model's labels. Emotion
+# words also count toward sentiment (joy and love positive, sadness, anger and
+# fear negative). Plural and third-person forms ending in 's' are matched too.
+LOCAL_EMOTION_LEXICON = {
+    'sadness': """sad sadness sadder unhappy depressed depressing depression miserable lonely loneliness alone
+        hopeless heartbroken heartbreak grief grieving cry crying cried tears empty numb hurt hurting lost
+        worthless gloomy disappointed disappointing disappointment regret regretting guilty guilt ashamed shame
+        exhausted drained broken pain painful mourning miss missing isolated rejected abandoned failure failed
+        useless defeated discouraged devastated sorrow unloved neglected helpless pointless meaningless
+        homesick tearful crushed despair""",
+    'joy': """happy happier happiness glad joy joyful excited exciting wonderful amazing fantastic awesome proud
+        relieved relief calm peaceful content grateful thankful hopeful optimistic fun enjoy enjoyed enjoying
+        cheerful delighted pleased confident accomplished energized motivated satisfied laugh laughing smile
+        smiling successful thrilled ecstatic blessed refreshed productive excellent celebrate celebrating""",
+    'love': """love loved loving lovely adore adored caring cared affection affectionate beloved tender romantic
+        sweet warm supportive supported compassionate passionate fond cherish cherished hug hugs accepted
+        appreciated appreciate devoted connected""",
+    'anger': """angry anger mad furious annoyed annoying irritated irritable frustrated frustrating frustration
+        rage hate hated hating resent resentful resentment bitter pissed outraged hostile jealous betrayed unfair
+        disgusted disgusting offended infuriating livid insulted cheated disrespected""",
+    'fear': """afraid scared fear fearful anxious anxiety worried worry worrying nervous panic panicking panicked
+        terrified frightened stressed stress stressful overwhelmed overwhelming tense uneasy insecure paranoid
+        dread dreading threatened unsafe shaky restless apprehensive terror phobia intimidated vulnerable
+        helplessness racing""",
+    'surprise': """surprised surprise surprising shocked shock amazed astonished unexpected unexpectedly stunned
+        startled curious strange weird speechless""",
+}
+# Words that carry sentiment without pointing at one emotion
+LOCAL_SENTIMENT_LEXICON = {
+    'positive': """good great nice better best helpful helped helps improve improved improving progress thanks
+        thank beautiful safe strong easier positive support hope""",
+    'negative': """bad worse worst awful terrible horrible hard difficult struggle struggling struggled problem
+        problems wrong sick ruin ruined mess tired suffer suffering nightmare negative trouble burden
+        lose losing""",
+}
+# Words that count one and a half times
+LOCAL_STRONG_WORDS = """devastated heartbroken hopeless worthless despair furious livid rage hate terrified
+    panic ecstatic thrilled adore love awful terrible horrible worst"""
+
+
 # ==============================================================================
 # GENERAL & RESOURCE CONFIGS
 # ==============================================================================
@@ -0,0 +1,194 @@
+# emotions.py
+import time
+import math
+from array import array
+from local_classifier import EMOTION_LABELS, EMOTION_VALENCE
+from config import (
+    EMOTION_TIMELINE_BUCKETS, EMOTION_BUCKET_SECONDS, EMOTION_ROLLING_TURNS, EMOTION_MOOD_HALF_LIFE_SECONDS
+)
+
+LABEL_INDEX = {label: index for index, label in enumerate(EMOTION_LABELS)}
+VALENCES = tuple(EMOTION_VALENCE[label] for label in EMOTION_LABELS)
+LABEL_COUNT = len(EMOTION_LABELS)
+ROLLING_ALPHA = 2.0 / (EMOTION_ROLLING_TURNS + 1)
+
+
+class EmotionTimeline:
+    """
+    Emotion aggregates for one session, updated once per analyzed turn.
+
+    `rolling` is a moving average per emotion label over roughly the last
+    EMOTION_ROLLING_TURNS turns. `mood` is the turns' valence (sadness, anger
+    and fear count -1, joy and love +1) averaged with weights that halve
+    every EMOTION_MOOD_HALF_LIFE_SECONDS, so it follows recent turns while
+    older ones fade out.
+
+    Turns are also summed into `size` time buckets starting at the first
+    turn: a turn count, per-label score sums and a valence sum each. When a
+    turn falls past the last bucket, neighbouring buckets are merged pairwise
+    and the width doubles, so a session never holds more than `size` buckets
+    and reads cost O(buckets) however long the conversation runs.
+
+    `first_seq` is the session's message count when the timeline began; 0
+    means it has seen the conversation from its first message.
+    """
+    __slots__ = ('size', 'width', 'started', 'updated', 'turns', 'first_seq',
+                 'rolling', 'mood', 'mood_weight', 'counts', 'sums', 'valence')
+
+    def __init__(self, first_seq=0, size=EMOTION_TIMELINE_BUCKETS, width=EMOTION_BUCKET_SECONDS):
+        self.size = size
+        self.width = width
+        self.started = None
+        self.updated = None
+        self.turns = 0
+        self.first_seq = first_seq
+        self.rolling = [0.0] * LABEL_COUNT
+        self.mood = 0.0
+        self.mood_weight = 0.0
+        # Fixed-size typed arrays: about 1 KB per session at 32 buckets
+        self.counts = array('I', bytes(4 * size))
+        self.sums = array('f', bytes(4 * size * LABEL_COUNT))
+        self.valence = array('f', bytes(4 * size))
+
+    def record(self, emotions, at=None):
+        """
+        Adds one turn's emotions ([{label, score}, ...] as in the analysis).
+
+        Returns:
+            bool: False if none of the labels are known, and nothing was recorded.
+        """
+        scores = [0.0] * LABEL_COUNT
+        known = False
+        for emotion in emotions:
+            index = LABEL_INDEX.get(emotion['label'].lower())
+            if index is not None:
+                scores[index] = emotion['score']
+                known = True
+        if not known:
+            return False
+
+        at = time.time() if at is None else at
+        if self.started is None:
+            self.started = at
+        valence = sum(score * weight for score, weight in zip(scores, VALENCES))
+
+        if self.turns:
+            self.rolling = [mean + ROLLING_ALPHA * (score - mean) for mean, score in zip(self.rolling, scores)]
+        else:
+            self.rolling = scores
+        decay = 0.5 ** (max(at - self.updated, 0.0) / EMOTION_MOOD_HALF_LIFE_SECONDS) if self.updated is not None else 0.0
+        self.mood_weight = self.mood_weight * decay + 1.0
+        self.mood += (valence - self.mood) / self.mood_weight
+
+        index = self._bucket(at)
+        while index >= self.size:
+            self._merge_pairs()
+            index = self._bucket(at)
+        self.counts[index] += 1
+        offset = index * LABEL_COUNT
+        for label_index, score in enumerate(scores):
+            self.sums[offset + label_index] += score
+        self.valence[index] += valence
+
+        self.turns += 1
+        self.updated = max(at, self.updated or at)
+        return True
+
+    def _bucket(self, at):
+        # A clock step backwards lands in the first bucket rather than before it
+        return max(int((at - self.started) // self.width), 0)
+
+    def _merge_pairs(self):
+        """Halves the resolution: buckets 2i and 2i+1 become bucket i, and the width doubles."""
+        size = self.size
+        for target in range(size):
+            total = 0
+            label_sums = [0.0] * LABEL_COUNT
+            valence = 0.0
+            for source in (2 * target, 2 * target + 1):
+                if source < size:
+                    total += self.counts[source]
+                    offset = source * LABEL_COUNT
+                    for label_index in range(LABEL_COUNT):
+                        label_sums[label_index] += self.sums[offset + label_index]
+                    valence += self.valence[source]
+            self.counts[target] = total
+            self.sums[target * LABEL_COUNT:(target + 1) * LABEL_COUNT] = array('f', label_sums)
+            self.valence[target] = valence
+        self.width *= 2
+
+    def _used(self):
+        """Number of buckets up to the latest turn."""
+        return self._bucket(self.updated) + 1 if self.turns else 0
+
+    def _label_sums(self, first, last):
+        """Per-label score sums over buckets first..last-1."""
+        sums, end = self.sums, last * LABEL_COUNT
+        return [sum(sums[first * LABEL_COUNT + label_index:end:LABEL_COUNT]) for label_index in range(LABEL_COUNT)]
+
+    def summary(self) -> dict:
+        """The running aggregates, in O(buckets) for the all-time means."""
+        means = self._label_sums(0, self._used())
+        return {
+            "turns": self.turns,
+            "complete": self.first_seq == 0,
+            "started": self.started,
+            "updated": self.updated,
+            "mood": round(self.mood, 4),
+            "rolling": _ranked(self.rolling),
+            "means": _ranked([total / self.turns for total in means] if self.turns else means),
+            "bucket_seconds": self.width,
+        }
+
+    def series(self, points=None) -> list:
+        """
+        Non-empty buckets, oldest first, merged down to at most `points`:
+        [{"start", "end", "turns", "mood", "emotions": [{label, score}, ...]}].
+        """
+        used = self._used()
+        group = max(math.ceil(used / points), 1) if points else 1
+        series = []
+        for first in range(0, used, group):
+            last = min(first + group, used)
+            turns = sum(self.counts[first:last])
+            if not turns:
+                continue
+            label_sums = self._label_sums(first, last)
+            series.append({
+                "start": self.started + first * self.width,
+                "end": self.started + last * self.width,
+                "turns": turns,
+                "mood": round(sum(self.valence[first:last]) / turns, 4),
+                "emotions": _ranked([total / turns for total in label_sums]),
+            })
+        return series
+
+    def to_list(self) -> list:
+        """Compact encoding for SessionState.dumps; only buckets in use are written."""
+        used = self._used()
+        return [
+            self.width, self.started, self.updated, self.turns, self.first_seq,
+            [round(mean, 4) for mean in self.rolling], round(self.mood, 6), round(self.mood_weight, 6),
+            list(self.counts[:used]), [round(total, 4) for total in self.sums[:used * LABEL_COUNT]],
+            [round(total, 4) for total in self.valence[:used]],
+        ]
+
+    @classmethod
+    def from_list(cls, data, size=EMOTION_TIMELINE_BUCKETS):
+        width, started, updated, turns, first_seq, rolling, mood, mood_weight, counts, sums, valence = data
+        # Written with more buckets than are configured now: keeps its own size
+        timeline = cls(first_seq, max(size, len(counts)), width)
+        timeline.started, timeline.updated, timeline.turns = started, updated, turns
+        timeline.rolling, timeline.mood, timeline.mood_weight = rolling, mood, mood_weight
+        timeline.counts[:len(counts)] = array('I', counts)
+        timeline.sums[:len(sums)] = array('f', sums)
+        timeline.valence[:len(valence)] = array('f', valence)
+        return timeline
+
+
+def _ranked(values):
+    """[{label, score}] of the labels with a non-zero value, strongest first."""
+    return sorted(
+        ({"label": label, "score": round(value, 4)} for label, value in zip(EMOTION_LABELS, values) if value > 0),
+        key=lambda item: item["score"], reverse=True
+    )
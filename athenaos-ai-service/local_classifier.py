@@ -0,0 +1,169 @@
+# local_classifier.py
+import re
+import math
+import logging
+from functools import lru_cache
+from telemetry import local_classifier_answers
+from config import (
+    SENTIMENT_API_URL, EMOTION_API_URL, LOCAL_CLASSIFIER_MODE,
+    LOCAL_EMOTION_LEXICON, LOCAL_SENTIMENT_LEXICON, LOCAL_STRONG_WORDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Label order and names of the Inference API models this stands in for
+EMOTION_LABELS = ('sadness', 'joy', 'love', 'anger', 'fear', 'surprise')
+EMOTION_VALENCE = {'sadness': -1.0, 'joy': 1.0, 'love': 1.0, 'anger': -1.0, 'fear': -1.0, 'surprise': 0.0}
+# "not happy" counts toward sadness; a negated negative emotion counts toward none
+NEGATED_EMOTION = {'joy': 'sadness', 'love': 'sadness'}
+
+NEGATORS = frozenset("not no never nobody nothing nowhere neither nor cannot without hardly barely".split())
+INTENSIFIERS = frozenset("very so really extremely incredibly totally completely absolutely too super deeply "
+                         "truly utterly awfully terribly".split())
+DOWNTONERS = frozenset("bit little slightly somewhat kinda sorta fairly mildly".split())
+CONTRASTS = frozenset(("but", "however", "though", "yet"))
+CLAUSE_BREAKS = frozenset(".,;:!?")
+# Words a negator reaches past
+NEGATION_SCOPE = 3
+STRONG_WEIGHT = 1.5
+# A negated word counts this much toward the opposite valence
+NEGATED_WEIGHT = 0.8
+
+# Logit scale per unit of evidence; the neutral sentiment logit is what a
+# message needs to outweigh to read as positive or negative
+EMOTION_SCALE = 2.2
+SENTIMENT_SCALE = 1.2
+NEUTRAL_LOGIT = 0.8
+
+_TOKENS = re.compile(r"[a-z']+|[.,;:!?]")
+
+
+def _build_lexicon():
+    """word -> (emotion label or None, valence, weight)"""
+    strong = set(LOCAL_STRONG_WORDS.split())
+    lexicon = {}
+    for valence, words in ((1.0, LOCAL_SENTIMENT_LEXICON['positive']), (-1.0, LOCAL_SENTIMENT_LEXICON['negative'])):
+        for word in words.split():
+            lexicon[word] = (None, valence, STRONG_WEIGHT if word in strong else 1.0)
+    for emotion, words in LOCAL_EMOTION_LEXICON.items():
+        for word in words.split():
+            lexicon[word] = (emotion, EMOTION_VALENCE[emotion], STRONG_WEIGHT if word in strong else 1.0)
+    return lexicon
+
+LEXICON = _build_lexicon()
+
+
+def _lookup(token):
+    entry = LEXICON.get(token)
+    if entry is None and len(token) > 3 and token[-1] == 's':
+        entry = LEXICON.get(token[:-1])
+    return entry
+
+# Sentiment and emotion are scored from the same evidence, usually moments apart
+@lru_cache(maxsize=256)
+def score_text(text):
+    """
+    Lexicon evidence for one message.
+
+    Negators flip the valence of the next few words at reduced strength,
+    intensifiers and downtoners scale the next sentiment word, a contrast
+    word ("but") halves what came before it, and each exclamation mark adds
+    a tenth (up to three).
+
+    Returns:
+        tuple: (dict of emotion label -> evidence, positive evidence, negative evidence)
+    """
+    emotions = dict.fromkeys(EMOTION_LABELS, 0.0)
+    positive = negative = 0.0
+    negation = 0
+    boost = 1.0
+    exclamations = 0
+    for token in _TOKENS.findall(text.lower()):
+        if token in CLAUSE_BREAKS:
+            negation, boost = 0, 1.0
+            exclamations += token == '!'
+            continue
+        if token in CONTRASTS:
+            for label in emotions:
+                emotions[label] *= 0.5
+            positive *= 0.5
+            negative *= 0.5
+            negation, boost = 0, 1.0
+            continue
+        if token in NEGATORS or token.endswith("n't"):
+            negation = NEGATION_SCOPE
+            continue
+        if token in INTENSIFIERS:
+            boost *= 1.5
+        elif token in DOWNTONERS:
+            boost *= 0.5
+        else:
+            entry = _lookup(token)
+            if entry is not None:
+                emotion, valence, weight = entry
+                weight *= boost
+                if negation:
+                    emotion = NEGATED_EMOTION.get(emotion)
+                    valence = -valence
+                    weight *= NEGATED_WEIGHT
+                if emotion is not None:
+                    emotions[emotion] += weight
+                if valence > 0:
+                    positive += valence * weight
+                elif valence < 0:
+                    negative -= valence * weight
+                boost = 1.0
+        if negation:
+            negation -= 1
+
+    amplify = 1.0 + 0.1 * min(exclamations, 3)
+    return {label: value * amplify for label, value in emotions.items()}, positive * amplify, negative * amplify
+
+def _softmax(pairs):
+    peak = max(logit for _, logit in pairs)
+    weights = [(label, math.exp(logit - peak)) for label, logit in pairs]
+    total = sum(weight for _, weight in weights)
+    return sorted(({'label': label, 'score': weight / total} for label, weight in weights),
+                  key=lambda item: item['score'], reverse=True)
+
+def classify_sentiment(text):
+    """Sentiment in the Inference API's response shape: [[{label, score}, ...]], best first."""
+    _, positive, negative = score_text(text)
+    return [_softmax([
+        ('negative', negative * SENTIMENT_SCALE), ('neutral', NEUTRAL_LOGIT), ('positive', positive * SENTIMENT_SCALE)
+    ])]
+
+def classify_emotion(text):
+    """
+    Emotions in the Inference API's response shape, best first. A message
+    without any emotion words gets no labels rather than a uniform guess.
+    """
+    emotions, _, _ = score_text(text)
+    if not any(emotions.values()):
+        return [[]]
+    return [_softmax([(label, value * EMOTION_SCALE) for label, value in emotions.items()])]
+
+# Inference API endpoints the local scorer can answer for
+LOCAL_MODELS = {SENTIMENT_API_URL: classify_sentiment, EMOTION_API_URL: classify_emotion}
+LOCAL_NAMES = {SENTIMENT_API_URL: "sentiment", EMOTION_API_URL: "emotion"}
+
+MODE = LOCAL_CLASSIFIER_MODE
+if MODE not in ("off", "fallback", "race", "primary"):
+    logger.warning(f"Unknown LOCAL_CLASSIFIER_MODE '{MODE}', using fallback")
+    MODE = "fallback"
+
+def handles(api_url):
+    """Whether the local scorer may answer for `api_url` in the configured mode."""
+    return MODE != "off" and api_url in LOCAL_MODELS
+
+def local_response(api_url, text, reason):
+    """The local scorer's response for `api_url`, counted under `reason` (primary, fallback or race)."""
+    local_classifier_answers.labels(LOCAL_NAMES[api_url], reason).inc()
+    return LOCAL_MODELS[api_url](text)
+
+def fill_missing(responses, text):
+    """Fills in the responses the Inference API did not deliver, where the local scorer can."""
+    for api_url, response in responses.items():
+        if response is None and handles(api_url):
+            responses[api_url] = local_response(api_url, text, "fallback")
+    return responses
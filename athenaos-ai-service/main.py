@@ -1,19 +1,41 @@
 # main.py
+import json
+import asyncio
 import traceback
 import random
 import uuid
+from contextlib import asynccontextmanager, aclosing
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
 import logging
-from groq import Groq, APIError
+from groq import AsyncGroq, APIError
 
 # Import configs and processing functions
-from config import GROQ_API_KEY, GENERATIVE_MODEL_ID, MENTAL_HEALTH_RESOURCES
+from config import (
+    GROQ_API_KEY, GENERATIVE_MODEL_ID, MENTAL_HEALTH_RESOURCES,
+    BATCH_SIZE, BATCH_CONCURRENCY, BATCH_MAX_TEXTS, CHAT_DEDUP_WINDOW_SECONDS,
+    BREAKER_ENABLED, BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SECONDS, PROMPT_TOKEN_BUDGET,
+    ADMISSION_ENABLED, ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ADMISSION_TENANT_LIMIT
+)
+from models import start_http_client, close_http_client, pool_stats, classifier_flight, breaker_stats
+from coalesce import SingleFlight, KeyedLocks
+from breaker import CircuitBreaker
+from admission import AdmissionController, Overloaded
+from telemetry import (
+    span, track_request, detach_request, render_metrics, upstream_errors, upstream_in_flight, prompt_tokens,
+    history_syncs
+)
+from prompting import build_prompt, message_tokens, summarize_turns
+from cache import cache_stats
+from sessions import create_session_store, SessionConflict
 from processing import (
-    sanitize_input, moderate_text, combined_sentiment_analysis,
+    sanitize_input, analyze_message, analyze_crisis_message, enhanced_crisis_detection,
+    combined_sentiment_analysis_batch,
     generate_anti_repetition_instruction
 )
 
@@ -25,18 +47,60 @@ if not GROQ_API_KEY:
     logger.error("GROQ_API_KEY not found in environment variables.")
     client = None
 else:
-    client = Groq(api_key=GROQ_API_KEY)
+    client = AsyncGroq(api_key=GROQ_API_KEY)
     logger.info(f"Groq client configured for model: {GENERATIVE_MODEL_ID}")
 
+# While Groq keeps failing, chats get the 503 at once instead of after its timeout.
+# Generation has no slow-call limit; a long reply is not a failure.
+groq_breaker = CircuitBreaker(
+    "groq", failure_threshold=BREAKER_FAILURE_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS, enabled=BREAKER_ENABLED
+)
+
+# Chats past this capacity are shed at once with a Retry-After rather than
+# queueing until the caller times out; crisis messages are always let in
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    tenant_limit=ADMISSION_TENANT_LIMIT, enabled=ADMISSION_ENABLED
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The pooled Inference API client lives exactly as long as the app
+    await start_http_client()
+    yield
+    await close_http_client()
+    await session_store.close()
+    if client:
+        await client.close()
+
 # Configure FastAPI app
 app = FastAPI(
     title="Athena AI Therapist API (API-Only Architecture with Groq/Llama3)",
     version="8.0.0",
-    description="A lightweight, API-powered AI therapist with CBT integration."
+    description="A lightweight, API-powered AI therapist with CBT integration.",
+    lifespan=lifespan
 )
 
-# In-memory conversation history (for simplicity)
-conversation_history = {}
+# Conversation history: a bounded ring buffer per session, kept in memory or in a
+# shared backend (SESSION_BACKEND) so several workers can serve one conversation
+session_store = create_session_store()
+
+# Requests for one session run one at a time, so history updates never interleave;
+# a resubmitted /chat message attaches to the response already being produced
+session_locks = KeyedLocks()
+# Only replies committed to the history are replayed; a shed, an upstream
+# error or the fallback reply is what a user retries after
+chat_flight = SingleFlight(linger=CHAT_DEDUP_WINDOW_SECONDS,
+                           keep=lambda response: response.history_cursor is not None)
+
+HISTORY_RESYNC_DETAIL = "History resync required: resend the full history without history_cursor."
+# Attempts for background session updates that lose a save to another worker
+SESSION_SAVE_ATTEMPTS = 3
+
+# Strong references to work that outlives its request (see record_full_analysis)
+background_tasks = set()
+# Running summary refreshes, at most one per session
+summary_refreshes = {}
 
 # --- Pydantic Models ---
 class HistoryItem(BaseModel):
@@ -65,8 +129,19 @@ class AnalysisResult(BaseModel):
 
 class ChatRequest(BaseModel):
     user_input: str
-    history: List[HistoryItem] = Field(default_factory=list)
+    history: List[HistoryItem] = Field(
+        default_factory=list,
+        description="Recent history, or with history_cursor only the messages added since that cursor"
+    )
     session_id: Optional[str] = None
+    history_cursor: Optional[str] = Field(
+        None, description="history_cursor from the session's previous response; 409 means resend the full history"
+    )
+
+class BatchAnalysisRequest(BaseModel):
+    texts: List[str] = Field(..., description="Messages to analyze; results refer to them by index")
+    batch_size: Optional[int] = Field(None, ge=1, le=256, description="Texts per Inference API request")
+    concurrency: Optional[int] = Field(None, ge=1, le=32, description="Batched requests in flight per model")
 
 class ChatResponse(BaseModel):
     response: str
@@ -74,8 +149,10 @@ class ChatResponse(BaseModel):
     conversation_id: str
     timestamp: str
     word_count: int
+    prompt_tokens: Optional[int] = None
+    history_cursor: Optional[str] = None
 
-# --- Helper Function ---
+# --- Helper Functions ---
 def prepare_analysis_for_response(analysis_dict: dict) -> dict:
     prepared = analysis_dict.copy()
     prepared['sentiment'] = {'label': prepared.get('sentiment', 'unknown'), 'score': prepared.get('sentiment_score', 0.0)}
@@ -90,107 +167,332 @@ def prepare_analysis_for_response(analysis_dict: dict) -> dict:
         prepared['resources'] = None
     return prepared
 
+def build_crisis_response() -> str:
+    crisis_resources = MENTAL_HEALTH_RESOURCES['crisis'][:2]
+    return (
+        "I hear the pain and urgency in your words, and I'm deeply concerned for your safety. "
+        "Please know you're not alone.\n\n**IMMEDIATE HELP IS AVAILABLE:**\n" +
+        "\n".join([f"• {r}" for r in crisis_resources]) +
+        "\n\nPlease reach out to these services immediately."
+    )
+
+def build_generation_messages(analysis_result_dict: dict, session, sanitized_input: str):
+    """
+    Assembles the system prompt and recent turns sent to Groq, within
+    PROMPT_TOKEN_BUDGET (see prompting.build_prompt).
+
+    Returns:
+        tuple: (messages, estimated prompt tokens, fold_before or None)
+    """
+    repetitive_patterns = analysis_result_dict.get('cbt_analysis', {}).get('repetitive_patterns', [])
+    anti_repetition_instruction = generate_anti_repetition_instruction(repetitive_patterns)
+    cbt_instruction = ""
+    detected_patterns = analysis_result_dict.get('cbt_analysis', {}).get('patterns', [])
+    
+    if detected_patterns:
+        primary_pattern = detected_patterns[0]
+        intervention = analysis_result_dict.get('cbt_analysis', {}).get('intervention')
+        cbt_instruction = f"The user exhibits {primary_pattern}. Your response should: 1. Validate emotions. 2. Gently introduce the CBT concept of '{primary_pattern}'. 3. Suggest the technique: '{intervention}'. 4. End with an open-ended question."
+    elif any(emo['label'].lower() in ['sadness', 'anger', 'fear'] and emo['score'] > 0.7 for emo in analysis_result_dict.get('emotions', [])):
+        cbt_instruction = "The user expresses strong negative emotions. Prioritize: 1. Deep empathy and validation. 2. A simple coping technique (e.g., breathing). 3. An invitation to explore. 4. Avoid problem-solving."
+    
+    primary_emotion = max(analysis_result_dict.get('emotions', []), key=lambda x: x['score'])['label'] if analysis_result_dict.get('emotions') else 'unclear'
+    
+    system_prompt = f"""
+You are Athena, a compassionate AI therapist specializing in Cognitive Behavioral Therapy (CBT).
+
+CRITICAL GUIDELINES:
+- Your purpose is to support mental and emotional well-being. If asked about unrelated topics (e.g., politics, trivia), politely decline.
+- ANTI-REPETITION: Do NOT start with "It sounds like..." or "It seems like...". {anti_repetition_instruction}
+- Be concise (100-150 words) and end with an open-ended question.
+
+CURRENT USER STATE:
+- Sentiment: {analysis_result_dict.get('sentiment')}
+- Primary Emotion: {primary_emotion}
+- Detected CBT Patterns: {', '.join(detected_patterns) if detected_patterns else 'None'}
+
+{cbt_instruction}
+"""
+    if PROMPT_TOKEN_BUDGET > 0:
+        return build_prompt(system_prompt, session, sanitized_input, PROMPT_TOKEN_BUDGET)
+    messages_for_groq = [{"role": "system", "content": system_prompt}]
+    messages_for_groq.extend(session.recent(6))
+    messages_for_groq.append({"role": "user", "content": sanitized_input})
+    return messages_for_groq, sum(message_tokens(message["content"]) for message in messages_for_groq), None
+
+def record_prompt_tokens(usage, estimate: int) -> int:
+    """Prompt size as Groq counted it, or the local estimate when it reports none."""
+    tokens = getattr(usage, "prompt_tokens", None) or estimate
+    prompt_tokens.observe(tokens)
+    return tokens
+
+def schedule_summary(session_id: str, fold_before):
+    """Starts folding older turns into the session summary unless a refresh is already running."""
+    if fold_before is None or session_id in summary_refreshes:
+        return
+    task = asyncio.create_task(refresh_summary(session_id, fold_before))
+    summary_refreshes[session_id] = task
+    task.add_done_callback(lambda _: summary_refreshes.pop(session_id, None))
+
+async def refresh_summary(session_id: str, fold_before: int):
+    """
+    Folds the messages numbered below `fold_before` into the session summary.
+
+    The model call runs without the session lock; the result is only applied
+    if no other refresh moved the summary on in the meantime.
+    """
+    detach_request()
+    try:
+        async with session_locks.hold(session_id):
+            session = await session_store.load(session_id)
+            if session is None:
+                return
+            summary, summary_seq = session.summary, session.summary_seq
+            turns = session.unsummarized(before=fold_before)
+        if not turns:
+            return
+        with span("summary"):
+            new_summary = await summarize_turns(client, summary, turns)
+        async with session_locks.hold(session_id):
+            session = await session_store.load(session_id)
+            if session is None or session.summary_seq != summary_seq:
+                return
+            session.fold(new_summary, fold_before)
+            await session_store.save(session_id, session)
+    except Exception as e:
+        logger.error(f"Summary refresh for session {session_id} failed: {e}")
+
+async def load_synced_session(request: ChatRequest, session_id: str):
+    """
+    Loads the session and applies the history sent with the request.
+
+    Without a history_cursor, `history` is the caller's recent history and is
+    merged with what is stored. With one, `history` only holds the messages
+    added since that cursor was issued. If the session is gone (e.g. after a
+    restart) or has moved on since, the caller gets a 409 and resends its
+    full history without a cursor. Call with the session lock held.
+
+    Returns:
+        tuple: (session, number of messages appended)
+    """
+    items = ((item.role, item.content) for item in request.history)
+    if request.history_cursor is None:
+        history_syncs.labels("full").inc()
+        session = await session_store.load_or_create(session_id)
+        return session, session.merge_history(items)
+
+    session = await session_store.load(session_id)
+    if session is None or session.cursor() != request.history_cursor:
+        history_syncs.labels("resync").inc()
+        logger.info(f"History cursor for session {session_id} is stale; asking for a resync")
+        raise HTTPException(status_code=409, detail=HISTORY_RESYNC_DETAIL)
+    history_syncs.labels("delta").inc()
+    return session, session.extend(items)
+
+async def analyze_or_reject(sanitized_input: str, session) -> dict:
+    """Runs the analysis stage and rejects harmful input with a 400."""
+    # Moderation, sentiment and emotion run in parallel under one deadline
+    moderation_result, analysis_result_dict = await analyze_message(
+        sanitized_input, repetitive_patterns=session.repetitive_patterns()
+    )
+    if moderation_result['is_harmful']:
+        logger.warning(f"Harmful content detected via API (score: {moderation_result['score']:.3f})")
+        raise HTTPException(
+            status_code=400,
+            detail="Input contains harmful content."
+        )
+    return analysis_result_dict
+
+async def record_full_analysis(session_id: str, analysis_task):
+    """
+    Logs the complete ML analysis once it finishes after a crisis reply was
+    sent, and adds its emotions to the session's timeline.
+    """
+    try:
+        analysis = await analysis_task
+    except Exception as e:
+        logger.error(f"Background analysis for session {session_id} failed: {e}")
+        return
+    emotions = ', '.join(f"{emo['label']}={emo['score']:.2f}" for emo in analysis.get('emotions', []))
+    logger.info(
+        f"Background analysis for crisis session {session_id}: "
+        f"sentiment={analysis.get('sentiment')}, emotions=[{emotions}]"
+    )
+    for _ in range(SESSION_SAVE_ATTEMPTS):
+        # Waits for the crisis request itself to release the session
+        async with session_locks.hold(session_id):
+            session = await session_store.load(session_id)
+            if session is None:
+                return
+            session.record_emotions(analysis.get('emotions', []))
+            try:
+                await session_store.save(session_id, session)
+                return
+            except SessionConflict:
+                logger.info(f"Session {session_id} changed in another worker; recording its emotions again")
+    logger.warning(f"Gave up recording background emotions for session {session_id}")
+
+async def crisis_fast_path(session_id: str, sanitized_input: str, session) -> dict:
+    """
+    Answers a crisis message without waiting on the network.
+
+    Returns the analysis available within CRISIS_ANALYSIS_WAIT_SECONDS and
+    leaves the rest of the ML analysis to finish in the background.
+    """
+    logger.warning(f"Crisis fast path for session: {session_id}")
+    analysis_result_dict, full_analysis = await analyze_crisis_message(
+        sanitized_input, repetitive_patterns=session.repetitive_patterns()
+    )
+    task = asyncio.create_task(record_full_analysis(session_id, full_analysis))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return analysis_result_dict
+
 # --- API Endpoints ---
+@app.exception_handler(Overloaded)
+async def handle_overloaded(request: Request, exc: Overloaded):
+    # One tenant over its share is told to slow down; everyone else is told the service is busy
+    status_code = 429 if exc.reason == "tenant" else 503
+    return JSONResponse(
+        {"detail": f"Service busy ({exc.reason}); retry after {exc.retry_after}s."},
+        status_code=status_code, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(SessionConflict)
+async def handle_session_conflict(request: Request, exc: SessionConflict):
+    # Another worker saved the session first; a resend with the full history starts from its state
+    logger.warning(f"Save conflict for session {exc.session_id}; asking for a resync")
+    return JSONResponse({"detail": HISTORY_RESYNC_DETAIL}, status_code=409)
+
 @app.get("/", tags=["Status"])
 async def read_root():
     return {
         "status": "Athena AI API (API-Only) is running",
         "version": "8.0.0",
-        "features": ["API-Based Analysis", "CBT Pattern Detection", "Crisis Detection", "Groq/Llama-3 Powered"]
+        "features": ["API-Based Analysis", "CBT Pattern Detection", "Crisis Detection", "Groq/Llama-3 Powered", "Streaming Responses"]
     }
 
+@app.get("/stats", tags=["Status"])
+async def read_stats():
+    return {
+        "http_pool": pool_stats(),
+        "classifier_cache": cache_stats(),
+        "sessions": session_store.stats(),
+        "breakers": {**breaker_stats(), "groq": groq_breaker.stats()},
+        "admission": admission.stats(),
+        "coalescing": {
+            "classifier": classifier_flight.stats(),
+            "chat": chat_flight.stats(),
+            "session_locks": session_locks.stats(),
+        },
+    }
+
+@app.get("/metrics", tags=["Status"])
+async def read_metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
-async def handle_chat(request: ChatRequest):
+async def handle_chat(request: ChatRequest, x_tenant_id: Optional[str] = Header(None)):
+    """
+    Returns the reply with a Server-Timing header breaking down where the time
+    went (sanitize, crisis_check, admission, analysis, hf_*, regex, prompt,
+    groq, serialize).
+
+    Over capacity the answer is 503 (429 when X-Tenant-ID is over its own
+    limit) with a Retry-After header; see AdmissionController.
+
+    A reply that was added to the session history carries a `history_cursor`.
+    Sending it with the next message lets `history` shrink to the messages
+    the service has not seen (see load_synced_session). Replies that were not
+    added (crisis replies, fallbacks) have none; the cursor sent with the
+    request stays valid. With a shared session backend, a turn that loses its
+    save to another worker is answered 409 like a stale cursor.
+    """
     if not client:
         raise HTTPException(status_code=500, detail="Groq API key is not configured.")
 
-    session_id = request.session_id or str(uuid.uuid4())
-    logger.info(f"Processing request for session: {session_id}")
+    with track_request("chat") as timer:
+        session_id = request.session_id or str(uuid.uuid4())
+        logger.info(f"Processing request for session: {session_id}")
+        with span("sanitize"):
+            sanitized_input = sanitize_input(request.user_input)
 
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
-    conversation_history[session_id].extend(
-        [{"role": item.role, "content": item.content} for item in request.history]
-    )
+        if not request.session_id:
+            chat_response = await run_chat(request, session_id, sanitized_input, x_tenant_id)
+        else:
+            # A double-post or a retry after a client timeout gets the same response; the
+            # cursor is part of the key so a resync after a 409 is not answered with that 409
+            chat_response = await chat_flight.do(
+                (session_id, sanitized_input, request.history_cursor),
+                lambda: run_chat(request, session_id, sanitized_input, x_tenant_id)
+            )
 
-    sanitized_input = sanitize_input(request.user_input)
-    
-    # Step 1: Moderate content using the new API-based function
-    moderation_result = moderate_text(sanitized_input)
-    if moderation_result['is_harmful']:
-        logger.warning(f"Harmful content detected via API (score: {moderation_result['score']:.3f})")
-        raise HTTPException(
-            status_code=400,
-            detail="Input contains harmful content."
-        )
+        with span("serialize"):
+            body = chat_response.model_dump_json()
+        return Response(body, media_type="application/json", headers={"Server-Timing": timer.server_timing()})
 
-    # Step 2: Get combined analysis using the new API-based function
-    analysis_result_dict = combined_sentiment_analysis(sanitized_input, conversation_history[session_id])
-    
-    # Step 3: Handle crisis situations  
-    if analysis_result_dict.get('urgency_level') == 'crisis':
+async def run_chat(request: ChatRequest, session_id: str, sanitized_input: str, tenant: Optional[str]) -> ChatResponse:
+    # The regex check costs microseconds and decides both priority and the crisis path
+    crisis = enhanced_crisis_detection(sanitized_input) == 'crisis'
+    async with session_locks.hold(session_id):
+        session, _ = await load_synced_session(request, session_id)
+        try:
+            with span("admission"):
+                ticket = await admission.enter(crisis, tenant)
+            try:
+                return await respond_to_message(request, session_id, session, sanitized_input, crisis)
+            finally:
+                admission.leave(ticket)
+        finally:
+            await session_store.save(session_id, session)
+
+async def respond_to_message(request: ChatRequest, session_id: str, session, sanitized_input: str,
+                             crisis: bool) -> ChatResponse:
+
+    # Step 1: Handle crisis situations first
+    if crisis:
+        with span("analysis"):
+            analysis_result_dict = await crisis_fast_path(session_id, sanitized_input, session)
         analysis_for_response = prepare_analysis_for_response(analysis_result_dict)
-        crisis_resources = MENTAL_HEALTH_RESOURCES['crisis'][:2]
-        crisis_response = (
-            "I hear the pain and urgency in your words, and I'm deeply concerned for your safety. "
-            "Please know you're not alone.\n\n**IMMEDIATE HELP IS AVAILABLE:**\n" +
-            "\n".join([f"• {r}" for r in crisis_resources]) +
-            "\n\nPlease reach out to these services immediately."
-        )
         return ChatResponse(
-            response=crisis_response,
+            response=build_crisis_response(),
             analysis=AnalysisResult(**analysis_for_response),
             conversation_id=session_id,
             timestamp=datetime.now().isoformat(),
             word_count=len(sanitized_input.split())
         )
 
-    # Step 4: Generate the AI response using Groq (no changes in this logic)
-    try:
-        repetitive_patterns = analysis_result_dict.get('cbt_analysis', {}).get('repetitive_patterns', [])
-        anti_repetition_instruction = generate_anti_repetition_instruction(repetitive_patterns)
-        cbt_instruction = ""
-        detected_patterns = analysis_result_dict.get('cbt_analysis', {}).get('patterns', [])
-        
-        if detected_patterns:
-            primary_pattern = detected_patterns[0]
-            intervention = analysis_result_dict.get('cbt_analysis', {}).get('intervention')
-            cbt_instruction = f"The user exhibits {primary_pattern}. Your response should: 1. Validate emotions. 2. Gently introduce the CBT concept of '{primary_pattern}'. 3. Suggest the technique: '{intervention}'. 4. End with an open-ended question."
-        elif any(emo['label'].lower() in ['sadness', 'anger', 'fear'] and emo['score'] > 0.7 for emo in analysis_result_dict.get('emotions', [])):
-            cbt_instruction = "The user expresses strong negative emotions. Prioritize: 1. Deep empathy and validation. 2. A simple coping technique (e.g., breathing). 3. An invitation to explore. 4. Avoid problem-solving."
-        
-        primary_emotion = max(analysis_result_dict.get('emotions', []), key=lambda x: x['score'])['label'] if analysis_result_dict.get('emotions') else 'unclear'
-        
-        system_prompt = f"""
-You are Athena, a compassionate AI therapist specializing in Cognitive Behavioral Therapy (CBT).
+    # Step 2: Analyze the message, rejecting harmful content
+    with span("analysis"):
+        analysis_result_dict = await analyze_or_reject(sanitized_input, session)
+    session.record_emotions(analysis_result_dict.get('emotions', []))
 
-CRITICAL GUIDELINES:
-- Your purpose is to support mental and emotional well-being. If asked about unrelated topics (e.g., politics, trivia), politely decline.
-- ANTI-REPETITION: Do NOT start with "It sounds like..." or "It seems like...". {anti_repetition_instruction}
-- Be concise (100-150 words) and end with an open-ended question.
-
-CURRENT USER STATE:
-- Sentiment: {analysis_result_dict.get('sentiment')}
-- Primary Emotion: {primary_emotion}
-- Detected CBT Patterns: {', '.join(detected_patterns) if detected_patterns else 'None'}
-
-{cbt_instruction}
-"""
-        messages_for_groq = [{"role": "system", "content": system_prompt}]
-        messages_for_groq.extend(conversation_history[session_id][-6:])
-        messages_for_groq.append({"role": "user", "content": sanitized_input})
+    # Step 3: Generate the AI response using Groq
+    call = groq_breaker.begin()
+    if call is None:
+        upstream_errors.labels("groq", "circuit_open").inc()
+        logger.warning("Groq circuit is open; skipping generation")
+        raise HTTPException(status_code=503, detail="Service Unavailable: Generative AI service failed.")
+    try:
+        with span("prompt"):
+            messages_for_groq, estimated_tokens, fold_before = build_generation_messages(
+                analysis_result_dict, session, sanitized_input
+            )
         
-        chat_completion = client.chat.completions.create(
-            messages=messages_for_groq,
-            model=GENERATIVE_MODEL_ID,
-            temperature=0.7, max_tokens=256, top_p=0.9,
-        )
+        with span("groq"), upstream_in_flight.labels("groq").track_inprogress():
+            chat_completion = await client.chat.completions.create(
+                messages=messages_for_groq,
+                model=GENERATIVE_MODEL_ID,
+                temperature=0.7, max_tokens=256, top_p=0.9,
+            )
+        groq_breaker.end(call, True)
         
         ai_response = chat_completion.choices[0].message.content.strip()
         word_count = len(ai_response.split())
 
-        conversation_history[session_id].append({'role': 'user', 'content': request.user_input})
-        conversation_history[session_id].append({'role': 'assistant', 'content': ai_response})
+        session.append_turn(request.user_input, ai_response)
+        schedule_summary(session_id, fold_before)
 
         final_analysis = prepare_analysis_for_response(analysis_result_dict)
 
@@ -199,10 +501,14 @@ CURRENT USER STATE:
             analysis=AnalysisResult(**final_analysis),
             conversation_id=session_id,
             timestamp=datetime.now().isoformat(),
-            word_count=word_count
+            word_count=word_count,
+            prompt_tokens=record_prompt_tokens(chat_completion.usage, estimated_tokens),
+            history_cursor=session.cursor()
         )
 
     except APIError as e:
+        groq_breaker.end(call, False)
+        upstream_errors.labels("groq", "api_error").inc()
         logger.error(f"Groq API Error: {e}")
         raise HTTPException(status_code=503, detail="Service Unavailable: Generative AI service failed.")
     except Exception as e:
@@ -216,4 +522,204 @@ CURRENT USER STATE:
             conversation_id=session_id,
             timestamp=datetime.now().isoformat(),
             word_count=len(fallback_response.split())
-        )
\ No newline at end of file
+        )
+    finally:
+        groq_breaker.end(call, None)
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Event; `data` is a JSON string or a JSON-serializable object."""
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+@app.post("/chat/stream", tags=["Chat"])
+async def handle_chat_stream(request: ChatRequest, x_tenant_id: Optional[str] = Header(None)):
+    """
+    Streams a reply as Server-Sent Events.
+
+    Events, in order: `analysis` (the AnalysisResult, as soon as analysis is
+    done), any number of `token` events ({"text": ...}) while Groq generates,
+    then `done` ({"conversation_id", "timestamp", "word_count", plus
+    "prompt_tokens" and "history_cursor" for generated replies}). A failure
+    after streaming has started is reported as an `error` event. The turn is
+    committed to the session history once, only after a complete reply; if
+    another worker saved the session meanwhile, the `error` event carries
+    "resync": true and the turn is not kept.
+
+    The session lock is held while the history is merged and again from the
+    start of generation until the turn is saved, never across the handoff to
+    the response, so a stream that is never consumed cannot keep it. An
+    admission slot is held the same way: over capacity, analysis answers 503
+    (or 429) with Retry-After, and generation sends an `error` event with
+    "retry_after".
+    """
+    if not client:
+        raise HTTPException(status_code=500, detail="Groq API key is not configured.")
+
+    # Timed up to the start of the stream; its Server-Timing covers the analysis
+    with track_request("chat_stream") as timer:
+        session_id = request.session_id or str(uuid.uuid4())
+        logger.info(f"Processing streaming request for session: {session_id}")
+
+        async with session_locks.hold(session_id):
+            session, appended = await load_synced_session(request, session_id)
+            if appended:
+                await session_store.save(session_id, session)
+        with span("sanitize"):
+            sanitized_input = sanitize_input(request.user_input)
+        crisis = enhanced_crisis_detection(sanitized_input) == 'crisis'
+        with span("admission"):
+            ticket = await admission.enter(crisis, x_tenant_id)
+        try:
+            with span("analysis"):
+                if crisis:
+                    analysis_result_dict = await crisis_fast_path(session_id, sanitized_input, session)
+                else:
+                    analysis_result_dict = await analyze_or_reject(sanitized_input, session)
+        finally:
+            admission.leave(ticket)
+
+        return StreamingResponse(
+            stream_reply(request, session_id, sanitized_input, analysis_result_dict, x_tenant_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": timer.server_timing()},
+        )
+
+async def stream_reply(request: ChatRequest, session_id: str, sanitized_input: str, analysis_result_dict: dict,
+                       tenant: Optional[str]):
+    async with session_locks.hold(session_id):
+        # Reloaded under the lock: another request may have committed a turn meanwhile
+        session = await session_store.load_or_create(session_id)
+        # aclosing: a client disconnect must finish the inner stream before the lock is released
+        async with aclosing(stream_events(request, session_id, session, sanitized_input, analysis_result_dict, tenant)) as events:
+            async for event in events:
+                yield event
+
+async def stream_events(request: ChatRequest, session_id: str, session, sanitized_input: str, analysis_result_dict: dict,
+                        tenant: Optional[str]):
+    committed = saved = False
+    call = None
+    ticket = None
+    done_extra = {}
+    # Crisis turns are added to the emotion timeline by their background analysis
+    recorded = analysis_result_dict.get('urgency_level') != 'crisis'
+    if recorded:
+        session.record_emotions(analysis_result_dict.get('emotions', []))
+    try:
+        analysis = AnalysisResult(**prepare_analysis_for_response(analysis_result_dict))
+        yield sse_event("analysis", analysis.model_dump_json())
+
+        if analysis_result_dict.get('urgency_level') == 'crisis':
+            yield sse_event("token", {"text": build_crisis_response()})
+            word_count = len(sanitized_input.split())
+        else:
+            with span("admission"):
+                ticket = await admission.enter(tenant=tenant)
+            call = groq_breaker.begin()
+            if call is None:
+                upstream_errors.labels("groq", "circuit_open").inc()
+                logger.warning("Groq circuit is open; skipping generation")
+                yield sse_event("error", {"detail": "Service Unavailable: Generative AI service failed."})
+                return
+            with span("prompt"):
+                messages_for_groq, estimated_tokens, fold_before = build_generation_messages(
+                    analysis_result_dict, session, sanitized_input
+                )
+            parts = []
+            with span("groq_stream"), upstream_in_flight.labels("groq").track_inprogress():
+                stream = await client.chat.completions.create(
+                    messages=messages_for_groq,
+                    model=GENERATIVE_MODEL_ID,
+                    temperature=0.7, max_tokens=256, top_p=0.9,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        parts.append(text)
+                        yield sse_event("token", {"text": text})
+            groq_breaker.end(call, True)
+            ai_response = "".join(parts).strip()
+            word_count = len(ai_response.split())
+            # Only a complete reply becomes part of the history, saved before `done` reports its cursor
+            session.append_turn(request.user_input, ai_response)
+            committed = True
+            await session_store.save(session_id, session)
+            saved = True
+            schedule_summary(session_id, fold_before)
+            # Usage is not read from the stream, so this is the local estimate
+            done_extra = {
+                "prompt_tokens": record_prompt_tokens(None, estimated_tokens),
+                "history_cursor": session.cursor(),
+            }
+
+        yield sse_event("done", {
+            "conversation_id": session_id,
+            "timestamp": datetime.now().isoformat(),
+            "word_count": word_count,
+            **done_extra,
+        })
+    except Overloaded as e:
+        yield sse_event("error", {"detail": f"Service busy ({e.reason}).", "retry_after": e.retry_after})
+    except SessionConflict:
+        logger.warning(f"Save conflict for session {session_id}; the streamed turn was not kept")
+        committed = recorded = False
+        yield sse_event("error", {"detail": HISTORY_RESYNC_DETAIL, "resync": True})
+    except APIError as e:
+        if call is not None:
+            groq_breaker.end(call, False)
+        upstream_errors.labels("groq", "api_error").inc()
+        logger.error(f"Groq API Error while streaming: {e}")
+        yield sse_event("error", {"detail": "Service Unavailable: Generative AI service failed."})
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while streaming: {e}")
+        traceback.print_exc()
+        yield sse_event("error", {"detail": "Streaming failed."})
+    finally:
+        if call is not None:
+            groq_breaker.end(call, None)
+        admission.leave(ticket)
+        if (committed or recorded) and not saved:
+            try:
+                await session_store.save(session_id, session)
+            except SessionConflict:
+                logger.warning(f"Save conflict for session {session_id}; its emotions for this turn were dropped")
+
+@app.get("/sessions/{session_id}/emotions", tags=["Analysis"])
+async def read_session_emotions(
+    session_id: str,
+    points: int = Query(32, ge=1, le=1024, description="Most points in the series; neighbouring buckets are merged")
+):
+    """
+    The session's emotion timeline (see EmotionTimeline): turn count, mood,
+    rolling and all-time mean scores per emotion, and a time series of
+    bucketed means. Reads the running aggregates only, never the messages.
+    "complete" is false when the service started tracking the session after
+    its first message (e.g. after a restart), so earlier turns are missing.
+    """
+    session = await session_store.load(session_id)
+    if session is None or session.emotions is None:
+        raise HTTPException(status_code=404, detail="No emotion timeline for this session.")
+    timeline = session.emotions
+    return {"session_id": session_id, **timeline.summary(), "series": timeline.series(points)}
+
+@app.post("/analyze/batch", tags=["Analysis"])
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Re-scores many messages without generating replies (e.g. to backfill
+    emotion data). Streams NDJSON, one {"index", "analysis"} object per text,
+    in completion order.
+    """
+    if len(request.texts) > BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_TEXTS} texts per batch.")
+    texts = [sanitize_input(text) for text in request.texts]
+
+    async def stream_results():
+        async for index, analysis_dict in combined_sentiment_analysis_batch(
+            texts,
+            batch_size=request.batch_size or BATCH_SIZE,
+            concurrency=request.concurrency or BATCH_CONCURRENCY,
+        ):
+            analysis = AnalysisResult(**prepare_analysis_for_response(analysis_dict))
+            yield f'{{"index":{index},"analysis":{analysis.model_dump_json()}}}\n'
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
@@ -0,0 +1,253 @@
+# matcher.py
+import re
+import bisect
+from config import CRISIS_PATTERNS, CONCERN_PATTERNS, CBT_PATTERNS, ANTI_REPETITION_STARTERS
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse, sre_constants
+
+WORD_BOUNDARY = r"\b"
+# Caps on the literal prefixes extracted per rule
+MAX_PREFIXES_PER_RULE = 256
+MAX_PREFIX_LENGTH = 24
+
+
+def _literal_prefixes(items):
+    """
+    Literal strings one of which every match of `items` must start with.
+
+    Walks the parsed regex through literals, groups, alternations, optional
+    parts and small character sets, and stops at the first construct that
+    cannot be expanded into literals.
+
+    Returns:
+        tuple: (set of prefixes, whether `items` was consumed entirely)
+    """
+    prefixes = {""}
+    for op, av in items:
+        if op is sre_constants.AT:
+            continue  # zero-width
+        if op is sre_constants.LITERAL:
+            inner, complete = {chr(av)}, True
+        elif op is sre_constants.SUBPATTERN:
+            if av[1] or av[2]:  # inline flags change what a literal means
+                return prefixes, False
+            inner, complete = _literal_prefixes(av[3])
+        elif op is sre_constants.BRANCH:
+            inner, complete = set(), True
+            for branch in av[1]:
+                branch_prefixes, branch_complete = _literal_prefixes(branch)
+                inner |= branch_prefixes
+                complete = complete and branch_complete
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] == 0 and av[1] == 1:
+            inner, complete = _literal_prefixes(av[2])
+            inner = inner | {""}
+        elif op is sre_constants.IN and all(kind is sre_constants.LITERAL for kind, _ in av) and len(av) <= 8:
+            inner, complete = {chr(code) for _, code in av}, True
+        else:
+            return prefixes, False
+
+        combined = {prefix + tail for prefix in prefixes for tail in inner}
+        if len(combined) > MAX_PREFIXES_PER_RULE or max(map(len, combined)) > MAX_PREFIX_LENGTH:
+            return prefixes, False
+        prefixes = combined
+        if not complete:
+            return prefixes, False
+    return prefixes, True
+
+
+def _trie_regex(words):
+    """Regex source matching any of `words`, factored as a prefix trie."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not terminal else f"(?:{'|'.join(branches)})"
+        return f"{body}?" if terminal else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """
+    Runs every rule group over a text in a single pass.
+
+    Each rule is reduced at build time to the literal prefixes its matches
+    must start with (e.g. r"\bi feel (so )?(hopeless|numb)\b" gives "i feel
+    hopeless", "i feel so numb", ...). All prefixes are compiled into one
+    trie-shaped regex, a keyword automaton run by the regex engine, so a
+    single `finditer` over the lowercased text reports every position where
+    some rule can start. Only the rules whose prefixes occur at that
+    position are confirmed with `match`. That gives exactly the result of one
+    `re.search` per rule, at a cost that grows with the number of hits rather
+    than the number of rules. Rules without a literal prefix are checked
+    with `search` separately.
+
+    Rules are (group, name, pattern) triples; results keep declaration order.
+    """
+
+    def __init__(self, rules):
+        self.rules = [(group, name, re.compile(pattern)) for group, name, pattern in rules]
+        self.patterns = {(group, name): pattern for group, name, pattern in rules}
+        self._by_prefix = {}
+        self._unfiltered = []
+        for index, (_, _, pattern) in enumerate(rules):
+            parsed = sre_parse.parse(pattern)
+            prefixes = _literal_prefixes(list(parsed))[0] if not parsed.state.flags & ~re.UNICODE else {""}
+            if "" in prefixes:
+                self._unfiltered.append(index)
+                continue
+            for prefix in prefixes:
+                self._by_prefix.setdefault(prefix, []).append(index)
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._by_prefix})
+
+        self._scanner = None
+        if self._by_prefix:
+            boundary = ""
+            if all(pattern.startswith(WORD_BOUNDARY) for _, _, pattern in rules):
+                boundary = WORD_BOUNDARY
+            self._scanner = re.compile(f"{boundary}(?={_trie_regex(self._by_prefix)})")
+
+    def scan(self, text):
+        """
+        Matches all rules against `text` (case-insensitively, as the rules
+        are written for lowercased input).
+
+        Returns:
+            dict: group -> list of matched rule names, in declaration order.
+                  Groups without matches are absent.
+        """
+        if not text:
+            return {}
+        text_lower = text.lower()
+        found = set()
+        for index in self._unfiltered:
+            if self.rules[index][2].search(text_lower):
+                found.add(index)
+
+        if self._scanner is not None:
+            by_prefix, rules = self._by_prefix, self.rules
+            for hit in self._scanner.finditer(text_lower):
+                position = hit.start()
+                for length in self._prefix_lengths:
+                    candidates = by_prefix.get(text_lower[position:position + length])
+                    if candidates:
+                        for index in candidates:
+                            if index not in found and rules[index][2].match(text_lower, position):
+                                found.add(index)
+
+        matches = {}
+        for index in sorted(found):
+            group, name, _ = self.rules[index]
+            matches.setdefault(group, []).append(name)
+        return matches
+
+    def scan_many(self, texts):
+        """
+        Scans a batch of texts with one pass of the prefilter over all of them.
+
+        The lowercased texts are joined with a NUL separator, which is not a
+        word character, so word boundaries at text edges are the same as in
+        the separate texts. Candidate positions are mapped back to their text
+        and confirmed there, so a rule can never match across two texts.
+
+        Returns:
+            list: one scan result (as from `scan`) per text, in order.
+        """
+        lowered = [text.lower() if text else "" for text in texts]
+        found = [set() for _ in lowered]
+        for index in self._unfiltered:
+            regex = self.rules[index][2]
+            for text_index, text_lower in enumerate(lowered):
+                if text_lower and regex.search(text_lower):
+                    found[text_index].add(index)
+
+        if self._scanner is not None and lowered:
+            starts, offset = [], 0
+            for text_lower in lowered:
+                starts.append(offset)
+                offset += len(text_lower) + 1
+            joined = "\0".join(lowered)
+            by_prefix, rules = self._by_prefix, self.rules
+            for hit in self._scanner.finditer(joined):
+                text_index = bisect.bisect_right(starts, hit.start()) - 1
+                text_lower, position = lowered[text_index], hit.start() - starts[text_index]
+                text_found = found[text_index]
+                for length in self._prefix_lengths:
+                    candidates = by_prefix.get(text_lower[position:position + length])
+                    if candidates:
+                        for index in candidates:
+                            if index not in text_found and rules[index][2].match(text_lower, position):
+                                text_found.add(index)
+
+        results = []
+        for text_found in found:
+            matches = {}
+            for index in sorted(text_found):
+                group, name, _ = self.rules[index]
+                matches.setdefault(group, []).append(name)
+            results.append(matches)
+        return results
+
+    def pattern_ids(self, matches):
+        """Flattens a scan result into 'group:name' ids."""
+        return [f"{group}:{name}" for group, names in matches.items() for name in names]
+
+
+class PhraseMatcher:
+    """
+    Finds which of a fixed set of phrases occur in a text, case-insensitively,
+    with one regex pass per text instead of one substring search per phrase.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+        self._index = {phrase.lower(): phrase for phrase in self.phrases}
+        # The lookahead reports every position, so overlapping occurrences are
+        # seen; at one position only the longest phrase is reported, so any
+        # phrase that is a prefix of another is confirmed separately.
+        alternation = "|".join(re.escape(key) for key in sorted(self._index, key=len, reverse=True))
+        self._scanner = re.compile(f"(?=({alternation}))") if self.phrases else None
+        self._shadowed = [
+            key for key in self._index
+            if any(other != key and other.startswith(key) for other in self._index)
+        ]
+
+    def find(self, text):
+        """Returns the set of phrases (original casing) contained in `text`."""
+        if not text or self._scanner is None:
+            return set()
+        text_lower = text.lower()
+        found = {self._index[hit.group(1)] for hit in self._scanner.finditer(text_lower)}
+        for key in self._shadowed:
+            if key in text_lower:
+                found.add(self._index[key])
+        return found
+
+    def mask(self, text):
+        """Bitmask of the phrases contained in `text`; bit i is phrases[i]."""
+        found = self.find(text)
+        return sum(1 << index for index, phrase in enumerate(self.phrases) if phrase in found)
+
+
+def build_rules():
+    """Rule table for the crisis, concern and CBT groups defined in config."""
+    rules = [("crisis", str(index), pattern) for index, pattern in enumerate(CRISIS_PATTERNS)]
+    rules += [("concern", str(index), pattern) for index, pattern in enumerate(CONCERN_PATTERNS)]
+    rules += [("cbt", name, pattern) for name, pattern in CBT_PATTERNS.items()]
+    return rules
+
+
+# Built once at import time and shared by every request
+rule_matcher = RuleMatcher(build_rules())
+starter_matcher = PhraseMatcher(ANTI_REPETITION_STARTERS)
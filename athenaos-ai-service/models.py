@@ -1,21 +1,230 @@
 # models.py
-import requests
+import time
+import asyncio
 import logging
-from config import HUGGINGFACE_API_KEY
+import importlib.util
+import httpx
+from cache import classifier_cache, cache_key
+from coalesce import SingleFlight
+from breaker import CircuitBreaker
+from telemetry import span, upstream_errors, upstream_in_flight
+from local_classifier import MODE as LOCAL_MODE, handles as local_handles, local_response
+from config import (
+    HUGGINGFACE_API_KEY, HF_REQUEST_TIMEOUT, MODERATION_API_URL, SENTIMENT_API_URL, EMOTION_API_URL,
+    HF_POOL_MAX_CONNECTIONS, HF_POOL_MAX_KEEPALIVE, HF_KEEPALIVE_EXPIRY, HF_HTTP2, HF_BATCH_TIMEOUT,
+    HF_MAX_CONCURRENT_REQUESTS,
+    BREAKER_ENABLED, BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SECONDS, BREAKER_MAX_OPEN_SECONDS,
+    HF_SLOW_CALL_SECONDS, HF_HEDGING_ENABLED, HF_HEDGE_MIN_SAMPLES, HF_HEDGE_MIN_DELAY_SECONDS,
+    LOCAL_CLASSIFIER_RACE_SECONDS
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class PooledClient:
+    """
+    Keep-alive HTTP client shared by every Inference API call.
+
+    Requests in flight are capped at HF_MAX_CONCURRENT_REQUESTS by a
+    semaphore, and requests that wait for it are counted in `request_waits`.
+    This is a request-concurrency limit, not a count of connection waits:
+    with HTTP/2 many requests share one connection, and httpx does not report
+    waits inside its own pool. `requests` counts every upstream request,
+    hedged copies included; connection opens are observed through the
+    httpcore trace hook.
+    """
+
+    def __init__(self):
+        self.http2 = HF_HTTP2 and importlib.util.find_spec("h2") is not None
+        self.client = httpx.AsyncClient(
+            timeout=HF_REQUEST_TIMEOUT,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=HF_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=HF_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=HF_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self._request_slots = asyncio.Semaphore(HF_MAX_CONCURRENT_REQUESTS)
+        self.requests = 0
+        self.connections_opened = 0
+        self.request_waits = 0
+        self.request_wait_seconds = 0.0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def post(self, url, **kwargs):
+        if self._request_slots.locked():
+            self.request_waits += 1
+            started = time.perf_counter()
+            await self._request_slots.acquire()
+            self.request_wait_seconds += time.perf_counter() - started
+        else:
+            await self._request_slots.acquire()
+        try:
+            self.requests += 1
+            return await self.client.post(url, extensions={"trace": self._trace}, **kwargs)
+        finally:
+            self._request_slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "max_connections": HF_POOL_MAX_CONNECTIONS,
+            "max_keepalive": HF_POOL_MAX_KEEPALIVE,
+            "max_concurrent_requests": HF_MAX_CONCURRENT_REQUESTS,
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "request_waits": self.request_waits,
+            "request_wait_seconds": round(self.request_wait_seconds, 4),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_http_client = None
+
+async def start_http_client():
+    """Creates the shared pool. Called from the FastAPI lifespan on startup."""
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledClient()
+        logger.info(f"Inference API pool ready (http2={_http_client.http2}, max={HF_POOL_MAX_CONNECTIONS})")
+
+async def close_http_client():
+    """Closes the shared pool. Called from the FastAPI lifespan on shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_http_client() -> PooledClient:
+    """Returns the shared pool, creating it lazily when used outside the app lifecycle."""
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledClient()
+    return _http_client
+
+# Identical classifier calls in flight at the same time share one upstream request
+classifier_flight = SingleFlight()
+
+def pool_stats() -> dict:
+    """Connection pool counters, or an empty dict before the pool exists."""
+    return _http_client.stats() if _http_client is not None else {}
+
+# Short upstream names for metric labels and Server-Timing entries
+UPSTREAM_NAMES = {MODERATION_API_URL: "moderation", SENTIMENT_API_URL: "sentiment", EMOTION_API_URL: "emotion"}
+
+def upstream_name(api_url: str) -> str:
+    return UPSTREAM_NAMES.get(api_url) or api_url.rsplit("/", 1)[-1]
+
+def error_reason(error: Exception) -> str:
+    """Label for athena_upstream_errors_total."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"status_{error.response.status_code}"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPError):
+        return "transport"
+    # A body that is not JSON, or any other failure reading the answer
+    return "invalid_response"
+
+_breakers = {}
+
+def get_breaker(api_url: str) -> CircuitBreaker:
+    """The circuit breaker guarding one Inference API endpoint."""
+    breaker = _breakers.get(api_url)
+    if breaker is None:
+        breaker = _breakers[api_url] = CircuitBreaker(
+            api_url.rsplit("/models/", 1)[-1],
+            failure_threshold=BREAKER_FAILURE_THRESHOLD,
+            open_seconds=BREAKER_OPEN_SECONDS,
+            slow_call_seconds=HF_SLOW_CALL_SECONDS,
+            max_open_seconds=BREAKER_MAX_OPEN_SECONDS,
+            enabled=BREAKER_ENABLED,
+        )
+    return breaker
+
+def breaker_stats() -> dict:
+    return {breaker.name: breaker.stats() for breaker in _breakers.values()}
+
+def loading_seconds(response: httpx.Response):
+    """The `estimated_time` of a 503 "model is loading" answer, if it has one."""
+    if response.status_code != 503:
+        return None
+    try:
+        return float(response.json().get("estimated_time"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def trip_if_loading(breaker: CircuitBreaker, error: Exception):
+    """
+    Opens the circuit at once for a 503 whose body says the model is loading,
+    for its estimated_time. Any other error only counts toward the threshold.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        seconds = loading_seconds(error.response)
+        if seconds is not None:
+            breaker.trip(seconds)
+
+async def post_hedged(api_url: str, breaker: CircuitBreaker, **kwargs) -> httpx.Response:
+    """
+    Posts a request; with hedging enabled, sends a second copy when the first
+    has not answered by the endpoint's p95 latency and returns whichever
+    succeeds first. The slower copy is cancelled.
+    """
+    client = get_http_client()
+    delay = None
+    if HF_HEDGING_ENABLED and len(breaker.latency) >= HF_HEDGE_MIN_SAMPLES:
+        delay = max(breaker.latency.percentile(0.95), HF_HEDGE_MIN_DELAY_SECONDS)
+    if delay is None:
+        return await client.post(api_url, **kwargs)
+
+    first = asyncio.ensure_future(client.post(api_url, **kwargs))
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        client.hedges += 1
+        pending.add(asyncio.ensure_future(client.post(api_url, **kwargs)))
+        last = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and task.result().is_success:
+                    if task is not first:
+                        client.hedge_wins += 1
+                    return task.result()
+        return last.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
 # This is the helper function that will call the Hugging Face Inference API
-def query_huggingface_api(api_url: str, text: str):
+async def query_huggingface_api(api_url: str, text: str):
     """
     Sends a request to a specified Hugging Face Inference API endpoint.
-    
+
+    The call is awaited on the event loop, so other chats keep being served
+    while the model answers. Successful responses are cached by model URL
+    and text, so repeated messages skip the network entirely, and concurrent
+    identical calls share a single request.
+
     Args:
         api_url (str): The URL of the model's API endpoint.
         text (str): The input text to be analyzed.
-        
+
     Returns:
         dict: The JSON response from the API, or None if an error occurs.
     """
@@ -23,13 +232,163 @@ def query_huggingface_api(api_url: str, text: str):
         logger.error("HUGGINGFACE_API_KEY not found. Cannot query API.")
         return None
 
+    with span(f"hf_{upstream_name(api_url)}"):
+        key = cache_key(api_url, text)
+        if classifier_cache is not None:
+            cached = classifier_cache.get(key)
+            if cached is not None:
+                return cached
+
+        return await classifier_flight.do(key, lambda: _post_inference(api_url, text, key))
+
+async def _post_inference(api_url: str, text: str, key: str):
+    # An open circuit answers at once; callers fall back as on any failed call
+    name = upstream_name(api_url)
+    breaker = get_breaker(api_url)
+    call = breaker.begin()
+    if call is None:
+        upstream_errors.labels(name, "circuit_open").inc()
+        return None
+
     headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
     payload = {"inputs": text}
-    
+
+    in_flight = upstream_in_flight.labels(name)
+    in_flight.inc()
+    request = asyncio.ensure_future(post_hedged(api_url, breaker, headers=headers, json=payload))
     try:
-        response = requests.post(api_url, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()  
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        await asyncio.wait((request, call.tripped), return_when=asyncio.FIRST_COMPLETED)
+        if not request.done():
+            # The circuit opened meanwhile; degrade now rather than at the deadline
+            upstream_errors.labels(name, "circuit_open").inc()
+            return None
+        response = request.result()
+        response.raise_for_status()
+        result = response.json()
+        breaker.end(call, True)
+    except Exception as e:
+        breaker.end(call, False)
+        trip_if_loading(breaker, e)
+        upstream_errors.labels(name, error_reason(e)).inc()
         logger.error(f"API request to {api_url} failed: {e}")
         return None
+    finally:
+        request.cancel()
+        breaker.end(call, None)
+        in_flight.dec()
+
+    if classifier_cache is not None:
+        classifier_cache.set(key, result)
+    return result
+
+async def query_huggingface_api_batch(api_url: str, texts: list):
+    """
+    Classifies several texts with one Inference API request.
+
+    The API accepts a list as `inputs` and answers with one result list per
+    input. Each result is returned in the single-input shape
+    (`[[{label, score}, ...]]`), so the usual response parsers apply.
+    Cached texts are answered locally and only the misses are sent.
+
+    Args:
+        api_url (str): The URL of the model's API endpoint.
+        texts (list): The input texts.
+
+    Returns:
+        list: One response (or None on error) per input text, in order.
+    """
+    results = [None] * len(texts)
+    if not HUGGINGFACE_API_KEY:
+        logger.error("HUGGINGFACE_API_KEY not found. Cannot query API.")
+        return results
+
+    keys = [cache_key(api_url, text) for text in texts] if classifier_cache is not None else None
+    missing = []
+    for index, text in enumerate(texts):
+        cached = classifier_cache.get(keys[index]) if keys is not None else None
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.append(index)
+    if not missing:
+        return results
+
+    name = upstream_name(api_url)
+    breaker = get_breaker(api_url)
+    call = breaker.begin(timed=False)
+    if call is None:
+        upstream_errors.labels(name, "circuit_open").inc()
+        return results
+
+    headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
+    payload = {"inputs": [texts[index] for index in missing]}
+
+    in_flight = upstream_in_flight.labels(name)
+    in_flight.inc()
+    try:
+        response = await get_http_client().post(api_url, headers=headers, json=payload, timeout=HF_BATCH_TIMEOUT)
+        response.raise_for_status()
+        outputs = response.json()
+        breaker.end(call, True)
+    except Exception as e:
+        breaker.end(call, False)
+        trip_if_loading(breaker, e)
+        upstream_errors.labels(name, error_reason(e)).inc()
+        logger.error(f"Batch API request to {api_url} failed: {e}")
+        return results
+    finally:
+        breaker.end(call, None)
+        in_flight.dec()
+
+    if not isinstance(outputs, list) or len(outputs) != len(missing):
+        logger.error(f"Batch API response from {api_url} has an unexpected shape")
+        return results
+    for index, output in zip(missing, outputs):
+        results[index] = [output]
+        if keys is not None:
+            classifier_cache.set(keys[index], results[index])
+    return results
+
+
+# Inference API calls that lost a race to the local scorer but still fill the cache
+_race_losers = set()
+
+def _race_lost(task):
+    _race_losers.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background inference call failed: {task.exception()!r}")
+
+async def query_classifier(api_url: str, text: str):
+    """
+    Classifies `text` with the backend LOCAL_CLASSIFIER_MODE selects for
+    `api_url`, in the Inference API's response shape.
+
+    "primary" answers from the local scorer. "race" gives the Inference API
+    LOCAL_CLASSIFIER_RACE_SECONDS and otherwise answers locally, leaving the
+    API call to finish in the background. "fallback" and "off" call the
+    Inference API; in fallback mode the caller fills in what is missing
+    (local_classifier.fill_missing), including calls cut off by its deadline.
+    """
+    if not local_handles(api_url) or LOCAL_MODE == "fallback":
+        return await query_huggingface_api(api_url, text)
+    if LOCAL_MODE == "primary":
+        return local_response(api_url, text, "primary")
+
+    remote = asyncio.ensure_future(query_huggingface_api(api_url, text))
+    _race_losers.add(remote)
+    remote.add_done_callback(_race_lost)
+    await asyncio.wait((remote,), timeout=LOCAL_CLASSIFIER_RACE_SECONDS)
+    if remote.done() and not remote.cancelled() and remote.exception() is None and remote.result() is not None:
+        return remote.result()
+    return local_response(api_url, text, "race")
+
+async def query_classifier_batch(api_url: str, texts: list):
+    """query_huggingface_api_batch, with the local scorer answering per LOCAL_CLASSIFIER_MODE."""
+    if not local_handles(api_url):
+        return await query_huggingface_api_batch(api_url, texts)
+    if LOCAL_MODE == "primary":
+        return [local_response(api_url, text, "primary") for text in texts]
+    # A batch has no race window worth having; failed items are filled in either way
+    results = await query_huggingface_api_batch(api_url, texts)
+    return [result if result is not None else local_response(api_url, text, "fallback")
+            for text, result in zip(texts, results)]
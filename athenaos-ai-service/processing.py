@@ -1,12 +1,16 @@
 # processing.py
 import re
 import random
+import asyncio
 import logging
-from models import query_huggingface_api  
+from models import query_huggingface_api, query_classifier, query_classifier_batch
+from local_classifier import fill_missing
+from matcher import rule_matcher, starter_matcher
+from telemetry import span
 from config import (
-    CRISIS_PATTERNS, CONCERN_PATTERNS,
-    CBT_PATTERNS, CBT_INTERVENTIONS, GENERAL_CBT_TECHNIQUES, ANTI_REPETITION_STARTERS,
-    MODERATION_API_URL, SENTIMENT_API_URL, EMOTION_API_URL  
+    CBT_INTERVENTIONS, GENERAL_CBT_TECHNIQUES, ANTI_REPETITION_STARTERS,
+    MODERATION_API_URL, SENTIMENT_API_URL, EMOTION_API_URL, ANALYSIS_DEADLINE_SECONDS,
+    CRISIS_ANALYSIS_WAIT_SECONDS, BATCH_SIZE, BATCH_CONCURRENCY
 )
 
 logger = logging.getLogger(__name__)
@@ -22,12 +26,9 @@ def sanitize_input(text):
         text = text[:max_length] + "... [truncated]"
     return text.strip()
 
-def moderate_text(text):
-    """
-    Moderates text by calling the Hugging Face Inference API.
-    """
+def parse_moderation_response(api_response):
+    """Turns a moderation API response into the is_harmful/score dict."""
     try:
-        api_response = query_huggingface_api(MODERATION_API_URL, text)
         if not api_response:
             return {'is_harmful': False, 'score': 0.0}
 
@@ -38,38 +39,43 @@ def moderate_text(text):
                 harmful_score = item['score']
                 break
         
-        logger.info(f"Moderation score from API: {harmful_score:.3f}")
+        logger.debug(f"Moderation score from API: {harmful_score:.3f}")
         return {'is_harmful': harmful_score > 0.7, 'score': harmful_score}
     except Exception as e:
         logger.error(f"Error processing moderation API response: {e}")
         return {'is_harmful': False, 'score': 0.0}
 
+async def moderate_text(text):
+    """
+    Moderates text by calling the Hugging Face Inference API.
+    """
+    return parse_moderation_response(await query_huggingface_api(MODERATION_API_URL, text))
+
+
+def urgency_from_matches(matches):
+    """Maps a rule scan to 'crisis', 'concern' or None; crisis rules win."""
+    for level in ('crisis', 'concern'):
+        if matches.get(level):
+            pattern = rule_matcher.patterns[(level, matches[level][0])]
+            if level == 'crisis':
+                logger.warning(f"Crisis pattern detected: {pattern}")
+            else:
+                logger.info(f"Concern pattern detected: {pattern}")
+            return level
+    return None
 
 def enhanced_crisis_detection(text):
-    """Enhanced crisis detection with expanded patterns. (No changes here)"""
+    """Enhanced crisis detection with expanded patterns."""
     if not text:
         return None
-    text_lower = text.lower()
-    for pattern in CRISIS_PATTERNS:
-        if re.search(pattern, text_lower):
-            logger.warning(f"Crisis pattern detected: {pattern}")
-            return "crisis"
-    for pattern in CONCERN_PATTERNS:
-        if re.search(pattern, text_lower):
-            logger.info(f"Concern pattern detected: {pattern}")
-            return "concern"
-    return None
+    with span("crisis_check"):
+        return urgency_from_matches(rule_matcher.scan(text))
 
 def detect_cbt_patterns(text):
-    """Detect cognitive distortions using CBT patterns. (No changes here)"""
+    """Detect cognitive distortions using CBT patterns."""
     if not text:
         return []
-    text_lower = text.lower()
-    detected_patterns = []
-    for pattern_name, regex in CBT_PATTERNS.items():
-        if re.search(regex, text_lower):
-            detected_patterns.append(pattern_name)
-    return detected_patterns
+    return list(rule_matcher.scan(text).get('cbt', []))
 
 def generate_cbt_intervention(detected_patterns, emotions):
     """Generate targeted CBT intervention. (No changes here)"""
@@ -81,73 +87,278 @@ def generate_cbt_intervention(detected_patterns, emotions):
     return random.choice(GENERAL_CBT_TECHNIQUES)
 
 
+def select_repetitive_phrases(counts, reply_count):
+    """
+    Starters used in more than one reply and in over 30% of replies.
+
+    Args:
+        counts: per-starter reply counts, in ANTI_REPETITION_STARTERS order.
+        reply_count: number of assistant replies the counts cover.
+    """
+    return [
+        phrase for phrase, count in zip(ANTI_REPETITION_STARTERS, counts)
+        if count > 1 and count > reply_count * 0.3
+    ]
+
 def analyze_conversation_patterns(history):
-    """Analyze conversation history for repetitive patterns. (No changes here)"""
+    """Analyze conversation history for repetitive patterns."""
     if not history:
         return []
     assistant_responses = [msg['content'] for msg in history if msg['role'] == 'assistant']
-    repetitive_phrases = []
-    for phrase in ANTI_REPETITION_STARTERS:
-        count = sum(1 for response in assistant_responses if phrase.lower() in response.lower())
-        if count > 1 and count > len(assistant_responses) * 0.3:
-            repetitive_phrases.append(phrase)
-    return repetitive_phrases
+    counts = dict.fromkeys(ANTI_REPETITION_STARTERS, 0)
+    for response in assistant_responses:
+        for phrase in starter_matcher.find(response):
+            counts[phrase] += 1
+    return select_repetitive_phrases(counts.values(), len(assistant_responses))
 
-def combined_sentiment_analysis(text, history=None):
+def start_inference(text, api_urls):
+    """Schedules one classifier call per URL so they run concurrently."""
+    return {api_url: asyncio.create_task(query_classifier(api_url, text)) for api_url in api_urls}
+
+async def collect_inference(tasks, deadline=ANALYSIS_DEADLINE_SECONDS):
     """
-    Combines all analysis steps into one function, using API calls for ML tasks.
+    Waits for the scheduled calls until the shared deadline expires.
+
+    Calls that have not answered by then are cancelled and reported as None.
+    Callers pass the responses through fill_missing, so the local scorer
+    answers for sentiment and emotion; anything left None is mapped to the
+    usual neutral defaults by the parsers below.
     """
-    try:
-        # Get sentiment from API
-        sentiment_response = query_huggingface_api(SENTIMENT_API_URL, text)
-        if sentiment_response:
-            sentiment_result = max(sentiment_response[0], key=lambda x: x['score'])
-            sentiment_label = sentiment_result['label'].lower()
-            sentiment_score = sentiment_result['score']
-        else:
-            sentiment_label, sentiment_score = 'unknown', 0.0
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        late = [url for url, task in tasks.items() if task in pending]
+        logger.warning(f"Analysis deadline of {deadline}s expired; continuing without {late}")
 
-        # Get emotions from API
-        emotion_response = query_huggingface_api(EMOTION_API_URL, text)
-        if emotion_response:
-            # Filter emotions with a score > 0.1 and sort them
-            emotions = sorted([res for res in emotion_response[0] if res['score'] > 0.1], key=lambda x: x['score'], reverse=True)
+    responses = {}
+    for api_url, task in tasks.items():
+        if task in done and not task.cancelled() and task.exception() is None:
+            responses[api_url] = task.result()
         else:
-            emotions = []
+            if task in done and not task.cancelled():
+                logger.error(f"Inference call to {api_url} raised: {task.exception()}")
+            responses[api_url] = None
+    return responses
 
-        # The following functions are regex/logic-based and do not need API calls
-        detected_patterns = detect_cbt_patterns(text)
-        cbt_intervention = generate_cbt_intervention(detected_patterns, emotions)
-        urgency_level = enhanced_crisis_detection(text)
-        
-        # Override sentiment if urgency is detected
-        if urgency_level:
-            sentiment_label = 'crisis' if urgency_level == 'crisis' else 'concern'
+def parse_sentiment_response(api_response):
+    """Returns (label, score) for the highest scoring sentiment label."""
+    if api_response:
+        sentiment_result = max(api_response[0], key=lambda x: x['score'])
+        return sentiment_result['label'].lower(), sentiment_result['score']
+    return 'unknown', 0.0
 
+def parse_emotion_response(api_response):
+    """Returns emotions with a score > 0.1, sorted from strongest to weakest."""
+    if api_response:
+        return sorted([res for res in api_response[0] if res['score'] > 0.1], key=lambda x: x['score'], reverse=True)
+    return []
+
+def local_analysis(text, history=None, repetitive_patterns=None):
+    """
+    Runs the regex/logic-based stages, which do not need API calls.
+
+    `repetitive_patterns`, when given (e.g. from a session's running
+    counters), is used instead of rescanning `history`.
+    """
+    matches = rule_matcher.scan(text) if text else {}
+    if repetitive_patterns is None:
         repetitive_patterns = analyze_conversation_patterns(history) if history else []
+    return {
+        'patterns': list(matches.get('cbt', [])),
+        'urgency_level': urgency_from_matches(matches),
+        'repetitive_patterns': repetitive_patterns,
+    }
 
-        result = {
-            'sentiment': sentiment_label,
-            'sentiment_score': sentiment_score,
-            'emotions': emotions,
-            'cbt_analysis': {
-                'patterns': detected_patterns,
-                'intervention': cbt_intervention,
-                'repetitive_patterns': repetitive_patterns
-            },
-            'urgency_level': urgency_level,
+def local_analysis_batch(texts):
+    """local_analysis for many stand-alone texts, scanned in one matcher pass."""
+    return [
+        {
+            'patterns': list(matches.get('cbt', [])),
+            'urgency_level': urgency_from_matches(matches),
+            'repetitive_patterns': [],
         }
-        logger.info(f"API-based analysis complete: {result}")
+        for matches in rule_matcher.scan_many(texts)
+    ]
+
+def build_analysis(responses, local):
+    """Merges model responses and local analysis into the analysis dict."""
+    sentiment_label, sentiment_score = parse_sentiment_response(responses.get(SENTIMENT_API_URL))
+    emotions = parse_emotion_response(responses.get(EMOTION_API_URL))
+    detected_patterns = local['patterns']
+    cbt_intervention = generate_cbt_intervention(detected_patterns, emotions)
+    urgency_level = local['urgency_level']
+
+    # Override sentiment if urgency is detected
+    if urgency_level:
+        sentiment_label = 'crisis' if urgency_level == 'crisis' else 'concern'
+
+    return {
+        'sentiment': sentiment_label,
+        'sentiment_score': sentiment_score,
+        'emotions': emotions,
+        'cbt_analysis': {
+            'patterns': detected_patterns,
+            'intervention': cbt_intervention,
+            'repetitive_patterns': local['repetitive_patterns']
+        },
+        'urgency_level': urgency_level,
+    }
+
+def default_analysis():
+    """Neutral analysis used when the pipeline fails outright."""
+    return {
+        'sentiment': 'unknown', 'sentiment_score': 0.0, 'emotions': [],
+        'cbt_analysis': {'patterns': [], 'intervention': None, 'repetitive_patterns': []},
+        'urgency_level': None
+    }
+
+def local_only_analysis(local):
+    """default_analysis() carrying the regex stages' findings, for when the model responses cannot be parsed."""
+    result = default_analysis()
+    urgency_level = local['urgency_level']
+    if urgency_level:
+        result['sentiment'] = 'crisis' if urgency_level == 'crisis' else 'concern'
+    result['cbt_analysis']['patterns'] = local['patterns']
+    result['cbt_analysis']['repetitive_patterns'] = local['repetitive_patterns']
+    result['urgency_level'] = urgency_level
+    return result
+
+async def analyze_message(text, history=None, deadline=ANALYSIS_DEADLINE_SECONDS, repetitive_patterns=None):
+    """
+    Runs moderation, sentiment and emotion inference in parallel under one
+    deadline, with the regex stages running while the calls are in flight.
+
+    Returns:
+        tuple: (moderation result dict, analysis dict)
+    """
+    try:
+        tasks = start_inference(text, [MODERATION_API_URL, SENTIMENT_API_URL, EMOTION_API_URL])
+        await asyncio.sleep(0)  # let the requests go out before the CPU-bound stages
+        with span("regex"):
+            local = local_analysis(text, history, repetitive_patterns)
+        responses = fill_missing(await collect_inference(tasks, deadline), text)
+
+        moderation_result = parse_moderation_response(responses[MODERATION_API_URL])
+        result = build_analysis(responses, local)
+        logger.debug(f"API-based analysis complete: {result}")
+        return moderation_result, result
+    except Exception as e:
+        logger.error(f"Error in analyze_message: {e}")
+        return {'is_harmful': False, 'score': 0.0}, default_analysis()
+
+def completed_responses(tasks):
+    """Results of the calls that have already finished; None for the rest."""
+    return {
+        api_url: task.result() if task.done() and not task.cancelled() and task.exception() is None else None
+        for api_url, task in tasks.items()
+    }
+
+async def analyze_crisis_message(text, history=None, wait=CRISIS_ANALYSIS_WAIT_SECONDS, repetitive_patterns=None):
+    """
+    Fast path for messages the regex stage has already flagged as a crisis.
+
+    Waits at most `wait` seconds for the ML calls, so the crisis reply never
+    depends on upstream latency. The remaining calls keep running under the
+    usual analysis deadline. A response that cannot be parsed falls back to
+    the regex-only analysis rather than failing the crisis reply.
+
+    Returns:
+        tuple: (analysis dict available now, task resolving to the full analysis)
+    """
+    tasks = start_inference(text, [MODERATION_API_URL, SENTIMENT_API_URL, EMOTION_API_URL])
+    with span("regex"):
+        local = local_analysis(text, history, repetitive_patterns)
+    if wait > 0:
+        await asyncio.wait(tasks.values(), timeout=wait)
+    try:
+        partial = build_analysis(fill_missing(completed_responses(tasks), text), local)
+    except Exception as e:
+        logger.error(f"Error in analyze_crisis_message: {e}")
+        partial = local_only_analysis(local)
+
+    async def finish():
+        responses = await collect_inference(tasks, max(ANALYSIS_DEADLINE_SECONDS - wait, 0.0))
+        try:
+            return build_analysis(fill_missing(responses, text), local)
+        except Exception as e:
+            logger.error(f"Error in background crisis analysis: {e}")
+            return local_only_analysis(local)
+
+    return partial, asyncio.create_task(finish())
+
+async def combined_sentiment_analysis(text, history=None):
+    """
+    Combines all analysis steps into one function, using API calls for ML tasks.
+    """
+    try:
+        tasks = start_inference(text, [SENTIMENT_API_URL, EMOTION_API_URL])
+        await asyncio.sleep(0)
+        local = local_analysis(text, history)
+        responses = fill_missing(await collect_inference(tasks), text)
+
+        result = build_analysis(responses, local)
+        logger.debug(f"API-based analysis complete: {result}")
         return result
         
     except Exception as e:
         logger.error(f"Error in combined_sentiment_analysis (API version): {e}")
         # Return a default structure on error
-        return {
-            'sentiment': 'unknown', 'sentiment_score': 0.0, 'emotions': [],
-            'cbt_analysis': {'patterns': [], 'intervention': None, 'repetitive_patterns': []},
-            'urgency_level': None
-        }
+        return default_analysis()
+
+async def combined_sentiment_analysis_batch(texts, batch_size=BATCH_SIZE, concurrency=BATCH_CONCURRENCY):
+    """
+    Batch version of combined_sentiment_analysis for backfills and re-scoring.
+
+    Texts are split into chunks of `batch_size`; each chunk costs one batched
+    request per model, and at most `concurrency` chunks are in flight at once.
+    Analyses are yielded as their chunk completes, which is not necessarily
+    input order.
+
+    Yields:
+        tuple: (index into `texts`, analysis dict)
+    """
+    batch_size = max(1, batch_size)
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def analyze_chunk(start):
+        # Never raises: every index in the chunk gets an analysis, falling back to the defaults
+        chunk = texts[start:start + batch_size]
+        async with slots:
+            answers = await asyncio.gather(
+                query_classifier_batch(SENTIMENT_API_URL, chunk),
+                query_classifier_batch(EMOTION_API_URL, chunk),
+                return_exceptions=True,
+            )
+        for answer in answers:
+            if isinstance(answer, BaseException):
+                logger.error(f"Batch classifier call failed: {answer!r}")
+        sentiment, emotion = ([None] * len(chunk) if isinstance(answer, BaseException) else answer for answer in answers)
+        try:
+            local_results = local_analysis_batch(chunk)
+        except Exception as e:
+            logger.error(f"Error in combined_sentiment_analysis_batch: {e}")
+            return [(start + offset, default_analysis()) for offset in range(len(chunk))]
+        results = []
+        for offset, local in enumerate(local_results):
+            try:
+                responses = {SENTIMENT_API_URL: sentiment[offset], EMOTION_API_URL: emotion[offset]}
+                results.append((start + offset, build_analysis(responses, local)))
+            except Exception as e:
+                logger.error(f"Error in combined_sentiment_analysis_batch: {e}")
+                results.append((start + offset, default_analysis()))
+        return results
+
+    pending = [asyncio.create_task(analyze_chunk(start)) for start in range(0, len(texts), batch_size)]
+    try:
+        for finished in asyncio.as_completed(pending):
+            for item in await finished:
+                yield item
+    finally:
+        for task in pending:
+            task.cancel()
 
 def generate_anti_repetition_instruction(repetitive_patterns):
     """Generate instruction to avoid repetitive patterns. (No changes here)"""
@@ -0,0 +1,140 @@
+# prompting.py
+import re
+import logging
+from groq import APIError
+from sessions import ROLE_NAMES, USER
+from config import SUMMARY_MAX_TOKENS, SUMMARY_MODEL_ID
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+# Role header and end-of-turn markers the chat template adds to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep a short running summary of a supportive conversation between a user and Athena, "
+    "a CBT-based AI therapist. Merge the new messages into the current summary. Keep what matters "
+    "for later turns: the user's situation, feelings, recurring thoughts, goals, and the techniques "
+    "already suggested and how they landed. Write in the third person ('The user ...'), plain prose, "
+    "at most {words} words. Reply with the updated summary only."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count for Llama 3 models, without a tokenizer.
+
+    Counts one token per word or punctuation mark, plus one for every further
+    six characters of a long word. This tracks the real count closely for
+    English prose and errs on the high side for rare words.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_PIECES.findall(text))
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cuts `text` at a word boundary so it is estimated at no more than `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    if keep_end:
+        words.reverse()
+    kept, used = [], 0
+    for word in words:
+        used += estimate_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    if keep_end:
+        kept.reverse()
+    return " ".join(kept)
+
+
+def build_prompt(system_prompt: str, session, user_input: str, budget: int):
+    """
+    Assembles the generation prompt within `budget` estimated tokens.
+
+    The system prompt (with the session summary appended) and the new message
+    are always sent. The remaining budget is filled with the most recent
+    unsummarized turns. When turns had to be left out, the returned
+    `fold_before` tells the caller to fold every message numbered below it
+    into the summary. It is chosen so the verbatim history drops to half the
+    remaining budget, so the summary is refreshed every few turns rather than
+    on every one.
+
+    Returns:
+        tuple: (messages, estimated prompt tokens, fold_before or None)
+    """
+    if session.summary:
+        system_prompt = f"{system_prompt}\nEARLIER IN THIS CONVERSATION (summary):\n{session.summary}\n"
+    used = message_tokens(system_prompt) + message_tokens(user_input)
+    available = max(budget - used, 0)
+
+    candidates = [message for message in session.numbered() if message[0] >= session.summary_seq]
+    costs = [message_tokens(content) for _, _, content in candidates]
+    kept = 0
+    spent = 0
+    for cost in reversed(costs):
+        if spent + cost > available:
+            break
+        spent += cost
+        kept += 1
+    recent = candidates[len(candidates) - kept:]
+
+    fold_before = None
+    if session.overflow or kept < len(candidates):
+        # Keep the newest turns that fit in half the budget left; fold the rest
+        fold_before, retained = session.seq, 0
+        for (seq, _, _), cost in zip(reversed(recent), reversed(costs)):
+            if retained + cost > available // 2:
+                break
+            retained += cost
+            fold_before = seq
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend({"role": ROLE_NAMES[role], "content": content} for _, role, content in recent)
+    messages.append({"role": "user", "content": user_input})
+    return messages, used + spent, fold_before
+
+
+def extractive_summary(summary: str, turns, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """
+    Summary built without a model: the first sentence of each user message is
+    appended, and the oldest text is dropped once the summary is over budget.
+    """
+    notes = []
+    for _, role, content in turns:
+        if role == USER and content.strip():
+            first_sentence = re.split(r"(?<=[.!?])\s", content.strip(), maxsplit=1)[0]
+            notes.append(truncate_to_tokens(first_sentence, 40))
+    if not notes:
+        return summary
+    addition = "The user said: " + " / ".join(notes)
+    combined = f"{summary} {addition}" if summary else addition
+    return truncate_to_tokens(combined, max_tokens, keep_end=True)
+
+async def summarize_turns(client, summary: str, turns, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """
+    Folds `turns` ((seq, role, content) tuples) into `summary` with the
+    summary model, falling back to `extractive_summary` if the call fails.
+    """
+    if not turns:
+        return summary
+    if client is not None:
+        transcript = "\n".join(f"{ROLE_NAMES[role].capitalize()}: {content}" for _, role, content in turns)
+        try:
+            completion = await client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=int(max_tokens * 0.7))},
+                    {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"},
+                ],
+                model=SUMMARY_MODEL_ID,
+                temperature=0.2, max_tokens=max_tokens,
+            )
+            text = (completion.choices[0].message.content or "").strip()
+            if text:
+                return truncate_to_tokens(text, max_tokens)
+        except APIError as e:
+            logger.error(f"Summary generation failed, using extractive summary: {e}")
+    return extractive_summary(summary, turns, max_tokens)
@@ -0,0 +1,582 @@
+# sessions.py
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from matcher import starter_matcher
+from emotions import EmotionTimeline
+from processing import select_repetitive_phrases
+from config import (
+    REPETITION_WINDOW, SESSION_MAX_MESSAGES, SESSION_IDLE_TTL_SECONDS, SESSION_MAX_SESSIONS, SESSION_BACKEND,
+    SESSION_SQLITE_PATH, SESSION_SQLITE_BATCH_SIZE, SESSION_REDIS_URL,
+    SESSION_REDIS_MAX_CONNECTIONS
+)
+
+logger = logging.getLogger(__name__)
+
+USER, ASSISTANT = 0, 1
+ROLE_CODES = {'user': USER, 'assistant': ASSISTANT}
+ROLE_NAMES = ('user', 'assistant')
+
+
+class SessionState:
+    """
+    Conversation state for one session.
+
+    Messages are kept as compact (role_code, content) tuples in a ring buffer
+    that only holds the turns generation and repetition analysis look at.
+
+    Anti-repetition starters are counted as replies are appended. Each
+    assistant reply is scanned once and its starters are stored as a bitmask.
+    When the reply leaves the ring buffer, or the REPETITION_WINDOW if one is
+    set, its bits are subtracted again, so `repetitive_patterns()` never has
+    to rescan the history.
+
+    Older turns are folded into a rolling `summary`. Messages are numbered in
+    arrival order (`seq` is the next number); the summary covers every message
+    numbered below `summary_seq`. Messages that leave the ring buffer before
+    they are summarized wait in `overflow` as (seq, role, content).
+
+    `cursor()` names the current history version for callers that only send
+    new messages. The `epoch` is random per session, so a session that was
+    lost and recreated never reissues an old cursor.
+
+    `emotions` is the session's EmotionTimeline, started by the first
+    analyzed turn.
+
+    `version` counts the saves to a shared backend; a save only succeeds if
+    the stored state is still the version this one was loaded from.
+    """
+    __slots__ = ('messages', 'reply_masks', 'starter_counts', 'window', 'last_seen',
+                 'seq', 'summary', 'summary_seq', 'overflow', 'epoch', 'emotions', 'version')
+
+    def __init__(self, max_messages=SESSION_MAX_MESSAGES, window=REPETITION_WINDOW, epoch=None):
+        self.messages = deque(maxlen=max_messages)
+        self.window = window if window > 0 else None
+        self.reply_masks = deque(maxlen=self.window)
+        self.starter_counts = [0] * len(starter_matcher.phrases)
+        self.last_seen = time.monotonic()
+        self.seq = 0
+        self.summary = ""
+        self.summary_seq = 0
+        self.overflow = deque(maxlen=max_messages)
+        self.epoch = epoch or uuid.uuid4().hex[:12]
+        self.emotions = None
+        self.version = 0
+
+    def _append(self, role, content):
+        messages = self.messages
+        if len(messages) == messages.maxlen:
+            oldest_seq = self.seq - len(messages)
+            if oldest_seq >= self.summary_seq:
+                self.overflow.append((oldest_seq,) + messages[0])
+            if messages[0][0] == ASSISTANT and self.window is None:
+                # The oldest reply leaves the buffer, and with it the counts
+                self._uncount(self.reply_masks.popleft())
+        messages.append((role, content))
+        self.seq += 1
+        if role == ASSISTANT:
+            if self.window is not None and len(self.reply_masks) == self.window:
+                self._uncount(self.reply_masks[0])
+            mask = starter_matcher.mask(content)
+            self.reply_masks.append(mask)
+            self._count(mask)
+
+    def _count(self, mask):
+        index = 0
+        while mask:
+            if mask & 1:
+                self.starter_counts[index] += 1
+            mask >>= 1
+            index += 1
+
+    def _uncount(self, mask):
+        index = 0
+        while mask:
+            if mask & 1:
+                self.starter_counts[index] -= 1
+            mask >>= 1
+            index += 1
+
+    def repetitive_patterns(self):
+        """Same result as analyze_conversation_patterns over the tracked replies, in O(1)."""
+        return select_repetitive_phrases(self.starter_counts, len(self.reply_masks))
+
+    def history(self):
+        """Stored messages as role/content dicts, oldest first."""
+        return [{'role': ROLE_NAMES[role], 'content': content} for role, content in self.messages]
+
+    def recent(self, count):
+        """The last `count` messages as role/content dicts."""
+        if count <= 0:
+            return []
+        tail = list(self.messages)[-count:]
+        return [{'role': ROLE_NAMES[role], 'content': content} for role, content in tail]
+
+    def merge_history(self, items):
+        """
+        Appends only the part of a client-supplied history that is not stored yet.
+
+        The caller resends its recent history on every turn, so the incoming
+        list normally overlaps the tail of the ring buffer. The longest
+        prefix of `items` that ends with the stored tail is skipped. When the
+        two cannot be aligned, messages already present in the buffer are
+        dropped instead.
+
+        Args:
+            items: iterable of (role, content) pairs, oldest first.
+
+        Returns:
+            int: number of messages appended.
+        """
+        incoming = [(ROLE_CODES.get(role, ASSISTANT), content) for role, content in items]
+        if not incoming:
+            return 0
+        stored = list(self.messages)
+
+        new_messages = None
+        if stored:
+            for end in range(len(incoming), 0, -1):
+                overlap = min(end, len(stored))
+                if incoming[end - overlap:end] == stored[-overlap:]:
+                    new_messages = incoming[end:]
+                    break
+            if new_messages is None:
+                present = set(stored)
+                new_messages = [message for message in incoming if message not in present]
+        else:
+            new_messages = incoming
+
+        for role, content in new_messages:
+            self._append(role, content)
+        return len(new_messages)
+
+    def extend(self, items):
+        """Appends (role, content) pairs as they are, for history sent after a matching cursor."""
+        count = 0
+        for role, content in items:
+            self._append(ROLE_CODES.get(role, ASSISTANT), content)
+            count += 1
+        return count
+
+    def append_turn(self, user_text, assistant_text):
+        self._append(USER, user_text)
+        self._append(ASSISTANT, assistant_text)
+
+    def record_emotions(self, emotions, at=None):
+        """Adds an analyzed turn's emotions to the timeline; returns whether any were recorded."""
+        if self.emotions is None:
+            # Started even without usable emotions, so `first_seq` marks where analysis began
+            self.emotions = EmotionTimeline(first_seq=self.seq)
+        return self.emotions.record(emotions, at)
+
+    def cursor(self) -> str:
+        """History version: the session epoch and the number of messages appended so far."""
+        return f"{self.epoch}.{self.seq}"
+
+    def numbered(self):
+        """Buffered messages as (seq, role, content), oldest first."""
+        first = self.seq - len(self.messages)
+        return [(first + offset, role, content) for offset, (role, content) in enumerate(self.messages)]
+
+    def unsummarized(self, before=None):
+        """(seq, role, content) of messages the summary does not cover yet, up to `before`."""
+        before = self.seq if before is None else before
+        pending = [message for message in self.overflow if message[0] < before]
+        pending += [message for message in self.numbered() if self.summary_seq <= message[0] < before]
+        return pending
+
+    def fold(self, summary, upto_seq):
+        """Installs a summary that now covers every message numbered below `upto_seq`."""
+        self.summary = summary
+        self.summary_seq = max(self.summary_seq, upto_seq)
+        while self.overflow and self.overflow[0][0] < self.summary_seq:
+            self.overflow.popleft()
+
+    def dumps(self) -> str:
+        """Compact JSON encoding used by the shared backends."""
+        data = {'e': self.epoch, 'v': self.version, 'm': list(self.messages)}
+        if self.seq != len(self.messages) or self.summary:
+            data.update(q=self.seq, s=self.summary, k=self.summary_seq, o=list(self.overflow))
+        if self.window is not None:
+            # The window can reach back past the ring buffer, so its replies are kept as masks
+            data['r'] = list(self.reply_masks)
+        if self.emotions is not None:
+            data['t'] = self.emotions.to_list()
+        return json.dumps(data, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, encoded, max_messages=SESSION_MAX_MESSAGES):
+        """
+        Rebuilds a state; repetition counters are recomputed from the stored
+        reply masks, or from the stored replies when no window is set.
+        """
+        data = json.loads(encoded)
+        state = cls(max_messages, epoch=data.get('e'))
+        state.version = data.get('v', 0)
+        for role, content in data['m']:
+            state._append(role, content)
+        if 'q' in data:
+            state.seq = data['q']
+            state.summary = data['s']
+            state.summary_seq = data['k']
+            state.overflow.extend(tuple(message) for message in data['o'])
+        if 'r' in data and state.window is not None:
+            state.reply_masks = deque(data['r'], maxlen=state.window)
+            state.starter_counts = [0] * len(starter_matcher.phrases)
+            for mask in state.reply_masks:
+                state._count(mask)
+        if 't' in data:
+            state.emotions = EmotionTimeline.from_list(data['t'])
+        return state
+
+
+class SessionConflict(Exception):
+    """A save refused because another worker saved the same session after it was loaded."""
+
+    def __init__(self, session_id):
+        super().__init__(f"Session {session_id} was changed by another request")
+        self.session_id = session_id
+
+
+class SessionStore(ABC):
+    """
+    Interface shared by the session backends.
+
+    `handle_chat` loads a session, mutates the returned SessionState, and
+    saves it back once the request is done. Backends only differ in where
+    the state lives between requests. The shared backends save with a
+    compare-and-set on `SessionState.version`, since the per-session locks
+    only serialize requests within one worker.
+    """
+
+    def __init__(self, max_messages=SESSION_MAX_MESSAGES):
+        self.max_messages = max_messages
+
+    @abstractmethod
+    async def load(self, session_id):
+        """Returns the stored SessionState, or None if it is missing or expired."""
+
+    @abstractmethod
+    async def save(self, session_id, state):
+        """
+        Persists the state after a request has updated it. Raises
+        SessionConflict if another worker saved the session since it was loaded.
+        """
+
+    async def load_or_create(self, session_id):
+        state = await self.load(session_id)
+        return state if state is not None else SessionState(self.max_messages)
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    def stats(self) -> dict:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    In-process session store with idle-TTL and max-sessions eviction.
+
+    Sessions are kept in least-recently-used order, so both kinds of eviction
+    only ever look at the front of the ordering. Only suitable for a single
+    worker.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL_SECONDS,
+                 max_messages=SESSION_MAX_MESSAGES):
+        super().__init__(max_messages)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """Returns the session if it exists and has not expired, else None."""
+        state = self._sessions.get(session_id)
+        if state is None:
+            return None
+        now = time.monotonic()
+        if now - state.last_seen > self.idle_ttl:
+            del self._sessions[session_id]
+            self.evicted_idle += 1
+            return None
+        state.last_seen = now
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def get_or_create(self, session_id):
+        state = self.get(session_id)
+        if state is None:
+            state = SessionState(self.max_messages)
+            self.put(session_id, state)
+        return state
+
+    def put(self, session_id, state):
+        state.last_seen = time.monotonic()
+        self._sessions[session_id] = state
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    async def load(self, session_id):
+        return self.get(session_id)
+
+    async def save(self, session_id, state):
+        self.put(session_id, state)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.last_seen > self.idle_ttl:
+                self.evicted_idle += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.evicted_capacity += 1
+            else:
+                break
+            del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a local SQLite file, shared by every worker on the host.
+
+    The database runs in WAL mode so readers never block the writer. Saves are
+    group-committed: a save waits for the next transaction, which writes
+    every save queued meanwhile (at most `batch_size`), so concurrent turns
+    share one commit. Each row is an upsert that only applies if the stored
+    version is the one the state was loaded from, or the stored row has
+    expired. Idle and over-capacity sessions are pruned on each commit.
+    Reads and writes both run in worker threads, reads on a connection per
+    thread, so neither a query nor a busy database ever blocks the event loop.
+    """
+
+    def __init__(self, path=SESSION_SQLITE_PATH, max_sessions=SESSION_MAX_SESSIONS,
+                 idle_ttl=SESSION_IDLE_TTL_SECONDS, max_messages=SESSION_MAX_MESSAGES,
+                 batch_size=SESSION_SQLITE_BATCH_SIZE):
+        super().__init__(max_messages)
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        # Guards the write connection; readers never take it
+        self._db_lock = threading.Lock()
+        self._readers = threading.local()
+        self._reader_conns = []
+        self._pending = []  # (session_id, encoded, expected version, future)
+        self._writer = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.conflicts = 0
+
+    async def load(self, session_id):
+        row = await asyncio.to_thread(self._read, session_id)
+        return SessionState.loads(row[0], self.max_messages) if row is not None else None
+
+    def _read(self, session_id):
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._readers.conn = conn
+            self._reader_conns.append(conn)
+        return conn.execute(
+            "SELECT data FROM sessions WHERE id = ? AND updated_at > ?",
+            (session_id, time.time() - self.idle_ttl),
+        ).fetchone()
+
+    async def save(self, session_id, state):
+        expected = state.version
+        state.version += 1
+        written = asyncio.get_running_loop().create_future()
+        self._pending.append((session_id, state.dumps(), expected, written))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        try:
+            saved = await written
+        except BaseException:
+            state.version = expected
+            raise
+        if not saved:
+            state.version = expected
+            self.conflicts += 1
+            raise SessionConflict(session_id)
+
+    async def _write_pending(self):
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            try:
+                saved = await asyncio.to_thread(self._write_batch, [entry[:3] for entry in batch])
+            except Exception as e:
+                saved = [e] * len(batch)
+            for (*_, written), outcome in zip(batch, saved):
+                if written.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    written.set_exception(outcome)
+                else:
+                    written.set_result(outcome)
+
+    async def flush(self):
+        """Waits until every queued save is written."""
+        if self._writer is not None:
+            await self._writer
+
+    def _write_batch(self, batch):
+        """Writes (session_id, encoded, expected version) rows; returns which ones were applied."""
+        now = time.time()
+        saved = []
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                for session_id, encoded, expected in batch:
+                    cursor = self._conn.execute(
+                        "INSERT INTO sessions (id, data, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at "
+                        "WHERE coalesce(json_extract(sessions.data, '$.v'), 0) = ? OR sessions.updated_at <= ?",
+                        (session_id, encoded, now, expected, now - self.idle_ttl),
+                    )
+                    saved.append(cursor.rowcount == 1)
+                self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (now - self.idle_ttl,))
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE id IN "
+                    "(SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.rows_written += sum(saved)
+        return saved
+
+    async def close(self):
+        await self.flush()
+        self._conn.close()
+        for conn in self._reader_conns:
+            conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "pending_writes": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "conflicts": self.conflicts,
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+        }
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store on a Redis-protocol server, shared across hosts.
+
+    Each session is one string key holding the JSON state, written with an
+    expiry equal to the idle TTL so Redis performs idle eviction itself.
+    Capacity limits are left to the server's maxmemory policy. Saves are
+    optimistic transactions: WATCH the key, check the stored version, then
+    SET in MULTI/EXEC, which fails if another worker wrote in between.
+    """
+
+    KEY_PREFIX = "athena:session:"
+
+    def __init__(self, url=SESSION_REDIS_URL, idle_ttl=SESSION_IDLE_TTL_SECONDS,
+                 max_messages=SESSION_MAX_MESSAGES, max_connections=SESSION_REDIS_MAX_CONNECTIONS):
+        super().__init__(max_messages)
+        try:
+            import redis.asyncio as redis_asyncio
+            from redis.exceptions import WatchError
+        except ImportError as e:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package") from e
+        self.idle_ttl = idle_ttl
+        # A blocking pool makes bursts wait for a connection instead of failing;
+        # RESP2 keeps the store usable with any Redis-protocol server
+        pool = redis_asyncio.BlockingConnectionPool.from_url(url, max_connections=max_connections, protocol=2)
+        self._redis = redis_asyncio.Redis.from_pool(pool)
+        self._watch_error = WatchError
+        self.loads = 0
+        self.saves = 0
+        self.conflicts = 0
+
+    async def load(self, session_id):
+        self.loads += 1
+        encoded = await self._redis.get(self.KEY_PREFIX + session_id)
+        return SessionState.loads(encoded, self.max_messages) if encoded is not None else None
+
+    async def save(self, session_id, state):
+        self.saves += 1
+        key = self.KEY_PREFIX + session_id
+        expected = state.version
+        state.version += 1
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                stored = await pipe.get(key)
+                # A key that has expired meanwhile is simply written again
+                saved = stored is None or json.loads(stored).get('v', 0) == expected
+                if saved:
+                    pipe.multi()
+                    pipe.set(key, state.dumps(), ex=max(int(self.idle_ttl), 1))
+                    await pipe.execute()
+        except self._watch_error:
+            saved = False
+        except BaseException:
+            state.version = expected
+            raise
+        if not saved:
+            state.version = expected
+            self.conflicts += 1
+            raise SessionConflict(session_id)
+
+    async def close(self):
+        await self._redis.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "loads": self.loads,
+            "saves": self.saves,
+            "conflicts": self.conflicts,
+            "max_messages": self.max_messages,
+        }
+
+
+def create_session_store(backend=SESSION_BACKEND) -> SessionStore:
+    """Builds the session store selected by SESSION_BACKEND."""
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend != "memory":
+        logger.warning(f"Unknown SESSION_BACKEND '{backend}', using in-memory sessions")
+    return InMemorySessionStore()
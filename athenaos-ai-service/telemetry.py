@@ -0,0 +1,114 @@
+# telemetry.py
+import time
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Seconds; fine enough for sub-millisecond regex stages, wide enough for upstream timeouts
+BUCKETS = (.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+stage_seconds = Histogram(
+    "athena_stage_seconds", "Time spent in one stage of handling a request", ["stage"], buckets=BUCKETS
+)
+request_seconds = Histogram(
+    "athena_request_seconds", "Time to handle a request, per endpoint", ["endpoint"], buckets=BUCKETS
+)
+requests_in_flight = Gauge("athena_requests_in_flight", "Requests being handled, per endpoint", ["endpoint"])
+upstream_in_flight = Gauge("athena_upstream_in_flight", "Calls waiting on an upstream API", ["upstream"])
+prompt_tokens = Histogram(
+    "athena_prompt_tokens", "Prompt tokens sent for generation",
+    buckets=(128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+history_syncs = Counter(
+    "athena_history_syncs_total", "How each chat request's history was applied", ["mode"]
+)
+local_classifier_answers = Counter(
+    "athena_local_classifier_answers_total", "Sentiment/emotion results from the local scorer", ["model", "reason"]
+)
+upstream_errors = Counter(
+    "athena_upstream_errors_total", "Upstream calls that failed or were skipped", ["upstream", "reason"]
+)
+admission_active = Gauge("athena_admission_active", "Chats holding an admission slot")
+admission_queue_depth = Gauge("athena_admission_queue_depth", "Routine chats waiting for an admission slot")
+admission_wait_seconds = Histogram(
+    "athena_admission_wait_seconds", "Time admitted chats waited for a slot", ["priority"], buckets=BUCKETS
+)
+admission_shed = Counter(
+    "athena_admission_shed_total", "Chats rejected by admission control", ["reason"]
+)
+admission_over_limit = Counter(
+    "athena_admission_over_limit_total", "Crisis chats admitted while every slot was taken"
+)
+
+# Per-request stage totals (seconds) for the Server-Timing header. Tasks started
+# while handling a request inherit it, so their spans are counted too.
+_timings = ContextVar("athena_timings", default=None)
+_stage_children = {}
+
+
+class Span:
+    """Times a block into athena_stage_seconds and the current request's timings."""
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        child = _stage_children.get(self.stage)
+        if child is None:
+            child = _stage_children[self.stage] = stage_seconds.labels(self.stage)
+        child.observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+
+
+def span(stage: str) -> Span:
+    return Span(stage)
+
+
+class RequestTimer:
+    """
+    Times one request per endpoint, counts it as in flight, and collects the
+    spans run on its behalf for `server_timing`.
+    """
+    __slots__ = ("endpoint", "timings", "started", "_token")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.timings = {}
+        self._token = _timings.set(self.timings)
+        requests_in_flight.labels(self.endpoint).inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        request_seconds.labels(self.endpoint).observe(time.perf_counter() - self.started)
+        requests_in_flight.labels(self.endpoint).dec()
+        _timings.reset(self._token)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: each stage plus the total so far, in milliseconds."""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+def track_request(endpoint: str) -> RequestTimer:
+    return RequestTimer(endpoint)
+
+
+def detach_request():
+    """Stops spans in the current task from counting toward the request that started it."""
+    _timings.set(None)
+
+
+def render_metrics():
+    """Body and content type for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,6 +1,6 @@
 // src/controllers/chatController.js
 const { Conversation, Message } = require('../models');
-const { getAthenaAiResponse } = require('../services/aiService');
+const { getAthenaAiResponse, getEmotionTimeline } = require('../services/aiService');
 
 exports.getChatHistory = async (req, res) => {
   try {
@@ -35,14 +35,20 @@ exports.sendMessage = async (req, res) => {
         defaults: { userId: userId }
     });
     
-    const existingMessages = await Message.findAll({
+    // The latest messages, oldest first, and how many the conversation has in all
+    const { count: totalMessages, rows: latestMessages } = await Message.findAndCountAll({
       where: { conversationId: conversation.id },
-      order: [['createdAt', 'ASC']],
-      limit: 20,
+      order: [['createdAt', 'DESC']],
+      limit: 30,
     });
+    const existingMessages = latestMessages.reverse();
     
     console.log("INFO: Calling AI service getAthenaAiResponse...");
-    const aiResult = await getAthenaAiResponse(text, existingMessages);
+    const aiResult = await getAthenaAiResponse(text, existingMessages, {
+      conversationId: conversation.id,
+      totalMessages,
+      userId,
+    });
     
     await Message.create({
       sender: 'user',
@@ -84,6 +90,16 @@ exports.getEmotionHistory = async (req, res) => {
   try {
     const { conversationId } = req.params;
 
+    // The AI service keeps bucketed aggregates as the conversation goes,
+    // so a view does not have to load every message
+    const timeline = await getEmotionTimeline(conversationId);
+    if (timeline) {
+      return res.json(timeline.series.map(point => ({
+        timestamp: new Date(point.start * 1000).toISOString(),
+        emotions: point.emotions,
+      })));
+    }
+
     const messages = await Message.findAll({
       where: {
         conversationId: conversationId,
@@ -1,7 +1,41 @@
 // src/services/aiService.js
 const axios = require('axios');
 
-exports.getAthenaAiResponse = async (userInput, dbMessages) => {
+const MAX_MSGS = 30;
+
+// Per conversation: the AI service's history cursor and how many stored
+// messages it already covers. Losing an entry only costs one full-history request.
+const MAX_TRACKED_CONVERSATIONS = 10000;
+const historyCursors = new Map();
+
+const toHistory = (dbMessages) => dbMessages.map(msg => ({
+  role: msg && msg.sender === 'user' ? 'user' : 'assistant',
+  content: String(msg?.text ?? '')
+}));
+
+const rememberCursor = (sessionId, cursor, synced) => {
+  historyCursors.delete(sessionId);
+  historyCursors.set(sessionId, { cursor, synced });
+  if (historyCursors.size > MAX_TRACKED_CONVERSATIONS) {
+    historyCursors.delete(historyCursors.keys().next().value);
+  }
+};
+
+/**
+ * Asks the AI service for a reply.
+ *
+ * dbMessages are the latest stored messages of the conversation, oldest first,
+ * and totalMessages how many it has in all. Once the service has returned a
+ * history cursor for the conversation, only the messages stored since then are
+ * sent; a 409 means the service lost or moved past that state (or another worker
+ * changed the session meanwhile), and the request is repeated once with the full
+ * recent history.
+ *
+ * userId is sent as the tenant, so the service can cap how many replies one
+ * user has in progress. An overloaded service answers 503 or 429 at once and
+ * the usual fallback reply is returned.
+ */
+exports.getAthenaAiResponse = async (userInput, dbMessages, { conversationId, totalMessages, userId } = {}) => {
   const aiApiUrl = process.env.PYTHON_AI_API_URL;
   if (!aiApiUrl) {
     throw new Error("PYTHON_AI_API_URL is not configured in .env");
@@ -11,32 +45,66 @@ exports.getAthenaAiResponse = async (userInput, dbMessages) => {
     throw new Error("userInput must be a non-empty string");
   }
 
-  const MAX_MSGS = 30;
-  const history = (Array.isArray(dbMessages) ? dbMessages.slice(-MAX_MSGS) : []).map(msg => ({
-    role: msg && msg.sender === 'user' ? 'user' : 'assistant',
-    content: String(msg?.text ?? '')
-  }));
+  const messages = Array.isArray(dbMessages) ? dbMessages.slice(-MAX_MSGS) : [];
+  const sessionId = conversationId != null ? `conversation-${conversationId}` : undefined;
+  const total = Number.isInteger(totalMessages) ? totalMessages : messages.length;
 
-  const payload = {
+  const fullPayload = {
     user_input: userInput,
-    history
+    history: toHistory(messages),
+    session_id: sessionId
   };
+  let payload = fullPayload;
+  const tracked = sessionId && historyCursors.get(sessionId);
+  const unsynced = tracked ? total - tracked.synced : -1;
+  if (tracked && unsynced >= 0 && unsynced <= messages.length) {
+    payload = {
+      user_input: userInput,
+      history: toHistory(messages.slice(messages.length - unsynced)),
+      session_id: sessionId,
+      history_cursor: tracked.cursor
+    };
+  }
 
   try {
     console.log("Sending request to Python AI service");
-    const fullUrl = `${aiApiUrl}/chat`; 
-    const response = await axios.post(fullUrl, payload, {
-      timeout: 60000,
-      headers: { 'Content-Type': 'application/json' }
-    });
+    const fullUrl = `${aiApiUrl}/chat`;
+    const headers = { 'Content-Type': 'application/json' };
+    if (userId != null) {
+      headers['X-Tenant-ID'] = `user-${userId}`;
+    }
+    const post = (body) => axios.post(fullUrl, body, { timeout: 60000, headers });
+    let response;
+    try {
+      response = await post(payload);
+    } catch (error) {
+      if (error?.response?.status !== 409) {
+        throw error;
+      }
+      console.log("Python AI service asked for a history resync.");
+      if (sessionId) {
+        historyCursors.delete(sessionId);
+      }
+      response = await post(fullPayload);
+    }
 
     console.log("Received response from Python AI service.");
+    const serverTiming = response.headers['server-timing'];
+    if (serverTiming) {
+      console.log("Python AI service timing:", serverTiming);
+    }
+    // The caller stores this message and the reply, so the service then covers two more
+    if (sessionId && response.data?.history_cursor) {
+      rememberCursor(sessionId, response.data.history_cursor, total + 2);
+    }
     return response.data;
   } catch (error) {
     const status = error?.response?.status;
     const snippet = String(error?.response?.data ?? error?.message ?? 'Unknown error').slice(0, 500);
+    const retryAfter = error?.response?.headers?.['retry-after'];
     console.error("Error calling Python AI service:",
       status ? `HTTP ${status}` : '',
+      retryAfter ? `(retry after ${retryAfter}s)` : '',
       snippet);
 
     return {
@@ -45,4 +113,30 @@ exports.getAthenaAiResponse = async (userInput, dbMessages) => {
       emotion_analysis: {}
     };
   }
-};
\ No newline at end of file
+};
+
+/**
+ * Fetches a conversation's emotion timeline from the AI service: running
+ * aggregates plus at most `points` time-bucketed points, instead of every
+ * message. Returns null when the service has no complete timeline for it
+ * (never seen, expired, or only tracked since a restart), so the caller can
+ * fall back to the stored messages.
+ */
+exports.getEmotionTimeline = async (conversationId, { points = 32 } = {}) => {
+  const aiApiUrl = process.env.PYTHON_AI_API_URL;
+  if (!aiApiUrl || conversationId == null) {
+    return null;
+  }
+  try {
+    const response = await axios.get(
+      `${aiApiUrl}/sessions/${encodeURIComponent(`conversation-${conversationId}`)}/emotions`,
+      { params: { points }, timeout: 5000 }
+    );
+    return response.data?.complete ? response.data : null;
+  } catch (error) {
+    if (error?.response?.status !== 404) {
+      console.error("Error fetching emotion timeline from Python AI service:", error?.message);
+    }
+    return null;
+  }
+};